@@ -0,0 +1,298 @@
+"""
+Archivos de byte-code compilado (.avlc) y caché de compilación
+"""
+
+import hashlib
+import os
+import struct
+import sys
+from array import array
+
+from bytecod import ProgramaCompacto, VERSION_COMPILADOR
+
+
+MAGICO = b"AVLC"
+VERSION_FORMATO = 3
+
+# Encabezado: mágico, versión del formato, versión del compilador, hash de la fuente
+_ENCABEZADO = struct.Struct("<4sHH32s")
+_ENTERO = struct.Struct("<I")
+_FLOTANTE = struct.Struct("<d")
+
+# Etiquetas de tipo para los valores de la tabla de constantes y de símbolos
+_NULO = b"n"
+_BOOLEANO = b"b"
+_ENTERO_VALOR = b"i"
+_FLOTANTE_VALOR = b"f"
+_CADENA = b"s"
+
+
+class ErrorFormatoAvlc(Exception):
+    pass
+
+
+def calcular_hash(codigo_fuente, opciones=""):
+    """Hash de la fuente, la versión del compilador y las opciones de
+    compilación que identifica un .avlc"""
+    datos = f"{VERSION_COMPILADOR}\0{opciones}\0{codigo_fuente}".encode("utf-8")
+    return hashlib.sha256(datos).digest()
+
+
+class EscritorAvlc:
+
+    def __init__(self):
+        self.partes = []
+
+    def entero(self, valor):
+        self.partes.append(_ENTERO.pack(valor))
+
+    def cadena(self, valor):
+        datos = valor.encode("utf-8")
+        self.entero(len(datos))
+        self.partes.append(datos)
+
+    def arreglo(self, valores):
+        if sys.byteorder != "little":
+            valores = array(valores.typecode, valores)
+            valores.byteswap()
+        self.entero(len(valores))
+        self.partes.append(valores.tobytes())
+
+    def valor(self, valor):
+        # bool se revisa antes que int porque es una subclase
+        if valor is None:
+            self.partes.append(_NULO)
+        elif isinstance(valor, bool):
+            self.partes.append(_BOOLEANO + (b"\x01" if valor else b"\x00"))
+        elif isinstance(valor, int):
+            self.partes.append(_ENTERO_VALOR)
+            self.cadena(str(valor))
+        elif isinstance(valor, float):
+            self.partes.append(_FLOTANTE_VALOR + _FLOTANTE.pack(valor))
+        elif isinstance(valor, str):
+            self.partes.append(_CADENA)
+            self.cadena(valor)
+        else:
+            raise ErrorFormatoAvlc(f"Constante no serializable: {valor!r}")
+
+    def obtener_bytes(self):
+        return b"".join(self.partes)
+
+
+class LectorAvlc:
+
+    def __init__(self, datos, posicion=0):
+        self.datos = memoryview(datos)
+        self.posicion = posicion
+
+    def _tomar(self, cantidad):
+        inicio = self.posicion
+        self.posicion += cantidad
+        if self.posicion > len(self.datos):
+            raise ErrorFormatoAvlc("Archivo .avlc truncado")
+        return self.datos[inicio:self.posicion]
+
+    def entero(self):
+        return _ENTERO.unpack(self._tomar(_ENTERO.size))[0]
+
+    def cadena(self):
+        try:
+            return str(self._tomar(self.entero()), "utf-8")
+        except UnicodeDecodeError:
+            raise ErrorFormatoAvlc("Cadena inválida en el .avlc")
+
+    def arreglo(self, tipo):
+        valores = array(tipo)
+        cantidad = self.entero()
+        valores.frombytes(self._tomar(cantidad * valores.itemsize))
+        if sys.byteorder != "little":
+            valores.byteswap()
+        return valores
+
+    def valor(self):
+        etiqueta = bytes(self._tomar(1))
+        if etiqueta == _NULO:
+            return None
+        elif etiqueta == _BOOLEANO:
+            return self._tomar(1)[0] == 1
+        elif etiqueta == _ENTERO_VALOR:
+            try:
+                return int(self.cadena())
+            except ValueError:
+                raise ErrorFormatoAvlc("Entero inválido en el .avlc")
+        elif etiqueta == _FLOTANTE_VALOR:
+            return _FLOTANTE.unpack(self._tomar(_FLOTANTE.size))[0]
+        elif etiqueta == _CADENA:
+            return self.cadena()
+        else:
+            raise ErrorFormatoAvlc(f"Tipo de constante desconocido: {etiqueta!r}")
+
+
+def serializar_programa(programa, hash_fuente=bytes(32)):
+    """Convierte un ProgramaCompacto al formato binario .avlc"""
+    escritor = EscritorAvlc()
+    escritor.partes.append(_ENCABEZADO.pack(MAGICO, VERSION_FORMATO, VERSION_COMPILADOR, hash_fuente))
+
+    escritor.arreglo(programa.operaciones)
+    escritor.arreglo(programa.operandos)
+
+    escritor.entero(len(programa.constantes))
+    for constante in programa.constantes:
+        escritor.valor(constante)
+
+    escritor.entero(len(programa.variables))
+    for nombre in programa.variables:
+        escritor.cadena(nombre)
+
+    escritor.entero(len(programa.etiquetas))
+    for etiqueta, posicion in programa.etiquetas.items():
+        escritor.cadena(etiqueta)
+        escritor.entero(posicion)
+
+    escritor.entero(len(programa.simbolos))
+    for simbolo in programa.simbolos:
+        escritor.entero(len(simbolo))
+        for llave, valor in simbolo.items():
+            escritor.cadena(llave)
+            escritor.valor(valor)
+
+    escritor.entero(len(programa.funciones))
+    for funcion in programa.funciones:
+        escritor.cadena(funcion['nombre'])
+        escritor.cadena(funcion['etiqueta'])
+        escritor.entero(funcion['parametros'])
+        escritor.entero(len(funcion['locales']))
+        for nombre in funcion['locales']:
+            escritor.cadena(nombre)
+
+    escritor.arreglo(programa.inicios_lineas)
+    escritor.arreglo(programa.lineas)
+
+    return escritor.obtener_bytes()
+
+
+def deserializar_programa(datos, hash_esperado=None):
+    """Reconstruye un ProgramaCompacto a partir del contenido de un .avlc"""
+    if len(datos) < _ENCABEZADO.size:
+        raise ErrorFormatoAvlc("Archivo .avlc truncado")
+
+    magico, version_formato, version_compilador, hash_fuente = _ENCABEZADO.unpack_from(datos)
+    if magico != MAGICO:
+        raise ErrorFormatoAvlc("No es un archivo .avlc")
+    if version_formato != VERSION_FORMATO or version_compilador != VERSION_COMPILADOR:
+        raise ErrorFormatoAvlc("Versión de .avlc incompatible")
+    if hash_esperado is not None and hash_fuente != hash_esperado:
+        raise ErrorFormatoAvlc("El .avlc no corresponde a la fuente")
+
+    lector = LectorAvlc(datos, _ENCABEZADO.size)
+    programa = ProgramaCompacto()
+    programa.operaciones = lector.arreglo('B')
+    programa.operandos = lector.arreglo('i')
+
+    programa.constantes = [lector.valor() for _ in range(lector.entero())]
+
+    programa.variables = [lector.cadena() for _ in range(lector.entero())]
+
+    for _ in range(lector.entero()):
+        etiqueta = lector.cadena()
+        programa.etiquetas[etiqueta] = lector.entero()
+
+    for _ in range(lector.entero()):
+        simbolo = {}
+        for _ in range(lector.entero()):
+            llave = lector.cadena()
+            simbolo[llave] = lector.valor()
+        programa.simbolos.append(simbolo)
+
+    for _ in range(lector.entero()):
+        funcion = {
+            'nombre': lector.cadena(),
+            'etiqueta': lector.cadena(),
+            'parametros': lector.entero(),
+        }
+        funcion['locales'] = [lector.cadena() for _ in range(lector.entero())]
+        programa.funciones.append(funcion)
+
+    programa.inicios_lineas = lector.arreglo('i')
+    programa.lineas = lector.arreglo('i')
+    if len(programa.inicios_lineas) != len(programa.lineas):
+        raise ErrorFormatoAvlc("Tabla de líneas inválida")
+
+    return programa
+
+
+def guardar_programa(programa, ruta, hash_fuente=bytes(32)):
+    """Escribe el programa en un .avlc de forma atómica"""
+    # Se serializa antes de abrir el temporal para no dejar archivos a medias
+    datos = serializar_programa(programa, hash_fuente)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        with open(temporal, "wb") as archivo:
+            archivo.write(datos)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def cargar_programa(ruta, hash_esperado=None):
+    """Lee un .avlc completo con una sola lectura"""
+    with open(ruta, "rb") as archivo:
+        datos = archivo.read()
+    return deserializar_programa(datos, hash_esperado)
+
+
+class CacheBytecode:
+    """Caché de programas compilados indexada por el hash de la fuente
+    y la versión del compilador"""
+
+    def __init__(self, directorio=None):
+        self.directorio = directorio or os.path.join(os.path.expanduser("~"), ".cache", "avellana")
+        self.aciertos = 0
+        self.fallos = 0
+
+    def _ruta(self, hash_fuente):
+        return os.path.join(self.directorio, f"{hash_fuente.hex()}.avlc")
+
+    def obtener(self, codigo_fuente, opciones=""):
+        """Retorna el programa en caché para esta fuente, o None si no existe"""
+        hash_fuente = calcular_hash(codigo_fuente, opciones)
+        try:
+            programa = cargar_programa(self._ruta(hash_fuente), hash_fuente)
+        except FileNotFoundError:
+            self.fallos += 1
+            return None
+        except (OSError, ErrorFormatoAvlc):
+            # Una entrada dañada se descarta para que se vuelva a compilar
+            self.descartar(codigo_fuente, opciones)
+            self.fallos += 1
+            return None
+
+        self.aciertos += 1
+        return programa
+
+    def descartar(self, codigo_fuente, opciones=""):
+        """Elimina la entrada de esta fuente, si existe"""
+        try:
+            os.remove(self._ruta(calcular_hash(codigo_fuente, opciones)))
+        except OSError:
+            pass
+
+    def guardar(self, codigo_fuente, programa, opciones=""):
+        """Guarda el programa compilado; la caché es opcional y un error
+        de escritura no debe impedir la ejecución"""
+        hash_fuente = calcular_hash(codigo_fuente, opciones)
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            guardar_programa(programa, self._ruta(hash_fuente), hash_fuente)
+        except (OSError, ErrorFormatoAvlc):
+            return False
+        return True
+
+    def limpiar(self):
+        """Elimina todos los .avlc de la caché"""
+        if not os.path.isdir(self.directorio):
+            return
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(".avlc"):
+                os.remove(os.path.join(self.directorio, nombre))
@@ -2,6 +2,9 @@
 Generador de Bytecode
 """
 
+from array import array
+from bisect import bisect_right
+
 from lexico import Tipos
 
 
@@ -44,6 +47,60 @@ class Instrucciones:
     OR = 29
     NOT = 30
     
+    # Superinstrucciones que genera el optimizador
+    INC = 31
+    EQ_JMPZ = 32
+    NEQ_JMPZ = 33
+    GT_JMPZ = 34
+    LT_JMPZ = 35
+    GTE_JMPZ = 36
+    LTE_JMPZ = 37
+    
+    NEW_ARR = 38
+    
+    # Acceso a las variables locales del marco de la función en ejecución
+    LOAD_LOCAL = 39
+    STORE_LOCAL = 40
+    READ_LOCAL = 41
+    
+    # Comparación seguida de JMPZ -> instrucción que las fusiona
+    COMPARAR_Y_SALTAR = {
+        EQ: EQ_JMPZ,
+        NEQ: NEQ_JMPZ,
+        GT: GT_JMPZ,
+        LT: LT_JMPZ,
+        GTE: GTE_JMPZ,
+        LTE: LTE_JMPZ,
+    }
+    
+    # Instrucciones cuyo operando es un destino de salto
+    SALTOS = frozenset((JMP, JMPZ, JMPNZ, CALL)) | frozenset(COMPARAR_Y_SALTAR.values())
+    
+    # Instrucciones cuyo operando es la ranura de una variable
+    CON_VARIABLE = frozenset((STORE, LOAD, READ))
+    
+    # Instrucciones cuyo operando es el índice de una variable local
+    CON_LOCAL = frozenset((STORE_LOCAL, LOAD_LOCAL, READ_LOCAL))
+    
+    # Instrucción global -> equivalente sobre una variable local
+    A_LOCAL = {
+        STORE: STORE_LOCAL,
+        LOAD: LOAD_LOCAL,
+        READ: READ_LOCAL,
+    }
+    
+    # Instrucciones cuyo operando se guarda en la tabla de constantes
+    CON_CONSTANTE = frozenset((PUSH, STORE_ARR, LOAD_ARR, ARR_SIZE, NEW_ARR))
+    
+    # Instrucciones cuyo operando es el par (ranura, constante). Se empaqueta
+    # en un solo entero: la ranura en los bits bajos y el índice de la
+    # constante en los altos
+    CON_RANURA_Y_CONSTANTE = frozenset((INC,))
+    BITS_RANURA = 16
+    MASCARA_RANURA = (1 << BITS_RANURA) - 1
+    
+    CON_OPERANDO = SALTOS | CON_VARIABLE | CON_LOCAL | CON_CONSTANTE | CON_RANURA_Y_CONSTANTE
+    
     @classmethod
     def obtener_nombre(cls, codigo_instruccion):
         nombres = {
@@ -78,9 +135,152 @@ class Instrucciones:
             cls.AND: "AND",
             cls.OR: "OR",
             cls.NOT: "NOT",
+            cls.INC: "INC",
+            cls.EQ_JMPZ: "EQ_JMPZ",
+            cls.NEQ_JMPZ: "NEQ_JMPZ",
+            cls.GT_JMPZ: "GT_JMPZ",
+            cls.LT_JMPZ: "LT_JMPZ",
+            cls.GTE_JMPZ: "GTE_JMPZ",
+            cls.LTE_JMPZ: "LTE_JMPZ",
+            cls.NEW_ARR: "NEW_ARR",
+            cls.LOAD_LOCAL: "LOAD_LOCAL",
+            cls.STORE_LOCAL: "STORE_LOCAL",
+            cls.READ_LOCAL: "READ_LOCAL",
         }
         return nombres.get(codigo_instruccion, f"UNKNOWN_{codigo_instruccion}")
 
+class ProgramaCompacto:
+    """Byte-code empaquetado: códigos de operación y operandos en arreglos
+    paralelos de enteros, con literales y nombres en una tabla de constantes
+    sin duplicados. La máquina virtual ejecuta directamente desde esta forma"""
+    
+    def __init__(self):
+        self.operaciones = array('B')
+        self.operandos = array('i')
+        self.constantes = []
+        self.variables = []
+        self.etiquetas = {}
+        self.simbolos = []
+        # Una entrada por función: nombre, etiqueta de entrada, cantidad de
+        # parámetros y nombres de sus variables locales (parámetros primero)
+        self.funciones = []
+        # Tabla de líneas por tramos: desde la posición inicios_lineas[i]
+        # hasta el siguiente inicio, las instrucciones vienen de lineas[i].
+        # La línea 0 marca código sin línea de origen
+        self.inicios_lineas = array('i')
+        self.lineas = array('i')
+        self._indice_constantes = {}
+    
+    @classmethod
+    def desde_instrucciones(cls, codigo, variables=None, etiquetas=None, simbolos=None, funciones=None,
+                            lineas=None):
+        """Empaqueta una lista de tuplas (instrucción, operando) ya enlazada"""
+        programa = cls()
+        for instruccion in codigo:
+            codigo_inst = instruccion[0]
+            operando = instruccion[1] if len(instruccion) > 1 else 0
+            
+            if codigo_inst in Instrucciones.CON_CONSTANTE:
+                operando = programa.agregar_constante(operando)
+            elif codigo_inst in Instrucciones.CON_RANURA_Y_CONSTANTE:
+                operando = programa.empaquetar_ranura_constante(*operando)
+            
+            programa.operaciones.append(codigo_inst)
+            programa.operandos.append(operando)
+        
+        if variables is None:
+            variables = programa._nombres_por_defecto()
+        programa.variables = list(variables)
+        programa.etiquetas = dict(etiquetas or {})
+        programa.simbolos = list(simbolos or [])
+        programa.funciones = list(funciones or [])
+        programa.establecer_lineas(lineas or ())
+        return programa
+    
+    def establecer_lineas(self, tramos):
+        """Arma la tabla de líneas a partir de pares (posición, línea) en
+        orden. Si varios tramos empiezan en la misma posición queda el
+        último, y los tramos consecutivos de una misma línea se unen"""
+        self.inicios_lineas = array('i')
+        self.lineas = array('i')
+        for posicion, linea in tramos:
+            if posicion >= len(self.operaciones):
+                continue
+            if self.inicios_lineas and self.inicios_lineas[-1] == posicion:
+                self.inicios_lineas.pop()
+                self.lineas.pop()
+            if self.lineas and self.lineas[-1] == linea:
+                continue
+            self.inicios_lineas.append(posicion)
+            self.lineas.append(linea)
+    
+    def tramos_lineas(self):
+        return list(zip(self.inicios_lineas, self.lineas))
+    
+    def linea(self, posicion):
+        """Línea del código fuente de la instrucción, o None si no se conoce"""
+        tramo = bisect_right(self.inicios_lineas, posicion) - 1
+        if tramo < 0:
+            return None
+        return self.lineas[tramo] or None
+    
+    def agregar_constante(self, valor):
+        """Retorna el índice de la constante, agregándola si no existe.
+        La llave incluye el tipo para no mezclar 1, 1.0 y True"""
+        llave = (type(valor), valor)
+        indice = self._indice_constantes.get(llave)
+        if indice is None:
+            indice = len(self.constantes)
+            self.constantes.append(valor)
+            self._indice_constantes[llave] = indice
+        return indice
+    
+    def empaquetar_ranura_constante(self, ranura, valor):
+        indice = self.agregar_constante(valor)
+        if ranura > Instrucciones.MASCARA_RANURA or indice >= 1 << (31 - Instrucciones.BITS_RANURA):
+            raise ValueError("Programa demasiado grande para empaquetar el operando")
+        return (indice << Instrucciones.BITS_RANURA) | ranura
+    
+    def desempaquetar_ranura_constante(self, operando):
+        return (operando & Instrucciones.MASCARA_RANURA,
+                self.constantes[operando >> Instrucciones.BITS_RANURA])
+    
+    def _nombres_por_defecto(self):
+        ranuras = [operando for codigo_inst, operando in zip(self.operaciones, self.operandos)
+                   if codigo_inst in Instrucciones.CON_VARIABLE]
+        ranuras += [operando & Instrucciones.MASCARA_RANURA
+                    for codigo_inst, operando in zip(self.operaciones, self.operandos)
+                    if codigo_inst in Instrucciones.CON_RANURA_Y_CONSTANTE]
+        return [f"v{ranura}" for ranura in range(max(ranuras) + 1 if ranuras else 0)]
+    
+    def instruccion(self, posicion):
+        """Reconstruye la tupla (instrucción, operando) de una posición"""
+        codigo_inst = self.operaciones[posicion]
+        if codigo_inst not in Instrucciones.CON_OPERANDO:
+            return (codigo_inst,)
+        
+        operando = self.operandos[posicion]
+        if codigo_inst in Instrucciones.CON_CONSTANTE:
+            operando = self.constantes[operando]
+        elif codigo_inst in Instrucciones.CON_RANURA_Y_CONSTANTE:
+            operando = self.desempaquetar_ranura_constante(operando)
+        return (codigo_inst, operando)
+    
+    def instrucciones(self):
+        return [self.instruccion(posicion) for posicion in range(len(self.operaciones))]
+    
+    def mostrar(self):
+        return formatear_bytecode(self.instrucciones(), self.etiquetas, self.variables, self.funciones)
+    
+    def tamanio_en_bytes(self):
+        """Bytes ocupados por los arreglos de instrucciones"""
+        return (self.operaciones.itemsize * len(self.operaciones) +
+                self.operandos.itemsize * len(self.operandos))
+    
+    def __len__(self):
+        return len(self.operaciones)
+
+
 class GeneradorBytecode:
     
     def __init__(self):
@@ -88,23 +288,41 @@ class GeneradorBytecode:
         self.etiquetas = {}
         self.contador_etiquetas = 0
         self.tabla_variables = {}
+        self.nombres_variables = []
+        self.tabla_simbolos = []
+        self.funciones = []
+        self.parametros_funciones = {}
+        self.locales_actuales = {}
         self.contador_temporales = 0
+        # Pares (posición en self.codigo, línea) y la tabla ya enlazada
+        self.marcas_lineas = []
+        self.linea_actual = 0
+        self.lineas = []
         self.instrucciones = Instrucciones
         
     
     def generar_bytecode(self, arbol_sintactico, tabla_simbolos):
         self.codigo = []
         self.tabla_simbolos = tabla_simbolos
+        self.funciones = []
+        self.parametros_funciones = {}
+        self.locales_actuales = {}
         self.contador_etiquetas = 0
         self.contador_temporales = 0
+        self.marcas_lineas = []
+        self.linea_actual = 0
+        self.lineas = []
         
         try:
+            self._asignar_ranuras(tabla_simbolos)
             self._generar_codigo(arbol_sintactico)
             self._agregar_instruccion_final()
+            self.codigo = self._enlazar(self.codigo)
             return self.codigo
             
         except Exception as e:
             self.codigo = []
+            self.lineas = []
             self._agregar_instruccion(self.instrucciones.PUSH, f"Error: {str(e)}")
             self._agregar_instruccion(self.instrucciones.PRINT)
             self._agregar_instruccion(self.instrucciones.HALT)
@@ -116,6 +334,12 @@ class GeneradorBytecode:
             
         tipo_nodo = nodo.get('tipo', 'desconocido')
         
+        # Las instrucciones anidadas marcan su propia línea; al terminar se
+        # vuelve a la del nodo que las contiene (saltos de cierre, RET)
+        linea_anterior = self.linea_actual
+        if 'linea' in nodo:
+            self._marcar_linea(nodo['linea'])
+        
         if tipo_nodo == 'programa':
             self._generar_codigo_programa(nodo)
         elif tipo_nodo == 'declaracion':
@@ -148,6 +372,13 @@ class GeneradorBytecode:
             self._generar_codigo_retornar(nodo)
         else:
             self._generar_codigo_error(f"Nodo desconocido: {tipo_nodo}")
+        
+        self._marcar_linea(linea_anterior)
+    
+    def _marcar_linea(self, linea):
+        if linea != self.linea_actual:
+            self.marcas_lineas.append((len(self.codigo), linea))
+            self.linea_actual = linea
     
     def _generar_codigo_programa(self, nodo):
         # Primero: generar todas las definiciones de funciones
@@ -157,6 +388,7 @@ class GeneradorBytecode:
         for instruccion in nodo.get('instrucciones', []):
             if instruccion.get('tipo') == 'definicion_funcion':
                 definiciones_funciones.append(instruccion)
+                self.parametros_funciones[instruccion.get('nombre')] = instruccion.get('parametros', [])
             else:
                 instrucciones_principales.append(instruccion)
         
@@ -175,6 +407,33 @@ class GeneradorBytecode:
         for instruccion in instrucciones_principales:
             self._generar_codigo(instruccion)
     
+    def _asignar_ranuras(self, tabla_simbolos):
+        """Asigna una ranura global a cada variable de la tabla de símbolos que
+        no sea local. Las variables declaradas en una función y sus parámetros
+        viven en el marco de cada llamada; las creadas implícitamente por leer
+        dentro de una función siguen siendo globales"""
+        self.tabla_variables = {}
+        self.nombres_variables = []
+        
+        for simbolo in tabla_simbolos or []:
+            if simbolo['tipo'] not in (Tipos.LEX_FUNCION, Tipos.LEX_ARREGLO) and not self._es_local(simbolo):
+                self._ranura_variable(simbolo['nombre'])
+    
+    def _es_local(self, simbolo):
+        return es_local(simbolo)
+    
+    def _locales_funcion(self, nombre_funcion, parametros):
+        return locales_funcion(self.tabla_simbolos, nombre_funcion, parametros)
+    
+    def _ranura_variable(self, nombre_variable):
+        """Retorna la ranura de la variable, asignando una nueva si no existe"""
+        ranura = self.tabla_variables.get(nombre_variable)
+        if ranura is None:
+            ranura = len(self.nombres_variables)
+            self.tabla_variables[nombre_variable] = ranura
+            self.nombres_variables.append(nombre_variable)
+        return ranura
+    
     def _generar_codigo_declaracion(self, nodo):
         nombre_variable = nodo.get('variable')
         tipo_dato = nodo.get('tipo_dato')
@@ -214,13 +473,12 @@ class GeneradorBytecode:
         tipo_elemento = nodo.get('tipo_elemento')
         tamanio = nodo.get('tamanio', 0)
         
-        # Inicializar arreglo con valores por defecto
+        # El arreglo se crea completo, con valores por defecto, en una sola instrucción
         valor_por_defecto = self._obtener_valor_por_defecto(tipo_elemento)
         
-        for indice in range(tamanio):
-            self._agregar_instruccion(self.instrucciones.PUSH, indice)
-            self._agregar_instruccion(self.instrucciones.PUSH, valor_por_defecto)
-            self._agregar_instruccion(self.instrucciones.STORE_ARR, nombre_arreglo)
+        self._agregar_instruccion(self.instrucciones.PUSH, tamanio)
+        self._agregar_instruccion(self.instrucciones.PUSH, valor_por_defecto)
+        self._agregar_instruccion(self.instrucciones.NEW_ARR, nombre_arreglo)
 
     def _generar_expresion_acceso_arreglo(self, expresion):
         nombre_arreglo = expresion.get('nombre')
@@ -242,14 +500,11 @@ class GeneradorBytecode:
         nombre_arreglo = nodo.get('arreglo')
         indice = nodo.get('indice')
         
-        # Generar código para el índice
-        self._generar_expresion(indice)
-        
         # Leer a una variable temporal
         variable_temporal = f"{nombre_arreglo}"
         self._agregar_instruccion(self.instrucciones.READ, variable_temporal)
         
-        # Cargar índice nuevamente y almacenar en el arreglo
+        # Apilar el índice y el valor leído y almacenar en el arreglo
         self._generar_expresion(indice)
         self._agregar_instruccion(self.instrucciones.LOAD, variable_temporal)
         self._agregar_instruccion(self.instrucciones.STORE_ARR, nombre_arreglo)
@@ -359,35 +614,47 @@ class GeneradorBytecode:
         etiqueta_funcion = f"func_{nombre_funcion}"
         self._agregar_etiqueta(etiqueta_funcion)
         
-        # Procesar parámetros
-        for param in parametros:
-            self._agregar_instruccion(self.instrucciones.STORE, param['nombre'])
+        # CALL deja los argumentos en las primeras variables locales del marco
+        locales = self._locales_funcion(nombre_funcion, parametros)
+        self.funciones.append({
+            'nombre': nombre_funcion,
+            'etiqueta': etiqueta_funcion,
+            'parametros': len(parametros),
+            'locales': locales,
+        })
+        self.locales_actuales = {nombre: indice for indice, nombre in enumerate(locales)}
         
         # Generar el cuerpo de la función
         for instruccion in cuerpo:
             self._generar_codigo(instruccion)
         
-        # VERIFICAR: Si la última instrucción no es RET, agregarlo
-        tiene_ret_explicito = any(
-            isinstance(inst, dict) and inst.get('tipo') == 'retornar'
-            for inst in cuerpo
-        )
-        
-        if not tiene_ret_explicito:
+        # Un retornar dentro de un bloque no evita llegar al final del cuerpo
+        if not cuerpo or not isinstance(cuerpo[-1], dict) or cuerpo[-1].get('tipo') != 'retornar':
             self._agregar_instruccion(self.instrucciones.RET)
+        
+        self.locales_actuales = {}
     
     def _generar_codigo_llamada_funcion(self, nodo):
+        # Toda llamada deja un valor en la pila; como instrucción se descarta
+        self._generar_llamada(nodo)
+        self._agregar_instruccion(self.instrucciones.POP)
+    
+    def _generar_llamada(self, nodo):
         nombre_funcion = nodo.get('nombre')
         argumentos = nodo.get('argumentos', [])
+        parametros = self.parametros_funciones.get(nombre_funcion, [])
         
-        for argumento in reversed(argumentos):
+        # Se apilan exactamente tantos valores como parámetros tiene la función:
+        # los argumentos de más se evalúan y descartan, los que faltan toman
+        # el valor por defecto de su tipo
+        for indice, argumento in enumerate(argumentos):
             self._generar_expresion(argumento)
+            if indice >= len(parametros):
+                self._agregar_instruccion(self.instrucciones.POP)
+        for param in parametros[len(argumentos):]:
+            self._agregar_instruccion(self.instrucciones.PUSH, self._obtener_valor_por_defecto(param['tipo']))
         
-        etiqueta_retorno = self._generar_etiqueta()
-        self._agregar_instruccion(self.instrucciones.PUSH, etiqueta_retorno)
         self._agregar_instruccion(self.instrucciones.CALL, f"func_{nombre_funcion}")
-        
-        self._agregar_etiqueta(etiqueta_retorno)
     
     def _generar_codigo_retornar(self, nodo):
         expresion = nodo.get('expresion')
@@ -489,10 +756,17 @@ class GeneradorBytecode:
         self._agregar_instruccion(self.instrucciones.LOAD_ARR, nombre_arreglo)
     
     def _generar_expresion_llamada_funcion(self, expresion):
-        self._generar_codigo_llamada_funcion(expresion)
+        self._generar_llamada(expresion)
     
     
     def _agregar_instruccion(self, instruccion, operando=None):
+        if instruccion in Instrucciones.CON_VARIABLE:
+            if operando in self.locales_actuales:
+                instruccion = Instrucciones.A_LOCAL[instruccion]
+                operando = self.locales_actuales[operando]
+            else:
+                operando = self._ranura_variable(operando)
+        
         if operando is not None:
             self.codigo.append((instruccion, operando))
         else:
@@ -500,7 +774,35 @@ class GeneradorBytecode:
     
     def _agregar_etiqueta(self, etiqueta):
         self.codigo.append((f"{etiqueta}:",))
-        self.etiquetas[etiqueta] = len(self.codigo) - 1
+    
+    def _es_etiqueta(self, instruccion):
+        return isinstance(instruccion[0], str) and instruccion[0].endswith(':')
+    
+    def _enlazar(self, codigo):
+        """Elimina las etiquetas y reemplaza los destinos de salto por posiciones absolutas"""
+        self.etiquetas = {}
+        enlazado = []
+        # Posición enlazada de cada posición de código, para la tabla de líneas
+        posiciones = []
+        
+        for instruccion in codigo:
+            posiciones.append(len(enlazado))
+            if self._es_etiqueta(instruccion):
+                self.etiquetas[instruccion[0][:-1]] = len(enlazado)
+            else:
+                enlazado.append(instruccion)
+        posiciones.append(len(enlazado))
+        
+        self.lineas = [(posiciones[posicion], linea) for posicion, linea in self.marcas_lineas]
+        
+        for posicion, instruccion in enumerate(enlazado):
+            if instruccion[0] in Instrucciones.SALTOS:
+                etiqueta = instruccion[1]
+                if etiqueta not in self.etiquetas:
+                    raise ValueError(f"Etiqueta no definida: {etiqueta}")
+                enlazado[posicion] = (instruccion[0], self.etiquetas[etiqueta])
+        
+        return enlazado
     
     def _generar_etiqueta(self):
         etiqueta = f"L{self.contador_etiquetas}"
@@ -517,67 +819,42 @@ class GeneradorBytecode:
             self._agregar_instruccion(self.instrucciones.HALT)
     
     def _obtener_valor_por_defecto(self, tipo_dato):
-        if tipo_dato in [Tipos.LEX_ENTERO, Tipos.ENTERO]:
-            return 0
-        elif tipo_dato in [Tipos.LEX_FLOTANTE, Tipos.FLOTANTE]:
-            return 0.0
-        elif tipo_dato in [Tipos.LEX_CADENA, Tipos.CADENA]:
-            return ""
-        elif tipo_dato in [Tipos.LEX_BOOLEANO, Tipos.BOOLEANO]:
-            return False
-        elif tipo_dato == Tipos.LEX_VERDADERO:
-            return True
-        elif tipo_dato == Tipos.LEX_FALSO:
-            return False
-        else:
-            return 0
+        return valor_por_defecto(tipo_dato)
     
     def _convertir_valor_literal(self, valor, tipo_dato):
-        if tipo_dato in [Tipos.ENTERO, Tipos.LEX_ENTERO, Tipos.LIN_NUM_ENTERO]:
-            return int(valor)
-        elif tipo_dato in [Tipos.FLOTANTE, Tipos.LEX_FLOTANTE, Tipos.LIN_NUM_FLOTANTE]:
-            return float(valor)
-        elif tipo_dato in [Tipos.CADENA, Tipos.LEX_CADENA, Tipos.LIN_CADENA]:
-            return str(valor).strip('"')
-        elif tipo_dato in [Tipos.BOOLEANO, Tipos.LEX_BOOLEANO]:
-            if isinstance(valor, str):
-                return valor.lower() == 'verdadero'
-            else:
-                return bool(valor)
-        else:
-            return valor
+        return convertir_valor_literal(valor, tipo_dato)
     
     
     def mostrar_bytecode(self):
-        lineas = []
-        
-        for instruccion in self.codigo:
-            if isinstance(instruccion[0], str) and instruccion[0].endswith(':'):
-                lineas.append(instruccion[0])
-            else:
-                codigo_inst = instruccion[0]
-                nombre_inst = Instrucciones.obtener_nombre(codigo_inst)
-                
-                if len(instruccion) > 1:
-                    operando = instruccion[1]
-                    if isinstance(operando, str) and not operando.startswith('L'):
-                        operando_formateado = f'"{operando}"'
-                    else:
-                        operando_formateado = str(operando)
-                    lineas.append(f"  {nombre_inst} {operando_formateado}")
-                else:
-                    lineas.append(f"  {nombre_inst}")
-        
-        return "\n".join(lineas)
+        return formatear_bytecode(self.codigo, self.etiquetas, self.nombres_variables, self.funciones)
     
     def obtener_codigo(self):
         return self.codigo
     
+    def obtener_variables(self):
+        """Retorna la tabla ranura -> nombre de las variables"""
+        return self.nombres_variables
+    
+    def obtener_programa(self):
+        """Retorna el byte-code generado en su forma compacta"""
+        return ProgramaCompacto.desde_instrucciones(
+            self.codigo, self.nombres_variables, self.etiquetas, self.tabla_simbolos, self.funciones,
+            self.lineas
+        )
+    
     def limpiar(self):
         self.codigo = []
         self.etiquetas = {}
+        self.tabla_variables = {}
+        self.nombres_variables = []
+        self.funciones = []
+        self.parametros_funciones = {}
+        self.locales_actuales = {}
         self.contador_etiquetas = 0
         self.contador_temporales = 0
+        self.marcas_lineas = []
+        self.linea_actual = 0
+        self.lineas = []
 
 
 class ByteCodeGenerator(GeneradorBytecode):
@@ -616,6 +893,17 @@ class ByteCodeGenerator(GeneradorBytecode):
             'AND': Instrucciones.AND,
             'OR': Instrucciones.OR,
             'NOT': Instrucciones.NOT,
+            'INC': Instrucciones.INC,
+            'EQ_JMPZ': Instrucciones.EQ_JMPZ,
+            'NEQ_JMPZ': Instrucciones.NEQ_JMPZ,
+            'GT_JMPZ': Instrucciones.GT_JMPZ,
+            'LT_JMPZ': Instrucciones.LT_JMPZ,
+            'GTE_JMPZ': Instrucciones.GTE_JMPZ,
+            'LTE_JMPZ': Instrucciones.LTE_JMPZ,
+            'NEW_ARR': Instrucciones.NEW_ARR,
+            'LOAD_LOCAL': Instrucciones.LOAD_LOCAL,
+            'STORE_LOCAL': Instrucciones.STORE_LOCAL,
+            'READ_LOCAL': Instrucciones.READ_LOCAL,
         }
     
     def generar_bytecode(self, arbol_sintactico, tabla_simbolos):
@@ -630,6 +918,118 @@ class ByteCodeGenerator(GeneradorBytecode):
 
 INSTRUCCIONES = Instrucciones
 
+# Debe incrementarse cada vez que cambie el byte-code que se genera para un
+# mismo programa fuente, para invalidar los archivos .avlc en caché
+VERSION_COMPILADOR = 5
+
+
+def formatear_bytecode(codigo, etiquetas, nombres_variables, funciones=()):
+    """Representación legible de una lista de instrucciones enlazada"""
+    lineas = []
+    
+    etiquetas_por_posicion = {}
+    for etiqueta, posicion in etiquetas.items():
+        etiquetas_por_posicion.setdefault(posicion, []).append(etiqueta)
+    
+    # Las funciones ocupan bloques contiguos desde su etiqueta de entrada
+    entradas_funciones = sorted(
+        (etiquetas[funcion['etiqueta']], funcion['locales'])
+        for funcion in funciones if funcion['etiqueta'] in etiquetas
+    )
+    
+    def nombre_local(posicion, indice):
+        locales = []
+        for entrada, locales_funcion in entradas_funciones:
+            if entrada > posicion:
+                break
+            locales = locales_funcion
+        return locales[indice] if indice < len(locales) else "?"
+    
+    for posicion, instruccion in enumerate(codigo):
+        for etiqueta in etiquetas_por_posicion.get(posicion, []):
+            lineas.append(f"{etiqueta}:")
+        
+        codigo_inst = instruccion[0]
+        nombre_inst = Instrucciones.obtener_nombre(codigo_inst)
+        
+        if len(instruccion) > 1:
+            operando = instruccion[1]
+            if codigo_inst in Instrucciones.SALTOS:
+                operando_formateado = etiquetas_por_posicion.get(operando, [str(operando)])[0]
+            elif codigo_inst in Instrucciones.CON_VARIABLE:
+                operando_formateado = f"{operando} ({nombres_variables[operando]})"
+            elif codigo_inst in Instrucciones.CON_LOCAL:
+                operando_formateado = f"{operando} ({nombre_local(posicion, operando)})"
+            elif codigo_inst in Instrucciones.CON_RANURA_Y_CONSTANTE:
+                ranura, valor = operando
+                operando_formateado = f"{ranura} ({nombres_variables[ranura]}), {valor}"
+            elif isinstance(operando, str) and not operando.startswith('L'):
+                operando_formateado = f'"{operando}"'
+            else:
+                operando_formateado = str(operando)
+            lineas.append(f"  {nombre_inst} {operando_formateado}")
+        else:
+            lineas.append(f"  {nombre_inst}")
+    
+    for etiqueta in etiquetas_por_posicion.get(len(codigo), []):
+        lineas.append(f"{etiqueta}:")
+    
+    return "\n".join(lineas)
+
 
 def obtener_nombre_instruccion(codigo_instruccion):
-    return Instrucciones.obtener_nombre(codigo_instruccion)
\ No newline at end of file
+    return Instrucciones.obtener_nombre(codigo_instruccion)
+
+
+# Reglas del lenguaje compartidas por el generador de byte-code y el
+# transpilador a Python
+
+def es_local(simbolo):
+    """Las variables declaradas en una función y sus parámetros son locales;
+    las creadas implícitamente por leer siguen siendo globales"""
+    return simbolo.get('ambito', 'global') != 'global' and not simbolo.get('implicito', False)
+
+
+def locales_funcion(tabla_simbolos, nombre_funcion, parametros):
+    """Nombres de las variables locales: primero los parámetros en orden,
+    luego las variables declaradas en el cuerpo"""
+    locales = [param['nombre'] for param in parametros]
+    for simbolo in tabla_simbolos or []:
+        if (simbolo.get('ambito') == nombre_funcion and es_local(simbolo)
+                and simbolo['tipo'] not in (Tipos.LEX_FUNCION, Tipos.LEX_ARREGLO)
+                and simbolo['nombre'] not in locales):
+            locales.append(simbolo['nombre'])
+    return locales
+
+
+def valor_por_defecto(tipo_dato):
+    if tipo_dato in [Tipos.LEX_ENTERO, Tipos.ENTERO]:
+        return 0
+    elif tipo_dato in [Tipos.LEX_FLOTANTE, Tipos.FLOTANTE]:
+        return 0.0
+    elif tipo_dato in [Tipos.LEX_CADENA, Tipos.CADENA]:
+        return ""
+    elif tipo_dato in [Tipos.LEX_BOOLEANO, Tipos.BOOLEANO]:
+        return False
+    elif tipo_dato == Tipos.LEX_VERDADERO:
+        return True
+    elif tipo_dato == Tipos.LEX_FALSO:
+        return False
+    else:
+        return 0
+
+
+def convertir_valor_literal(valor, tipo_dato):
+    if tipo_dato in [Tipos.ENTERO, Tipos.LEX_ENTERO, Tipos.LIN_NUM_ENTERO]:
+        return int(valor)
+    elif tipo_dato in [Tipos.FLOTANTE, Tipos.LEX_FLOTANTE, Tipos.LIN_NUM_FLOTANTE]:
+        return float(valor)
+    elif tipo_dato in [Tipos.CADENA, Tipos.LEX_CADENA, Tipos.LIN_CADENA]:
+        return str(valor).strip('"')
+    elif tipo_dato in [Tipos.BOOLEANO, Tipos.LEX_BOOLEANO]:
+        if isinstance(valor, str):
+            return valor.lower() == 'verdadero'
+        else:
+            return bool(valor)
+    else:
+        return valor
@@ -0,0 +1,309 @@
+"""
+Ejecución por cierres: cada instrucción se convierte en una función sin
+argumentos con su operando y su siguiente posición ya resueltos
+"""
+
+import operator
+
+from bytecod import Instrucciones
+
+
+I = Instrucciones
+
+
+def compilar_cierres(maquina):
+    """Retorna una lista con un cierre por instrucción del programa cargado.
+    Los cierres capturan la pila, la memoria y los arreglos de la máquina,
+    por lo que deben construirse después de reiniciar su estado"""
+    operaciones = maquina.programa.operaciones
+    cierres = []
+    for puntero, operando in enumerate(maquina.operandos):
+        fabrica = FABRICAS.get(operaciones[puntero])
+        if fabrica is not None:
+            cierres.append(fabrica(maquina, operando, puntero + 1))
+        else:
+            cierres.append(_cierre_generico(maquina, operando, puntero))
+    return cierres
+
+
+def _cierre_generico(maquina, operando, puntero):
+    # Instrucciones poco frecuentes o con lógica compartida: se delega en el
+    # manejador de la máquina virtual
+    manejador = maquina.despacho[puntero]
+
+    def generico():
+        return manejador(operando, puntero)
+    return generico
+
+
+def _push(maquina, operando, siguiente):
+    apilar = maquina.pila.append
+    valor = maquina.constantes[operando]
+
+    def push():
+        apilar(valor)
+        return siguiente
+    return push
+
+
+def _pop(maquina, operando, siguiente):
+    desapilar = maquina.pila.pop
+
+    def pop():
+        desapilar()
+        return siguiente
+    return pop
+
+
+def _add(maquina, operando, siguiente):
+    pila = maquina.pila
+    desapilar = pila.pop
+
+    def add():
+        b = desapilar()
+        a = pila[-1]
+        if isinstance(a, str) or isinstance(b, str):
+            pila[-1] = str(a) + str(b)
+        else:
+            pila[-1] = a + b
+        return siguiente
+    return add
+
+
+def _sub(maquina, operando, siguiente):
+    pila = maquina.pila
+    desapilar = pila.pop
+
+    def sub():
+        b = desapilar()
+        pila[-1] = pila[-1] - b
+        return siguiente
+    return sub
+
+
+def _mul(maquina, operando, siguiente):
+    pila = maquina.pila
+    desapilar = pila.pop
+
+    def mul():
+        b = desapilar()
+        pila[-1] = pila[-1] * b
+        return siguiente
+    return mul
+
+
+def _store(maquina, operando, siguiente):
+    memoria = maquina.memoria
+    desapilar = maquina.pila.pop
+
+    def store():
+        memoria[operando] = desapilar()
+        return siguiente
+    return store
+
+
+def _load(maquina, operando, siguiente):
+    memoria = maquina.memoria
+    apilar = maquina.pila.append
+
+    def load():
+        apilar(memoria[operando])
+        return siguiente
+    return load
+
+
+def _load_local(maquina, operando, siguiente):
+    # Las locales cambian con cada llamada, se buscan en la máquina
+    apilar = maquina.pila.append
+
+    def load_local():
+        apilar(maquina.locales[operando])
+        return siguiente
+    return load_local
+
+
+def _store_local(maquina, operando, siguiente):
+    desapilar = maquina.pila.pop
+
+    def store_local():
+        maquina.locales[operando] = desapilar()
+        return siguiente
+    return store_local
+
+
+def _print(maquina, operando, siguiente):
+    desapilar = maquina.pila.pop
+    escribir = maquina.salida.escribir
+
+    def imprimir():
+        texto = str(desapilar())
+        escribir(texto)
+        maquina.ultimo_mensaje_impreso = texto
+        return siguiente
+    return imprimir
+
+
+def _jmp(maquina, operando, siguiente):
+    def jmp():
+        return operando
+    return jmp
+
+
+def _jmpz(maquina, operando, siguiente):
+    desapilar = maquina.pila.pop
+
+    def jmpz():
+        return operando if desapilar() == 0 else siguiente
+    return jmpz
+
+
+def _jmpnz(maquina, operando, siguiente):
+    desapilar = maquina.pila.pop
+
+    def jmpnz():
+        return operando if desapilar() != 0 else siguiente
+    return jmpnz
+
+
+def _inc(maquina, operando, siguiente):
+    memoria = maquina.memoria
+    ranura = operando & I.MASCARA_RANURA
+    incremento = maquina.constantes[operando >> I.BITS_RANURA]
+
+    def inc():
+        valor = memoria[ranura]
+        if isinstance(valor, str):
+            memoria[ranura] = valor + str(incremento)
+        else:
+            memoria[ranura] = valor + incremento
+        return siguiente
+    return inc
+
+
+def _load_arr(maquina, operando, siguiente):
+    pila = maquina.pila
+    arreglos = maquina.arreglos
+    nombre = maquina.constantes[operando]
+
+    def load_arr():
+        indice = pila[-1]
+        # STORE_ARR puede reemplazar el arreglo, se busca en cada ejecución
+        arreglo = arreglos.get(nombre)
+        if arreglo is None or type(indice) is not int or not 0 <= indice < len(arreglo):
+            arreglo = maquina._obtener_arreglo(operando)
+            indice = maquina._validar_indice(operando, arreglo, indice)
+        pila[-1] = arreglo[indice]
+        return siguiente
+    return load_arr
+
+
+def _dup(maquina, operando, siguiente):
+    pila = maquina.pila
+    apilar = pila.append
+
+    def dup():
+        apilar(pila[-1])
+        return siguiente
+    return dup
+
+
+def _comparacion(comparar):
+    """Fábrica para las comparaciones que dejan 1 o 0 en la pila"""
+    def fabrica(maquina, operando, siguiente):
+        pila = maquina.pila
+        desapilar = pila.pop
+
+        def comparacion():
+            b = desapilar()
+            pila[-1] = 1 if comparar(pila[-1], b) else 0
+            return siguiente
+        return comparacion
+    return fabrica
+
+
+def _eq_jmpz(maquina, operando, siguiente):
+    desapilar = maquina.pila.pop
+
+    def eq_jmpz():
+        b = desapilar()
+        return siguiente if desapilar() == b else operando
+    return eq_jmpz
+
+
+def _neq_jmpz(maquina, operando, siguiente):
+    desapilar = maquina.pila.pop
+
+    def neq_jmpz():
+        b = desapilar()
+        return siguiente if desapilar() != b else operando
+    return neq_jmpz
+
+
+def _gt_jmpz(maquina, operando, siguiente):
+    desapilar = maquina.pila.pop
+
+    def gt_jmpz():
+        b = desapilar()
+        return siguiente if desapilar() > b else operando
+    return gt_jmpz
+
+
+def _lt_jmpz(maquina, operando, siguiente):
+    desapilar = maquina.pila.pop
+
+    def lt_jmpz():
+        b = desapilar()
+        return siguiente if desapilar() < b else operando
+    return lt_jmpz
+
+
+def _gte_jmpz(maquina, operando, siguiente):
+    desapilar = maquina.pila.pop
+
+    def gte_jmpz():
+        b = desapilar()
+        return siguiente if desapilar() >= b else operando
+    return gte_jmpz
+
+
+def _lte_jmpz(maquina, operando, siguiente):
+    desapilar = maquina.pila.pop
+
+    def lte_jmpz():
+        b = desapilar()
+        return siguiente if desapilar() <= b else operando
+    return lte_jmpz
+
+
+# Código de operación -> función que construye el cierre. Las instrucciones
+# que no aparecen usan el manejador de la máquina virtual
+FABRICAS = {
+    I.PUSH: _push,
+    I.POP: _pop,
+    I.ADD: _add,
+    I.SUB: _sub,
+    I.MUL: _mul,
+    I.STORE: _store,
+    I.LOAD: _load,
+    I.LOAD_LOCAL: _load_local,
+    I.STORE_LOCAL: _store_local,
+    I.PRINT: _print,
+    I.JMP: _jmp,
+    I.JMPZ: _jmpz,
+    I.JMPNZ: _jmpnz,
+    I.EQ: _comparacion(operator.eq),
+    I.NEQ: _comparacion(operator.ne),
+    I.GT: _comparacion(operator.gt),
+    I.LT: _comparacion(operator.lt),
+    I.GTE: _comparacion(operator.ge),
+    I.LTE: _comparacion(operator.le),
+    I.INC: _inc,
+    I.LOAD_ARR: _load_arr,
+    I.DUP: _dup,
+    I.EQ_JMPZ: _eq_jmpz,
+    I.NEQ_JMPZ: _neq_jmpz,
+    I.GT_JMPZ: _gt_jmpz,
+    I.LT_JMPZ: _lt_jmpz,
+    I.GTE_JMPZ: _gte_jmpz,
+    I.LTE_JMPZ: _lte_jmpz,
+}
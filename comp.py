@@ -9,52 +9,94 @@ import os
 from lexico import *
 from sintaxis import *
 from bytecod import ByteCodeGenerator
-from machin import MaquinaVirtual
+from machin import MaquinaVirtual, MODOS_EJECUCION, MODO_INTERPRETE
+from verificador import ErrorVerificacion
+from avlc import CacheBytecode
+from optimizador import OptimizadorMirilla
+from salidas import SalidaCircular, SalidaFlujo
 
 class FlujoCompilacion:
     """Clase para manejar el flujo completo de compilación"""
     
-    def __init__(self):
+    def __init__(self, cache=None, optimizador=None, modo=MODO_INTERPRETE):
         self.lexico = None
         self.sintaxis = None
         self.generador = None
         self.maquina = None
+        self.cache = cache if cache is not None else CacheBytecode()
+        self.optimizador = optimizador if optimizador is not None else OptimizadorMirilla()
+        # Modo de ejecución de la máquina virtual (ver MODOS_EJECUCION)
+        self.modo = modo
     
     def compilar_y_ejecutar(self, codigo_fuente):
         """Ejecuta todo el flujo de compilación"""
         try:
-            # 1. Análisis Léxico
-            self.lexico = Lexico(codigo_fuente)
-            error_lex, token = self.lexico.genera_lexico(False)
-            
-            if error_lex != ERR_NOERROR:
-                return False, f"Error léxico: {self.lexico.mensaje_error(error_lex)}"
-            
-            # 2. Análisis Sintáctico
-            self.sintaxis = Sintaxis(self.lexico)
-            error_sintax = self.sintaxis.genera_sintaxis()
-            
-            if error_sintax != ERR_NO_SINTAX_ERROR:
-                return False, f"Error sintáctico: {self.sintaxis.mensaje_error(error_sintax)}"
-            
-            # 3. Generación de Bytecode
-            self.generador = ByteCodeGenerator()
-            arbol = self.sintaxis.get_arbol_sintactico()
-            tabla_simbolos = self.sintaxis.get_tabla_simbolos()
-            
-            bytecode = self.generador.generar_bytecode(arbol, tabla_simbolos)
+            # Un programa sin cambios pasa directo a la máquina virtual
+            opciones = self.optimizador.firma()
+            programa = self.cache.obtener(codigo_fuente, opciones)
+            desde_cache = programa is not None
+            if not desde_cache:
+                programa, resultado = self._compilar_programa(codigo_fuente, opciones)
+                if resultado is not None:
+                    return False, resultado
             
             # 4. Ejecución
             if not self.maquina:
-                self.maquina = MaquinaVirtual()
-            
-            self.maquina.cargar_codigo(bytecode)
-            self.maquina.ejecutar()
+                # Sin interfaz la salida va directo a la consola
+                self.maquina = MaquinaVirtual(SalidaFlujo(prefijo="SALIDA: "), self.modo)
+            
+            try:
+                self.maquina.cargar_codigo(programa)
+            except ErrorVerificacion:
+                if not desde_cache:
+                    raise
+                # Un .avlc dañado se descarta y se compila de nuevo la fuente
+                self.cache.descartar(codigo_fuente, opciones)
+                programa, resultado = self._compilar_programa(codigo_fuente, opciones)
+                if resultado is not None:
+                    return False, resultado
+                self.maquina.cargar_codigo(programa)
+            self.maquina.ejecutar(modo=self.modo)
             
             return True, "Ejecución completada exitosamente"
             
         except Exception as e:
             return False, f"Error en compilación: {str(e)}"
+    
+    def _compilar_programa(self, codigo_fuente, opciones):
+        """Compila y optimiza la fuente y guarda el resultado en la caché.
+        Retorna (programa, None) o (None, mensaje de error)"""
+        resultado = self.compilar(codigo_fuente)
+        if resultado is not None:
+            return None, resultado
+        programa = self.optimizador.optimizar_programa(self.generador.obtener_programa())
+        self.cache.guardar(codigo_fuente, programa, opciones)
+        return programa, None
+    
+    def compilar(self, codigo_fuente):
+        """Ejecuta las fases de análisis y generación. Retorna None si no hubo
+        errores o el mensaje del error encontrado"""
+        # 1. Análisis Léxico
+        self.lexico = Lexico(codigo_fuente)
+        error_lex, token = self.lexico.genera_lexico(False)
+        
+        if error_lex != ERR_NOERROR:
+            return f"Error léxico: {self.lexico.mensaje_error(error_lex)}"
+        
+        # 2. Análisis Sintáctico
+        self.sintaxis = Sintaxis(self.lexico)
+        error_sintax = self.sintaxis.genera_sintaxis()
+        
+        if error_sintax != ERR_NO_SINTAX_ERROR:
+            return f"Error sintáctico: {self.sintaxis.mensaje_error(error_sintax)}"
+        
+        # 3. Generación de Bytecode
+        self.generador = ByteCodeGenerator()
+        arbol = self.sintaxis.get_arbol_sintactico()
+        tabla_simbolos = self.sintaxis.get_tabla_simbolos()
+        
+        self.generador.generar_bytecode(arbol, tabla_simbolos)
+        return None
 
 class Notepad:
     def _apply_editor_colors(self, event=None):
@@ -123,9 +165,16 @@ class Notepad:
         self.estado_text.pack(fill="both", expand=True, padx=2, pady=2)
 
         self.archivos = {}
-        self.maquina_virtual = MaquinaVirtual()
+        # La interfaz muestra la salida al terminar, solo necesita las últimas líneas
+        self.maquina_virtual = MaquinaVirtual(SalidaCircular())
         self.generador_bytecode = ByteCodeGenerator()
-        self.flujo_compilacion = FlujoCompilacion()
+        self.cache_bytecode = CacheBytecode()
+        self.optimizador = OptimizadorMirilla()
+        self.modo_ejecucion = tk.StringVar(value=MODO_INTERPRETE)
+        self.flujo_compilacion = FlujoCompilacion(self.cache_bytecode, self.optimizador,
+                                                  self.modo_ejecucion.get())
+        # Analizador léxico incremental por pestaña y por modo de comentarios y de recuperación
+        self.lexicos = {}
 
         self._apply_editor_colors()
         self.crear_menu()
@@ -168,6 +217,12 @@ class Notepad:
         compilacion_menu.add_command(label="Análisis Semántico", command=self.examen_semantico)
         compilacion_menu.add_command(label="Generación Byte-Code", command=self.gen_bytecode)
         compilacion_menu.add_command(label="Ejecutar Programa", command=self.ejecutar)
+        compilacion_menu.add_separator()
+        modo_menu = tk.Menu(compilacion_menu, tearoff=0)
+        for modo in MODOS_EJECUCION:
+            modo_menu.add_radiobutton(label=modo.capitalize(), value=modo,
+                                      variable=self.modo_ejecucion, command=self.cambiar_modo)
+        compilacion_menu.add_cascade(label="Modo de Ejecución", menu=modo_menu)
         menubar.add_cascade(label="Compilación", menu=compilacion_menu)
 
         # Menú Depuración
@@ -199,8 +254,7 @@ class Notepad:
             
             # 1. ANÁLISIS LÉXICO
             self.log("\n--- ANÁLISIS LÉXICO ---")
-            lex = Lexico(codigo_fuente)
-            error_lex, token = lex.genera_lexico(False)
+            lex, error_lex, token = self.analizar_lexico(text_area, codigo_fuente)
             
             if error_lex != ERR_NOERROR:
                 self.log(f"✗ Error léxico: {lex.mensaje_error(error_lex)}")
@@ -253,20 +307,25 @@ class Notepad:
             
             self.generador_bytecode = ByteCodeGenerator()
             bytecode = self.generador_bytecode.generar_bytecode(arbol, tabla_simbolos)
+            self.log("✓ Bytecode generado exitosamente")
+            self.log(f"✓ Se generaron {len(bytecode)} instrucciones de bytecode")
+            
+            # Optimización de mirilla
+            programa = self.optimizador.optimizar_programa(self.generador_bytecode.obtener_programa())
+            for linea in self.optimizador.resumen():
+                self.log(f"✓ Optimización: {linea}")
             
             # Mostrar bytecode generado
-            bytecode_str = self.generador_bytecode.mostrar_bytecode()
+            bytecode_str = programa.mostrar()
             self.bytecode_text.delete("1.0", tk.END)
             self.bytecode_text.insert("1.0", bytecode_str)
-            self.log("✓ Bytecode generado exitosamente")
-            self.log(f"✓ Se generaron {len(bytecode)} instrucciones de bytecode")
             
             # 5. EJECUCIÓN
             self.log("\n--- EJECUCIÓN ---")
             self.configurar_entrada_interactiva()
             
-            self.maquina_virtual.cargar_codigo(bytecode)
-            self.maquina_virtual.ejecutar()
+            self.maquina_virtual.cargar_codigo(programa)
+            self.maquina_virtual.ejecutar(modo=self.modo_ejecucion.get())
             
             # Mostrar resultados
             salida = self.maquina_virtual.obtener_salida()
@@ -303,8 +362,7 @@ class Notepad:
             codigo_fuente = text_area.get("1.0", tk.END)
             
             # Análisis léxico
-            lex = Lexico(codigo_fuente)
-            error_lex, token = lex.genera_lexico(False)
+            lex, error_lex, token = self.analizar_lexico(text_area, codigo_fuente)
             
             if error_lex != ERR_NOERROR:
                 self.log(f"✗ Error léxico: {lex.mensaje_error(error_lex)}")
@@ -345,40 +403,31 @@ class Notepad:
             # Configurar entrada interactiva
             self.configurar_entrada_interactiva()
             
-            # Análisis léxico
-            lex = Lexico(codigo_fuente)
-            error_lex, token = lex.genera_lexico(False)
-            
-            if error_lex != ERR_NOERROR:
-                self.log(f"✗ Error léxico: {lex.mensaje_error(error_lex)}")
-                return
-            
-            # Análisis sintáctico
-            sintax = Sintaxis(lex)
-            error_sintax = sintax.genera_sintaxis()
-            
-            if error_sintax != ERR_NO_SINTAX_ERROR:
-                self.log(f"✗ Error sintáctico: {sintax.mensaje_error(error_sintax)}")
-                return
-            
-            # Generar byte-code 
-            arbol = sintax.get_arbol_sintactico()
-            print("DEBUG - Árbol sintáctico completo:")
-            for i, inst in enumerate(arbol['instrucciones']):
-                print(f"  {i}: {inst}")
-            tabla_simbolos = sintax.get_tabla_simbolos()
-            
-            self.generador_bytecode = ByteCodeGenerator()
-            bytecode = self.generador_bytecode.generar_bytecode(arbol, tabla_simbolos)
+            # Si la fuente no cambió se reutiliza el byte-code en caché
+            opciones = self.optimizador.firma()
+            programa = self.cache_bytecode.obtener(codigo_fuente, opciones)
+            if programa is not None:
+                try:
+                    self.maquina_virtual.cargar_codigo(programa)
+                    self.log("✓ Byte-code recuperado de la caché")
+                except ErrorVerificacion:
+                    # Un .avlc dañado se descarta y se compila de nuevo la fuente
+                    self.cache_bytecode.descartar(codigo_fuente, opciones)
+                    self.log("✗ Byte-code en caché inválido, se compila de nuevo")
+                    programa = None
+            if programa is None:
+                programa = self.compilar_fuente(text_area, codigo_fuente, opciones)
+                if programa is None:
+                    return
+                self.maquina_virtual.cargar_codigo(programa)
             
             # Mostrar byte-code
-            bytecode_str = self.generador_bytecode.mostrar_bytecode()
+            bytecode_str = programa.mostrar()
             self.bytecode_text.delete("1.0", tk.END)
             self.bytecode_text.insert("1.0", bytecode_str)
             
             # Ejecutar
-            self.maquina_virtual.cargar_codigo(bytecode)
-            self.maquina_virtual.ejecutar()
+            self.maquina_virtual.ejecutar(modo=self.modo_ejecucion.get())
             
             # Mostrar resultados
             salida = self.maquina_virtual.obtener_salida()
@@ -395,6 +444,36 @@ class Notepad:
             import traceback
             self.log(f"Detalle: {traceback.format_exc()}")
 
+    def compilar_fuente(self, text_area, codigo_fuente, opciones):
+        """Compila y optimiza la fuente y la guarda en la caché. Retorna el
+        programa, o None después de mostrar el error encontrado"""
+        # Análisis léxico
+        lex, error_lex, token = self.analizar_lexico(text_area, codigo_fuente)
+        
+        if error_lex != ERR_NOERROR:
+            self.log(f"✗ Error léxico: {lex.mensaje_error(error_lex)}")
+            return None
+        
+        # Análisis sintáctico
+        sintax = Sintaxis(lex)
+        error_sintax = sintax.genera_sintaxis()
+        
+        if error_sintax != ERR_NO_SINTAX_ERROR:
+            self.log(f"✗ Error sintáctico: {sintax.mensaje_error(error_sintax)}")
+            return None
+        
+        # Generar byte-code 
+        arbol = sintax.get_arbol_sintactico()
+        tabla_simbolos = sintax.get_tabla_simbolos()
+        
+        self.generador_bytecode = ByteCodeGenerator()
+        self.generador_bytecode.generar_bytecode(arbol, tabla_simbolos)
+        programa = self.optimizador.optimizar_programa(self.generador_bytecode.obtener_programa())
+        for linea in self.optimizador.resumen():
+            self.log(f"✓ Optimización: {linea}")
+        self.cache_bytecode.guardar(codigo_fuente, programa, opciones)
+        return programa
+
     def configurar_entrada_interactiva(self):
         """Configura callback para entrada de datos"""
         def callback_entrada(mensaje):
@@ -422,18 +501,37 @@ class Notepad:
         self.estado_text.delete("1.0", tk.END)
         
         estado_str = f"PUNTERO: {estado['puntero']}\n\n"
+        if estado.get('linea') is not None:
+            estado_str += f"LÍNEA: {estado['linea']}\n\n"
         estado_str += f"PILA: {estado['pila']}\n\n"
         estado_str += f"MEMORIA: {estado['memoria']}\n\n"
         estado_str += f"SALIDA: {estado.get('salida', [])}"
         
         self.estado_text.insert("1.0", estado_str)
 
+    def cambiar_modo(self):
+        """Aplica el modo de ejecución elegido en el menú"""
+        modo = self.modo_ejecucion.get()
+        self.flujo_compilacion.modo = modo
+        self.log(f"Modo de ejecución: {modo}")
+
     def reiniciar_ejecucion(self):
         """Reinicia la ejecución del programa"""
-        self.maquina_virtual = MaquinaVirtual()
+        self.maquina_virtual = MaquinaVirtual(SalidaCircular(), self.modo_ejecucion.get())
         self.estado_text.delete("1.0", tk.END)
         self.log("✓ Ejecución reiniciada")
 
+    def analizar_lexico(self, text_area, codigo_fuente, con_comentarios=False, recuperar=False):
+        """Retorna el analizador léxico de la pestaña al día con el código y
+        el resultado (error, token). Entre una acción y otra solo se vuelven
+        a analizar las líneas editadas"""
+        llave = (text_area, con_comentarios, recuperar)
+        lex = self.lexicos.get(llave)
+        if lex is None:
+            lex = self.lexicos[llave] = LexicoIncremental(codigo_fuente, con_comentarios, recuperar)
+        error, token = lex.actualizar(codigo_fuente)
+        return lex, error, token
+
     def editor_actual(self):
         tab = self.notebook.select()
         return self.notebook.nametowidget(tab)
@@ -499,10 +597,9 @@ class Notepad:
     def examen_lexico(self):
         self.log("\n--- ANÁLISIS LÉXICO ---")
         text_area = self.editor_actual()
-        lex = Lexico(text_area.get("1.0", tk.END))
-
-        error, token = lex.genera_lexico(True)
-        msg_error = lex.mensaje_error(error)
+        codigo_fuente = text_area.get("1.0", tk.END)
+        # Con recuperación se muestran todos los errores de una vez
+        lex, error, token = self.analizar_lexico(text_area, codigo_fuente, True, recuperar=True)
 
         if error == ERR_NOERROR: 
             lst = lex.get()
@@ -510,14 +607,15 @@ class Notepad:
                 s = str(c[1]) + " - " + lex.get_tipo_token_str(c[1], c[0])
                 self.log(c[0] + " \t:: " + s)
         else:
-            self.log(f"Error: {error} :: {token} :: {msg_error}")
+            for error_lex in lex.get_errores():
+                self.log(f"Error: {error_lex['codigo']} :: {error_lex['token']} :: {error_lex['mensaje']} "
+                         f"(línea {error_lex['linea']}, columna {error_lex['columna']})")
         self.log("Total de líneas procesadas: " + str(lex.get_lineas()))
         
     def examen_sintaxis(self):
         self.log("\n--- ANÁLISIS SINTÁCTICO ---")
         text_area = self.editor_actual()
-        lex = Lexico(text_area.get("1.0", tk.END))
-        error, token = lex.genera_lexico(False)
+        lex, error, token = self.analizar_lexico(text_area, text_area.get("1.0", tk.END))
         msg_error_lex = lex.mensaje_error(error)
         
         if error == ERR_NOERROR: 
@@ -535,8 +633,7 @@ class Notepad:
     def examen_semantico(self):
         self.log("\n--- ANÁLISIS SEMÁNTICO ---")
         text_area = self.editor_actual()
-        lex = Lexico(text_area.get("1.0", tk.END))
-        error, token = lex.genera_lexico(False)
+        lex, error, token = self.analizar_lexico(text_area, text_area.get("1.0", tk.END))
         
         if error == ERR_NOERROR: 
             sintax = Sintaxis(lex)
@@ -2,6 +2,14 @@
 Módulo de Análisis Léxico
 """
 
+import codecs
+import io
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
 
 
 class Tipos:
@@ -91,6 +99,8 @@ class Tipos:
     LIN_AND = 43  
     LIN_OR = 44  
     LIN_NOT = 45 
+    # Token con un error léxico, solo en el modo con recuperación
+    LIN_ERROR = 46
     
     NO_DECLARADO = 5000
     
@@ -209,8 +219,15 @@ matriz_lexico = [
     [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 36, 0], 
     [-1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, 37, -1],  
     [-1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1],  
-    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 39], 
-    [-1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1],  
+    # 40-47: &, |, ! y sus estados intermedios (&&, || y ! completos)
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 43, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 44, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 45],
+    [-1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, 46, -1, -1],
+    [-1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, 47, -1],
+    [-1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1],
+    [-1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1],
+    [-1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1],
 ]
 
 lista_palabras_reservadas = (
@@ -238,183 +255,492 @@ lista_palabras_reservadas = (
     ("!", Tipos.LEX_NOT)
 )
 
+# Palabra -> tipo, compartido por todos los analizadores: clasificar un
+# identificador es una sola búsqueda
+PALABRAS_RESERVADAS = dict(lista_palabras_reservadas)
+
+# Columnas de matriz_lexico. La matriz se guarda también aplanada por filas:
+# la transición de la fila f con la columna c está en f * COLUMNAS_LEXICO + c.
+# Una transición 0 no avanza y dejaría al autómata detenido en el mismo
+# carácter, así que en la tabla es un carácter inválido
+COLUMNAS_LEXICO = len(matriz_lexico[0])
+TRANSICIONES = array('i', [
+    transicion if transicion != 0 else Tipos.ERROR_CARACTER_INVALIDO
+    for fila in matriz_lexico for transicion in fila
+])
+
+
+def _tabla_clases_ascii():
+    clases = [Tipos.COL_OTROS] * 128
+    for codigo in range(ord('A'), ord('Z') + 1):
+        clases[codigo] = Tipos.COL_LETRAS
+        clases[codigo + 32] = Tipos.COL_LETRAS
+    for codigo in range(ord('0'), ord('9') + 1):
+        clases[codigo] = Tipos.COL_NUMEROS
+    for caracter in '()[]*/,:;':
+        clases[ord(caracter)] = Tipos.COL_UNITARIOS
+    for caracter, columna in (
+        (' ', Tipos.COL_ESPACIO), ('_', Tipos.COL_LETRAS), ('.', Tipos.COL_PUNTO),
+        ('=', Tipos.COL_IGUAL), ('>', Tipos.COL_MAYOR), ('<', Tipos.COL_MENOR),
+        ('+', Tipos.COL_MAS), ('-', Tipos.COL_MENOS), ('"', Tipos.COL_COMILLAS),
+        ('\n', Tipos.COL_EOLN), ('#', Tipos.COL_HASH), ('{', Tipos.COL_LLAVE_ABRIR),
+        ('}', Tipos.COL_LLAVE_CERRAR), ('&', Tipos.COL_AMPERSAND), ('|', Tipos.COL_PIPE),
+        ('!', Tipos.COL_EXCLAMACION),
+    ):
+        clases[ord(caracter)] = columna
+    return clases
+
+
+# Código ASCII -> columna de matriz_lexico. Los caracteres no ASCII son COL_OTROS
+CLASES_ASCII = _tabla_clases_ascii()
+
+# Columna del primer carácter -> tipo del token que empieza
+TIPO_POR_COLUMNA = [Tipos.LIN_SIN_TIPO] * COLUMNAS_LEXICO
+for _columna, _tipo in (
+    (Tipos.COL_ESPACIO, Tipos.LIN_ESPACIO), (Tipos.COL_EOLN, Tipos.LIN_EOLN),
+    (Tipos.COL_EOF, Tipos.LIN_EOF), (Tipos.COL_LETRAS, Tipos.LIN_IDENTIFICADOR),
+    (Tipos.COL_COMILLAS, Tipos.LIN_CADENA), (Tipos.COL_NUMEROS, Tipos.LIN_NUMERO),
+    (Tipos.COL_UNITARIOS, Tipos.LIN_SIMBOLO), (Tipos.COL_MAS, Tipos.LIN_MAS),
+    (Tipos.COL_HASH, Tipos.LIN_HASH), (Tipos.COL_MENOS, Tipos.LIN_MENOS),
+    (Tipos.COL_LLAVE_ABRIR, Tipos.LIN_COMENTARIO), (Tipos.COL_PUNTO, Tipos.LIN_PUNTO),
+    (Tipos.COL_IGUAL, Tipos.LIN_IGUAL), (Tipos.COL_MAYOR, Tipos.LIN_MAYOR),
+    (Tipos.COL_MENOR, Tipos.LIN_MENOR), (Tipos.COL_AMPERSAND, Tipos.LIN_AMPERSAND),
+    (Tipos.COL_PIPE, Tipos.LIN_PIPE), (Tipos.COL_EXCLAMACION, Tipos.LIN_EXCLAMACION),
+):
+    TIPO_POR_COLUMNA[_columna] = _tipo
+del _columna, _tipo
+
+# Un tipo de token sin fila en la matriz no acepta ningún carácter
+TRANSICIONES.extend(
+    [Tipos.ERROR_CARACTER_INVALIDO] * COLUMNAS_LEXICO * max(0, max(TIPO_POR_COLUMNA) + 1 - len(matriz_lexico))
+)
+
+# Operadores lógicos completos -> tipo del token
+OPERADORES_LOGICOS = {"&&": Tipos.LIN_AND, "||": Tipos.LIN_OR, "!": Tipos.LIN_NOT}
+
+# Estados de comentario largo, comentario corto y cadena: el autómata se queda
+# en ellos con cualquier carácter salvo los de cierre, así que se avanza
+# hasta el cierre con str.find y el autómata procesa solo ese carácter
+ESTADO_COMENTARIO = matriz_lexico[Tipos.LIN_COMENTARIO][Tipos.COL_LLAVE_ABRIR]
+ESTADO_COMENTARIO_CORTO = matriz_lexico[Tipos.LIN_HASH][Tipos.COL_HASH]
+ESTADO_CADENA = matriz_lexico[Tipos.LIN_CADENA][Tipos.COL_COMILLAS]
+ESTADOS_REGION = frozenset((ESTADO_COMENTARIO, ESTADO_COMENTARIO_CORTO, ESTADO_CADENA))
+TIPOS_REGION = frozenset((Tipos.LIN_COMENTARIO, Tipos.LIN_HASH, Tipos.LIN_CADENA))
+
+ERRORES_LEXICOS = frozenset((
+    Tipos.ERROR_CADENA, Tipos.ERROR_NUMERO, Tipos.ERROR_COMENTARIO, Tipos.ERROR_CARACTER_INVALIDO,
+))
+
+_ESPACIOS = re.compile(" +")
+
+
+def _fin_region(fuente, indice, estado):
+    """Posición del primer carácter que saca al autómata del estado, o el
+    largo del trozo si no aparece en él"""
+    if estado == ESTADO_CADENA:
+        fin = fuente.find('"', indice)
+        if fin < 0:
+            fin = len(fuente)
+        # Un fin de línea dentro de la cadena es un error del autómata
+        salto = fuente.find("\n", indice, fin)
+        return salto if salto >= 0 else fin
+    cierre = "}" if estado == ESTADO_COMENTARIO else "\n"
+    fin = fuente.find(cierre, indice)
+    return fin if fin >= 0 else len(fuente)
+
+
+class TablaTokens(Sequence):
+    """Tokens de un análisis completo en arreglos paralelos: tipo, línea,
+    columna y posiciones de inicio y fin en el código fuente. Cada valor
+    distinto se guarda una sola vez y el token conserva solo su índice.
+    Como secuencia se ve igual que la lista de tuplas (valor, tipo)"""
+    
+    def __init__(self):
+        self.tipos = array('i')
+        self.lineas = array('i')
+        self.columnas = array('i')
+        self.inicios = array('q')
+        self.fines = array('q')
+        self.indices_valores = array('i')
+        self.valores = []
+        self._indice_valor = {}
+    
+    def llenar(self, tokens):
+        """Agrega las tuplas (valor, tipo, inicio, fin) de Lexico.tokens()"""
+        # El diccionario conserva el orden de inserción: sus llaves son los valores
+        indice_valor = self._indice_valor
+        agregar_indice = self.indices_valores.append
+        agregar_tipo = self.tipos.append
+        agregar_inicio = self.inicios.append
+        agregar_fin = self.fines.append
+        for valor, tipo, inicio, fin in tokens:
+            agregar_indice(indice_valor.setdefault(valor, len(indice_valor)))
+            agregar_tipo(tipo)
+            agregar_inicio(inicio)
+            agregar_fin(fin)
+        self.valores = list(indice_valor)
+    
+    def ubicar(self, inicios_lineas, primera_linea=1):
+        """Calcula la línea y la columna (desde 1) de cada token. inicios_lineas
+        empieza con el inicio de primera_linea, anterior a todos los tokens"""
+        lineas = array('i')
+        columnas = array('i')
+        agregar_linea = lineas.append
+        agregar_columna = columnas.append
+        # Tokens e inicios de línea están ordenados: se recorren a la par
+        siguientes = iter(inicios_lineas)
+        linea = primera_linea
+        anterior = next(siguientes) - 1
+        siguiente = next(siguientes, None)
+        for inicio in self.inicios:
+            while siguiente is not None and inicio >= siguiente:
+                linea += 1
+                anterior = siguiente - 1
+                siguiente = next(siguientes, None)
+            agregar_linea(linea)
+            agregar_columna(inicio - anterior)
+        self.lineas = lineas
+        self.columnas = columnas
+    
+    def empalmar(self, desde, hasta, nueva, corrimiento, corrimiento_lineas):
+        """Reemplaza los tokens [desde, hasta) por los de la tabla nueva, ya
+        ubicados, y corre las posiciones y líneas de los tokens siguientes"""
+        indice_valor = self._indice_valor
+        valores = self.valores
+        traduccion = []
+        for valor in nueva.valores:
+            indice = indice_valor.get(valor)
+            if indice is None:
+                indice = indice_valor[valor] = len(valores)
+                valores.append(valor)
+            traduccion.append(indice)
+        
+        inicios = self.inicios[hasta:]
+        fines = self.fines[hasta:]
+        lineas = self.lineas[hasta:]
+        if corrimiento:
+            inicios = array('q', map(corrimiento.__add__, inicios))
+            fines = array('q', map(corrimiento.__add__, fines))
+        if corrimiento_lineas:
+            lineas = array('i', map(corrimiento_lineas.__add__, lineas))
+        
+        self.indices_valores[desde:] = (
+            array('i', map(traduccion.__getitem__, nueva.indices_valores)) + self.indices_valores[hasta:]
+        )
+        self.tipos[desde:] = nueva.tipos + self.tipos[hasta:]
+        self.columnas[desde:] = nueva.columnas + self.columnas[hasta:]
+        self.lineas[desde:] = nueva.lineas + lineas
+        self.inicios[desde:] = nueva.inicios + inicios
+        self.fines[desde:] = nueva.fines + fines
+    
+    def valor(self, indice_token):
+        return self.valores[self.indices_valores[indice_token]]
+    
+    def token(self, indice_token):
+        return self.valores[self.indices_valores[indice_token]], self.tipos[indice_token]
+    
+    def __len__(self):
+        return len(self.tipos)
+    
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self.token(i) for i in range(*indice.indices(len(self)))]
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError("índice de token fuera de rango")
+        return self.token(indice)
+    
+    def __iter__(self):
+        valores = self.valores
+        return zip((valores[i] for i in self.indices_valores), self.tipos)
+
+
+class FlujoTokens:
+    """Tokens de Lexico.tokens() leídos a medida que el analizador sintáctico
+    los pide. Ofrece la misma interfaz que Lexico (token, tipo, posicion, liberar)
+    pero solo conserva los tokens desde el último liberado"""
+    
+    def __init__(self, lexico, incluir_comentarios=False):
+        self.lexico = lexico
+        self._generador = lexico.tokens(incluir_comentarios)
+        self._tokens = []
+        self._inicios = []
+        # Índice absoluto del primer token conservado
+        self._primero = 0
+    
+    def token(self, indice_token):
+        relativo = indice_token - self._primero
+        while relativo >= len(self._tokens):
+            if self._generador is None:
+                return None
+            try:
+                valor, tipo, inicio, _ = next(self._generador)
+            except StopIteration:
+                self._generador = None
+                return None
+            self._tokens.append((valor, tipo))
+            self._inicios.append(inicio)
+        return self._tokens[relativo]
+    
+    def tipo(self, indice_token):
+        token = self.token(indice_token)
+        return token[1] if token is not None else None
+    
+    def liberar(self, indice_token):
+        """Descarta los tokens anteriores al indicado"""
+        cantidad = indice_token - self._primero
+        if cantidad > 0:
+            del self._tokens[:cantidad]
+            del self._inicios[:cantidad]
+            self._primero = indice_token
+    
+    def posicion(self, indice_token):
+        relativo = min(indice_token - self._primero, len(self._inicios) - 1)
+        return self.lexico.posicion_en(self._inicios[relativo])
+
+
+# Caracteres por trozo al leer un archivo mapeado en memoria
+TAMANIO_TROZO = 1 << 16
+
+
+def _trozos_archivo(ruta, codificacion, tamanio=TAMANIO_TROZO):
+    """Decodifica el archivo por trozos sobre un mmap, sin cargarlo completo.
+    Los finales de línea \r\n y \r se convierten en \n, como al abrirlo en
+    modo texto"""
+    with open(ruta, "rb") as archivo:
+        if os.fstat(archivo.fileno()).st_size == 0:
+            return
+        with mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            decodificador = io.IncrementalNewlineDecoder(
+                codecs.getincrementaldecoder(codificacion)(), translate=True
+            )
+            for inicio in range(0, len(mapa), tamanio):
+                trozo = decodificador.decode(mapa[inicio:inicio + tamanio])
+                if trozo:
+                    yield trozo
+            trozo = decodificador.decode(b"", final=True)
+            if trozo:
+                yield trozo
+
+
 class Lexico:
     def __init__(self, codigo_fuente):
-        self.codigo_fuente = list(codigo_fuente)
+        # La cadena se recorre directamente, sin copiarla a una lista
+        self.codigo_fuente = codigo_fuente
+        self._trozos = lambda: (codigo_fuente,)
         self.numero_lineas = 0
-        self.lista_tokens = []
+        self.tabla_tokens = TablaTokens()
+        # Posición donde empieza cada línea, se completa al analizar
+        self._inicios_lineas = array('q', [0])
+        self.codigo_error = Tipos.ERROR_NINGUNO
+        self.token_error = ""
+        self.errores_lexicos = []
         self.tipos = Tipos 
+    
+    @classmethod
+    def desde_archivo(cls, ruta, codificacion="utf-8"):
+        """Analizador que lee el archivo mapeado en memoria y decodificado por
+        trozos. Con tokens() o FlujoTokens el archivo nunca se carga completo"""
+        lexico = cls("")
+        lexico.codigo_fuente = None
+        lexico._trozos = lambda: _trozos_archivo(ruta, codificacion)
+        return lexico
+        
+    def analizar(self, incluir_comentarios=False, recuperar=False):
+        """Con recuperar=True no se detiene en el primer error léxico: los
+        anota todos en errores_lexicos (ver tokens())"""
+        tabla = TablaTokens()
+        tabla.llenar(self.tokens(incluir_comentarios, recuperar))
+        # Los inicios de línea quedan completos al terminar tokens()
+        tabla.ubicar(self._inicios_lineas)
+        self.tabla_tokens = tabla
+        
+        return self.codigo_error, self.token_error
+    
+    def tokens(self, incluir_comentarios=False, recuperar=False):
+        """Generador de tuplas (valor, tipo, inicio, fin) a medida que se
+        reconocen; inicio y fin son posiciones en el código fuente. Siempre
+        termina con [EOF]; si hubo un error léxico se detiene antes y lo deja
+        en codigo_error y token_error.
         
-    def analizar(self, incluir_comentarios=False):
+        Con recuperar=True cada error produce un token LIN_ERROR y el análisis
+        se retoma en el carácter que lo provocó, o en el siguiente si era un
+        carácter inválido. codigo_error y token_error quedan con el primero"""
         self.numero_lineas = 0
-        self.lista_tokens = []
+        self.codigo_error = Tipos.ERROR_NINGUNO
+        self.token_error = ""
+        self.errores_lexicos = []
+        self._inicios_lineas = array('q', [0])
         
         codigo_error = Tipos.ERROR_NINGUNO
         token_actual = ""
         tipo_token = Tipos.LIN_SIN_TIPO
-        indice_token = 0
+        inicio_token = 0
         linea_automata = 0
+        # Posición del trozo actual dentro del código fuente
+        base = 0
         
-        while indice_token < len(self.codigo_fuente):
-            caracter = self.codigo_fuente[indice_token]
-            
-            columna = self._clasificar_caracter(caracter)
-            if tipo_token == Tipos.LIN_SIN_TIPO:
-                tipo_token = self._obtener_tipo_token(columna)
-                linea_automata = tipo_token
+        clases = CLASES_ASCII
+        tipo_por_columna = TIPO_POR_COLUMNA
+        transiciones = TRANSICIONES
+        columnas = COLUMNAS_LEXICO
+        col_otros = Tipos.COL_OTROS
+        col_espacio = Tipos.COL_ESPACIO
+        sin_tipo = Tipos.LIN_SIN_TIPO
+        espacios = _ESPACIOS.match
+        
+        for fuente in self._trozos():
+            self._registrar_lineas(fuente, base)
+            total = len(fuente)
+            indice_token = 0
             
-            transicion = matriz_lexico[linea_automata][columna]
+            if linea_automata in ESTADOS_REGION:
+                # Comentario o cadena que viene del trozo anterior
+                indice_token = _fin_region(fuente, 0, linea_automata)
+                token_actual += fuente[:indice_token]
             
-    
-            if transicion == Tipos.ERROR_CADENA:
-                codigo_error = Tipos.ERROR_CADENA
-                break
-            elif transicion == Tipos.ERROR_NUMERO:
-                codigo_error = Tipos.ERROR_NUMERO
-                break
-            elif transicion == Tipos.ERROR_COMENTARIO:
-                codigo_error = Tipos.ERROR_COMENTARIO
-                break
-            elif transicion == Tipos.ERROR_CARACTER_INVALIDO:
-                token_actual = caracter
-                codigo_error = Tipos.ERROR_CARACTER_INVALIDO
-                break
-            elif transicion > 0:
-    
-                token_actual += caracter
-                linea_automata = transicion
-                indice_token += 1
+            while indice_token < total:
+                caracter = fuente[indice_token]
                 
-            elif transicion == -1:
-    
-                if tipo_token == Tipos.LIN_IDENTIFICADOR:
-                    tipo_final = self._clasificar_identificador(token_actual.lower())
-                    self.lista_tokens.append((token_actual.lower(), tipo_final))
-                elif tipo_token == Tipos.LIN_NUMERO:
-    
-                    tipo_final = Tipos.LIN_NUM_FLOTANTE if "." in token_actual else Tipos.LIN_NUM_ENTERO
-                    self.lista_tokens.append((token_actual, tipo_final))
-                elif tipo_token in (Tipos.LIN_MAS, Tipos.LIN_MENOS, Tipos.LIN_IGUAL, 
-                                  Tipos.LIN_MAYOR, Tipos.LIN_MENOR, Tipos.LIN_AND, 
-                                  Tipos.LIN_OR, Tipos.LIN_NOT):
-                    self.lista_tokens.append((token_actual, tipo_token))
-                elif tipo_token == Tipos.LIN_ESPACIO:
-    
-                    indice_token += 1
-                elif tipo_token == Tipos.LIN_EOLN:
-                    self.lista_tokens.append(("[EOLN]", tipo_token))
-                    self.numero_lineas += 1
-                    indice_token += 1
-                elif tipo_token in (Tipos.LIN_COMENTARIO, Tipos.LIN_HASH):
-                    token_actual += caracter
-                    indice_token += 1
+                columna = clases[ord(caracter)] if caracter < "\x80" else col_otros
+                if tipo_token == sin_tipo:
+                    if columna == col_espacio:
+                        # Los espacios no producen tokens: la corrida se salta entera
+                        indice_token = espacios(fuente, indice_token).end()
+                        continue
+                    tipo_token = tipo_por_columna[columna]
+                    linea_automata = tipo_token
+                    inicio_token = base + indice_token
+                    if tipo_token in TIPOS_REGION:
+                        linea_automata = transiciones[tipo_token * columnas + columna]
+                        fin = _fin_region(fuente, indice_token + 1, linea_automata)
+                        token_actual = fuente[indice_token:fin]
+                        indice_token = fin
+                        continue
+                
+                transicion = transiciones[linea_automata * columnas + columna]
+                
+                if transicion in ERRORES_LEXICOS:
+                    if transicion == Tipos.ERROR_CARACTER_INVALIDO:
+                        token_actual = caracter
+                        inicio_token = base + indice_token
+                    self._anotar_error(transicion, token_actual, inicio_token)
+                    if not recuperar:
+                        codigo_error = transicion
+                        break
                     
-                    if incluir_comentarios:
-                        self.lista_tokens.append((token_actual, tipo_token))
-                else:
+                    # Si el error está en el primer carácter del token se salta
+                    # para asegurar el avance
+                    if base + indice_token == inicio_token:
+                        indice_token += 1
+                    yield token_actual, Tipos.LIN_ERROR, inicio_token, base + indice_token
+                    token_actual = ""
+                    tipo_token = sin_tipo
+                    linea_automata = 0
+                elif transicion > 0:
+        
                     token_actual += caracter
+                    linea_automata = transicion
                     indice_token += 1
-                    self.lista_tokens.append((token_actual, tipo_token))
+                    
+                elif transicion == -1:
+        
+                    if tipo_token == Tipos.LIN_IDENTIFICADOR:
+                        identificador = token_actual.lower()
+                        tipo_final = self._clasificar_identificador(identificador)
+                        yield identificador, tipo_final, inicio_token, base + indice_token
+                    elif tipo_token == Tipos.LIN_NUMERO:
+        
+                        tipo_final = Tipos.LIN_NUM_FLOTANTE if "." in token_actual else Tipos.LIN_NUM_ENTERO
+                        yield token_actual, tipo_final, inicio_token, base + indice_token
+                    elif tipo_token in (Tipos.LIN_MAS, Tipos.LIN_MENOS, Tipos.LIN_IGUAL, 
+                                      Tipos.LIN_MAYOR, Tipos.LIN_MENOR, Tipos.LIN_AND, 
+                                      Tipos.LIN_OR, Tipos.LIN_NOT):
+                        yield token_actual, tipo_token, inicio_token, base + indice_token
+                    elif tipo_token in (Tipos.LIN_AMPERSAND, Tipos.LIN_PIPE, Tipos.LIN_EXCLAMACION):
+                        # & y | sueltos quedan con su tipo y el sintáctico los rechaza
+                        tipo_final = OPERADORES_LOGICOS.get(token_actual, tipo_token)
+                        yield token_actual, tipo_final, inicio_token, base + indice_token
+                    elif tipo_token == Tipos.LIN_ESPACIO:
+        
+                        indice_token += 1
+                    elif tipo_token == Tipos.LIN_EOLN:
+                        self.numero_lineas += 1
+                        indice_token += 1
+                        yield "[EOLN]", tipo_token, inicio_token, base + indice_token
+                    elif tipo_token in (Tipos.LIN_COMENTARIO, Tipos.LIN_HASH):
+                        token_actual += caracter
+                        indice_token += 1
+                        
+                        if incluir_comentarios:
+                            yield token_actual, tipo_token, inicio_token, base + indice_token
+                    else:
+                        token_actual += caracter
+                        indice_token += 1
+                        yield token_actual, tipo_token, inicio_token, base + indice_token
 
-                token_actual = ""
-                tipo_token = Tipos.LIN_SIN_TIPO
-                linea_automata = 0
+                    token_actual = ""
+                    tipo_token = Tipos.LIN_SIN_TIPO
+                    linea_automata = 0
             
-    
-        self.lista_tokens.append(("[EOF]", Tipos.LIN_EOF))
+            base += total
+            if codigo_error != Tipos.ERROR_NINGUNO:
+                base += indice_token - total
+                break
+        
+        # El autómata nunca recibe COL_EOF: un comentario de bloque o una
+        # cadena sin cerrar se reporta al terminar los trozos
+        if (codigo_error == Tipos.ERROR_NINGUNO and tipo_token != sin_tipo
+                and linea_automata in (ESTADO_COMENTARIO, ESTADO_CADENA)):
+            transicion = transiciones[linea_automata * columnas + Tipos.COL_EOF]
+            self._anotar_error(transicion, token_actual, inicio_token)
+            if recuperar:
+                yield token_actual, Tipos.LIN_ERROR, inicio_token, base
+            else:
+                codigo_error = transicion
         
-        return codigo_error, token_actual
+        if self.errores_lexicos:
+            self.codigo_error = self.errores_lexicos[0]['codigo']
+            self.token_error = self.errores_lexicos[0]['token']
+        else:
+            self.codigo_error = codigo_error
+            self.token_error = token_actual
+        yield "[EOF]", Tipos.LIN_EOF, base, base
+    
+    def _anotar_error(self, codigo_error, token, inicio):
+        linea, columna = self.posicion_en(inicio)
+        self.errores_lexicos.append({
+            'tipo': 'lexico',
+            'codigo': codigo_error,
+            'mensaje': self.mensaje_error(codigo_error),
+            'linea': linea,
+            'columna': columna,
+            'token': token,
+        })
+    
+    def _registrar_lineas(self, trozo, base):
+        inicios = self._inicios_lineas
+        indice = trozo.find("\n")
+        while indice >= 0:
+            inicios.append(base + indice + 1)
+            indice = trozo.find("\n", indice + 1)
     
     def _clasificar_caracter(self, caracter):
     
-        if caracter == " ":
-            return Tipos.COL_ESPACIO
-        elif (caracter >= 'A' and caracter <= 'Z') or (caracter >= 'a' and caracter <= 'z') or (caracter == '_'):
-            return Tipos.COL_LETRAS
-        elif (caracter >= '0' and caracter <= '9'):
-            return Tipos.COL_NUMEROS
-        elif caracter == '.':
-            return Tipos.COL_PUNTO
-        elif caracter in '()[]*/,:;':
-            return Tipos.COL_UNITARIOS
-        elif caracter == '=':
-            return Tipos.COL_IGUAL
-        elif caracter == '>':
-            return Tipos.COL_MAYOR
-        elif caracter == '<':
-            return Tipos.COL_MENOR
-        elif caracter == '+':
-            return Tipos.COL_MAS
-        elif caracter == '-':
-            return Tipos.COL_MENOS
-        elif caracter == '"':
-            return Tipos.COL_COMILLAS
-        elif caracter == '\n':
-            return Tipos.COL_EOLN
-        elif caracter == '#':
-            return Tipos.COL_HASH
-        elif caracter == '{':
-            return Tipos.COL_LLAVE_ABRIR
-        elif caracter == '}':
-            return Tipos.COL_LLAVE_CERRAR
-        elif caracter == '&':
-            return Tipos.COL_AMPERSAND
-        elif caracter == '|':
-            return Tipos.COL_PIPE
-        elif caracter == '!':
-            return Tipos.COL_EXCLAMACION
-        elif caracter == "":
+        if caracter == "":
             return Tipos.COL_EOF
-        else:
-            return Tipos.COL_OTROS
+        if caracter < "\x80":
+            return CLASES_ASCII[ord(caracter)]
+        return Tipos.COL_OTROS
     
     def _obtener_tipo_token(self, columna):
     
-        if columna == Tipos.COL_ESPACIO:
-            return Tipos.LIN_ESPACIO
-        elif columna == Tipos.COL_EOLN:
-            return Tipos.LIN_EOLN
-        elif columna == Tipos.COL_EOF:
-            return Tipos.LIN_EOF
-        elif columna == Tipos.COL_LETRAS:
-            return Tipos.LIN_IDENTIFICADOR
-        elif columna == Tipos.COL_COMILLAS:
-            return Tipos.LIN_CADENA
-        elif columna == Tipos.COL_NUMEROS:
-            return Tipos.LIN_NUMERO
-        elif columna == Tipos.COL_UNITARIOS:
-            return Tipos.LIN_SIMBOLO
-        elif columna == Tipos.COL_MAS:
-            return Tipos.LIN_MAS
-        elif columna == Tipos.COL_HASH:
-            return Tipos.LIN_HASH
-        elif columna == Tipos.COL_MENOS:
-            return Tipos.LIN_MENOS
-        elif columna == Tipos.COL_LLAVE_ABRIR:
-            return Tipos.LIN_COMENTARIO
-        elif columna == Tipos.COL_PUNTO:
-            return Tipos.LIN_PUNTO
-        elif columna == Tipos.COL_IGUAL:
-            return Tipos.LIN_IGUAL
-        elif columna == Tipos.COL_MAYOR:
-            return Tipos.LIN_MAYOR
-        elif columna == Tipos.COL_MENOR:
-            return Tipos.LIN_MENOR
-        elif columna == Tipos.COL_AMPERSAND:
-            return Tipos.LIN_AMPERSAND
-        elif columna == Tipos.COL_PIPE:
-            return Tipos.LIN_PIPE
-        elif columna == Tipos.COL_EXCLAMACION:
-            return Tipos.LIN_EXCLAMACION
-        else:
-            return Tipos.LIN_SIN_TIPO
+        return TIPO_POR_COLUMNA[columna]
     
     def _clasificar_identificador(self, identificador):
     
-        for palabra, tipo in lista_palabras_reservadas:
-            if identificador == palabra:
-                return tipo
-        return Tipos.LIN_IDENTIFICADOR
+        return PALABRAS_RESERVADAS.get(identificador, Tipos.LIN_IDENTIFICADOR)
     
     def obtener_descripcion_token(self, tipo_token, valor_token):
     
@@ -443,6 +769,7 @@ class Lexico:
             Tipos.LIN_AND: "operador and (&&)",
             Tipos.LIN_OR: "operador or (||)",
             Tipos.LIN_NOT: "operador not (!)",
+            Tipos.LIN_ERROR: "error léxico",
         }
         
     
@@ -461,13 +788,47 @@ class Lexico:
         return self.analizar(incluir_comentarios=con_comentarios)
     
     def get(self):
-    
-        return self.lista_tokens
+        """Los tokens como secuencia de tuplas (valor, tipo); ver TablaTokens"""
+        return self.tabla_tokens
     
     def get_lineas(self):
     
         return self.numero_lineas
     
+    def get_errores(self):
+        """Errores léxicos del último análisis, en el orden del código"""
+        return self.errores_lexicos
+    
+    def token(self, indice_token):
+        """Token en la posición indicada, o None después del último"""
+        if indice_token < len(self.tabla_tokens):
+            return self.tabla_tokens.token(indice_token)
+        return None
+    
+    def tipo(self, indice_token):
+        """Tipo del token indicado sin armar la tupla, o None después del último"""
+        tipos = self.tabla_tokens.tipos
+        return tipos[indice_token] if indice_token < len(tipos) else None
+    
+    def liberar(self, indice_token):
+        """Los tokens analizados se conservan completos; ver FlujoTokens"""
+        pass
+    
+    def posicion(self, indice_token):
+        """Línea y columna (desde 1) donde empieza el token indicado"""
+        tabla = self.tabla_tokens
+        indice_token = min(indice_token, len(tabla) - 1)
+        return tabla.lineas[indice_token], tabla.columnas[indice_token]
+    
+    def posicion_en(self, inicio):
+        """Línea y columna de una posición del código fuente ya analizada"""
+        linea = bisect_right(self._inicios_lineas, inicio)
+        return linea, inicio - self._inicios_lineas[linea - 1] + 1
+    
+    def get_posiciones(self):
+    
+        return list(zip(self.tabla_tokens.lineas, self.tabla_tokens.columnas))
+    
     def get_tipo_token_str(self, tipo_token, valor_token):
     
         return self.obtener_descripcion_token(tipo_token, valor_token)
@@ -500,6 +861,199 @@ class Lexico:
 
 
 
+# Caracteres por trozo al volver a analizar después de una edición: el
+# análisis se detiene al resincronizarse, no hace falta leer más adelante
+TAMANIO_TROZO_EDICION = 4096
+
+# Estado al inicio de una línea que no se puede reutilizar, por ejemplo
+# después de un error léxico o dentro de un comentario sin cerrar
+ESTADO_DESCONOCIDO = -1
+
+
+def _prefijo_comun(anterior, nuevo):
+    """Largo del prefijo común, comparando por mitades con cadenas de C"""
+    bajo, alto = 0, min(len(anterior), len(nuevo))
+    while bajo < alto:
+        medio = (bajo + alto + 1) // 2
+        if anterior[bajo:medio] == nuevo[bajo:medio]:
+            bajo = medio
+        else:
+            alto = medio - 1
+    return bajo
+
+
+def _sufijo_comun(anterior, nuevo, limite):
+    """Largo del sufijo común, sin pasar de limite"""
+    largo_anterior, largo_nuevo = len(anterior), len(nuevo)
+    bajo, alto = 0, limite
+    while bajo < alto:
+        medio = (bajo + alto + 1) // 2
+        if anterior[largo_anterior - medio:largo_anterior - bajo] == nuevo[largo_nuevo - medio:largo_nuevo - bajo]:
+            bajo = medio
+        else:
+            alto = medio - 1
+    return bajo
+
+
+def _trozos_cadena(codigo_fuente, desde, tamanio):
+    for inicio in range(desde, len(codigo_fuente), tamanio):
+        yield codigo_fuente[inicio:inicio + tamanio]
+
+
+class LexicoIncremental(Lexico):
+    """Analizador léxico para el editor. Conserva los tokens y el estado del
+    autómata al inicio de cada línea; al cambiar el código vuelve a analizar
+    desde la línea dañada hasta que el autómata se resincroniza con el
+    análisis anterior y empalma los tokens nuevos con los que siguen"""
+    
+    def __init__(self, codigo_fuente="", incluir_comentarios=False, recuperar=False):
+        super().__init__(codigo_fuente)
+        self.incluir_comentarios = incluir_comentarios
+        # Con recuperar=True se anotan todos los errores léxicos (ver Lexico.tokens)
+        self.recuperar = recuperar
+        # Estado del autómata al inicio de cada línea: 0 si no hay un token
+        # a medias, ESTADO_COMENTARIO o ESTADO_DESCONOCIDO
+        self.estados_lineas = array('i', [0])
+        self.analizado = False
+        # Caracteres que recorrió el último análisis
+        self.caracteres_analizados = 0
+    
+    def analizar(self, incluir_comentarios=None, recuperar=None):
+        if incluir_comentarios is not None:
+            self.incluir_comentarios = incluir_comentarios
+        if recuperar is not None:
+            self.recuperar = recuperar
+        self.tabla_tokens = TablaTokens()
+        self._inicios_lineas = array('q', [0])
+        self.estados_lineas = array('i', [0])
+        self.errores_lexicos = []
+        self.analizado = True
+        self._reanalizar(0, len(self.codigo_fuente), 0, resincronizar=False)
+        return self.codigo_error, self.token_error
+    
+    def actualizar(self, codigo_fuente):
+        """Analiza el código editado reutilizando los tokens anteriores a la
+        línea dañada y los posteriores a la resincronización"""
+        anterior = self.codigo_fuente
+        self.codigo_fuente = codigo_fuente
+        if not self.analizado:
+            return self.analizar()
+        if codigo_fuente == anterior:
+            self.caracteres_analizados = 0
+            return self.codigo_error, self.token_error
+        
+        prefijo = _prefijo_comun(anterior, codigo_fuente)
+        limite = min(len(anterior), len(codigo_fuente)) - prefijo
+        sufijo = _sufijo_comun(anterior, codigo_fuente, limite)
+        self._reanalizar(prefijo, len(codigo_fuente) - sufijo, len(codigo_fuente) - len(anterior))
+        return self.codigo_error, self.token_error
+    
+    def _reanalizar(self, inicio_cambio, fin_cambio, corrimiento, resincronizar=True):
+        """El código cambió en [inicio_cambio, fin_cambio) y lo que sigue se
+        corrió en corrimiento caracteres respecto del análisis anterior"""
+        codigo_fuente = self.codigo_fuente
+        tabla = self.tabla_tokens
+        inicios_lineas = self._inicios_lineas
+        estados = self.estados_lineas
+        incluir_comentarios = self.incluir_comentarios
+        
+        # Se retrocede hasta una línea que empiece con el autómata en reposo
+        linea = bisect_right(inicios_lineas, inicio_cambio) - 1
+        while estados[linea] != 0:
+            linea -= 1
+        desde = inicios_lineas[linea]
+        primero = bisect_left(tabla.inicios, desde)
+        
+        # Los comentarios siempre se piden: el corto consume su fin de línea
+        parcial = Lexico("")
+        parcial._trozos = lambda: _trozos_cadena(codigo_fuente, desde, TAMANIO_TROZO_EDICION)
+        generador = parcial.tokens(True, self.recuperar)
+        
+        nuevos = []
+        nuevas_lineas = array('q', [desde])
+        nuevos_estados = array('i')
+        siguiente_linea = 1
+        # Línea anterior donde se retoman los tokens viejos
+        retomada = None
+        for valor, tipo, inicio, fin in generador:
+            if incluir_comentarios or (tipo != Tipos.LIN_COMENTARIO and tipo != Tipos.LIN_HASH):
+                nuevos.append((valor, tipo, desde + inicio, desde + fin))
+            
+            relativas = parcial._inicios_lineas
+            while siguiente_linea < len(relativas) and relativas[siguiente_linea] <= fin:
+                inicio_linea = relativas[siguiente_linea]
+                siguiente_linea += 1
+                if inicio_linea == fin and (tipo == Tipos.LIN_EOLN or tipo == Tipos.LIN_HASH):
+                    estado = 0
+                elif tipo == Tipos.LIN_COMENTARIO and inicio < inicio_linea < fin:
+                    estado = ESTADO_COMENTARIO
+                else:
+                    estado = ESTADO_DESCONOCIDO
+                nuevas_lineas.append(desde + inicio_linea)
+                nuevos_estados.append(estado)
+                
+                # Después del cambio, una línea que empieza en reposo aquí y
+                # en el análisis anterior tiene por delante los mismos tokens
+                if estado == 0 and resincronizar and desde + inicio_linea >= fin_cambio:
+                    posicion_anterior = desde + inicio_linea - corrimiento
+                    indice = bisect_left(inicios_lineas, posicion_anterior)
+                    if (indice < len(inicios_lineas) and inicios_lineas[indice] == posicion_anterior
+                            and estados[indice] == 0):
+                        retomada = indice
+                        break
+            if retomada is not None:
+                break
+        generador.close()
+        
+        nueva = TablaTokens()
+        nueva.llenar(nuevos)
+        nueva.ubicar(nuevas_lineas, linea + 1)
+        
+        if retomada is not None:
+            ultimo = bisect_left(tabla.inicios, inicios_lineas[retomada])
+            corrimiento_lineas = linea + len(nuevos_estados) - retomada
+            cola_lineas = inicios_lineas[retomada + 1:]
+            if corrimiento:
+                cola_lineas = array('q', map(corrimiento.__add__, cola_lineas))
+            cola_estados = estados[retomada + 1:]
+            # Los errores de las líneas retomadas se corren con ellas
+            errores_cola = [dict(error, linea=error['linea'] + corrimiento_lineas)
+                            for error in self.errores_lexicos if error['linea'] > retomada]
+            self.caracteres_analizados = nuevas_lineas[-1] - desde
+        else:
+            # Sin resincronización el análisis llegó al final o a un error
+            ultimo = len(tabla)
+            corrimiento_lineas = 0
+            relativas = parcial._inicios_lineas
+            cola_lineas = array('q', (desde + inicio_linea for inicio_linea in relativas[siguiente_linea:]))
+            cola_estados = array('i', [ESTADO_DESCONOCIDO] * len(cola_lineas))
+            errores_cola = []
+            self.caracteres_analizados = len(codigo_fuente) - desde
+        
+        # Se conservan los errores anteriores a la línea retomada; el análisis
+        # parcial cuenta las líneas desde ella
+        self.errores_lexicos = (
+            [error for error in self.errores_lexicos if error['linea'] <= linea]
+            + [dict(error, linea=error['linea'] + linea) for error in parcial.errores_lexicos]
+            + errores_cola
+        )
+        if self.errores_lexicos:
+            self.codigo_error = self.errores_lexicos[0]['codigo']
+            self.token_error = self.errores_lexicos[0]['token']
+        elif retomada is None:
+            self.codigo_error = parcial.codigo_error
+            self.token_error = parcial.token_error
+        elif self.codigo_error != Tipos.ERROR_NINGUNO:
+            # El único error estaba en las líneas que se volvieron a analizar
+            self.codigo_error = Tipos.ERROR_NINGUNO
+            self.token_error = ""
+        
+        tabla.empalmar(primero, ultimo, nueva, corrimiento, corrimiento_lineas)
+        self._inicios_lineas = inicios_lineas[:linea] + nuevas_lineas + cola_lineas
+        self.estados_lineas = estados[:linea + 1] + nuevos_estados + cola_estados
+        self.numero_lineas = tabla.tipos.count(Tipos.LIN_EOLN)
+
+
 TIPO_ENTERO = Tipos.ENTERO
 TIPO_FLOTANTE = Tipos.FLOTANTE
 TIPO_CADENA = Tipos.CADENA
@@ -589,4 +1143,5 @@ LIN_PIPE = Tipos.LIN_PIPE
 LIN_EXCLAMACION = Tipos.LIN_EXCLAMACION
 LIN_AND = Tipos.LIN_AND
 LIN_OR = Tipos.LIN_OR
-LIN_NOT = Tipos.LIN_NOT
\ No newline at end of file
+LIN_NOT = Tipos.LIN_NOT
+LIN_ERROR = Tipos.LIN_ERROR
\ No newline at end of file
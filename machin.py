@@ -1,9 +1,97 @@
 """
 maquina_virtual
 """
+
+import sys
+from array import array
+from collections import deque
+
+from bytecod import Instrucciones, ProgramaCompacto
+from salidas import SalidaCircular
+from verificador import VerificadorBytecode
+from cierres import compilar_cierres
+from trazas import CompiladorTrazas
+
+
+class ErrorEjecucion(Exception):
+    """Error del programa en ejecución, se reporta sin traza de Python"""
+    pass
+
+
+# Tipo de elemento -> código de array para los arreglos numéricos. Se compara
+# el tipo exacto: bool no se guarda como entero ni un entero como flotante
+TIPOS_ARREGLO = {
+    int: 'q',
+    float: 'd',
+}
+TIPOS_ARREGLO_INVERSO = {tipo: clase for clase, tipo in TIPOS_ARREGLO.items()}
+
+# Profundidad máxima de llamadas anidadas antes de reportar un desbordamiento
+LIMITE_LLAMADAS = 10000
+
+# Formas de ejecutar el byte-code: despacho por tabla de manejadores, una
+# cadena de cierres con los operandos ya resueltos (ver cierres.py) o el
+# intérprete compilando los ciclos más ejecutados (ver trazas.py)
+MODO_INTERPRETE = "interprete"
+MODO_CIERRES = "cierres"
+MODO_JIT = "jit"
+MODOS_EJECUCION = (MODO_INTERPRETE, MODO_CIERRES, MODO_JIT)
+
+
+def convertir_entrada(entrada):
+    """Convierte el texto leído al valor que se guarda en la variable.
+    Retorna el valor y el texto con el que se muestra la entrada"""
+    try:
+        # Intentar convertir a número
+        if entrada.isdigit():
+            valor = int(entrada)
+        elif '.' in entrada and entrada.replace('.', '').isdigit():
+            valor = float(entrada)
+        else:
+            valor = entrada
+        return valor, f"{valor}"
+    except ValueError:
+        return entrada, f"'{entrada}'"
+
+
+def validar_indice(nombre, arreglo, indice):
+    """Retorna el índice como entero o lanza ErrorEjecucion si está fuera de rango"""
+    if isinstance(indice, float) and indice.is_integer():
+        indice = int(indice)
+    if type(indice) is not int or not 0 <= indice < len(arreglo):
+        raise ErrorEjecucion(
+            f"Índice fuera de rango: {nombre}[{indice}] "
+            f"(tamaño {len(arreglo)})"
+        )
+    return indice
+
+
+def mensaje_error_ejecucion(mensaje, linea=None):
+    """Texto con el que se reporta un error del programa en ejecución"""
+    if linea is None:
+        return f"ERROR en ejecución: {mensaje}"
+    return f"ERROR en ejecución en la línea {linea}: {mensaje}"
+
+
+def _leer_archivo(ruta, codificacion):
+    # El archivo se abre al pedir la primera entrada y se cierra al agotarse
+    with open(ruta, "r", encoding=codificacion) as archivo:
+        yield from archivo
+
+
+def _leer_entrada_estandar():
+    # sys.stdin se resuelve al leer para respetar redirecciones
+    yield from sys.stdin
+
+
 class ManejadorEntrada:
+    """Entradas de las instrucciones leer. Primero se consumen las entradas
+    predefinidas, luego las fuentes perezosas en el orden en que se
+    agregaron y por último el callback interactivo"""
+    
     def __init__(self):
-        self.entradas_pendientes = []
+        self.entradas_pendientes = deque()
+        self.fuentes = deque()
         self.callback_entrada = None
     
     def configurar_entrada_interactiva(self, callback):
@@ -14,11 +102,31 @@ class ManejadorEntrada:
         """Agrega entradas predefinidas para pruebas"""
         self.entradas_pendientes.extend(entradas)
     
+    def agregar_fuente(self, fuente):
+        """Agrega un iterable que se consume solo a medida que se piden entradas"""
+        self.fuentes.append(iter(fuente))
+    
+    def agregar_archivo(self, ruta, codificacion="utf-8"):
+        """Toma las entradas de un archivo, una por línea, sin cargarlo completo"""
+        self.agregar_fuente(_leer_archivo(ruta, codificacion))
+    
+    def agregar_entrada_estandar(self):
+        """Toma las entradas de la entrada estándar, una por línea"""
+        self.agregar_fuente(_leer_entrada_estandar())
+    
     def obtener_entrada(self, mensaje=""):
         """Obtiene entrada del usuario"""
         if self.entradas_pendientes:
-            return self.entradas_pendientes.pop(0)
-        elif self.callback_entrada:
+            return self.entradas_pendientes.popleft()
+        
+        while self.fuentes:
+            try:
+                # Las líneas de archivos llegan con su fin de línea
+                return str(next(self.fuentes[0])).rstrip("\r\n")
+            except StopIteration:
+                self.fuentes.popleft()
+        
+        if self.callback_entrada:
             return self.callback_entrada(mensaje)
         else:
             # Valor por defecto para pruebas
@@ -26,327 +134,546 @@ class ManejadorEntrada:
     
     def limpiar_entradas(self):
         """Limpia todas las entradas pendientes"""
-        self.entradas_pendientes = []
+        self.entradas_pendientes.clear()
+        for fuente in self.fuentes:
+            # Cierra los archivos que quedaron abiertos a medio leer
+            cerrar = getattr(fuente, "close", None)
+            if cerrar is not None:
+                cerrar()
+        self.fuentes.clear()
 
 class MaquinaVirtual:
-    def __init__(self):
+    def __init__(self, salida=None, modo=MODO_INTERPRETE):
         self.pila = []
-        self.memoria = {}
+        self.memoria = []
+        self.nombres_variables = []
         self.puntero = 0
-        self.codigo = []
-        self.etiquetas = {}
-        self.salida = []
+        self.programa = ProgramaCompacto()
+        self.despacho = []
+        self.operandos = []
+        self.constantes = []
+        self.salida = salida if salida is not None else SalidaCircular()
+        self.modo = modo
         self.manejador_entrada = ManejadorEntrada()
         self.ejecutando_paso_a_paso = False
         self.pausa_ejecucion = False
         self.arreglos = {} 
+        # Marcos de llamada: (dirección de retorno, base de la pila, locales y
+        # nombres de las locales de la función que llamó)
+        self.marcos = []
+        self.locales = []
+        self.nombres_locales = []
+        self.funciones = {}
+        self.verificador = VerificadorBytecode()
+        self.jit = CompiladorTrazas(self)
+        self.despacho_jit = []
+        self.profundidad_maxima = 0
         self.ultimo_mensaje_impreso = ""
+        self.manejadores = self._crear_tabla_manejadores()
+        
+    def _crear_tabla_manejadores(self):
+        """Construye la tabla de despacho indexada por código de operación"""
+        tabla = {
+            Instrucciones.PUSH: self._op_push,
+            Instrucciones.POP: self._op_pop,
+            Instrucciones.ADD: self._op_add,
+            Instrucciones.SUB: self._op_sub,
+            Instrucciones.MUL: self._op_mul,
+            Instrucciones.DIV: self._op_div,
+            Instrucciones.STORE: self._op_store,
+            Instrucciones.LOAD: self._op_load,
+            Instrucciones.PRINT: self._op_print,
+            Instrucciones.READ: self._op_read,
+            Instrucciones.JMP: self._op_jmp,
+            Instrucciones.JMPZ: self._op_jmpz,
+            Instrucciones.JMPNZ: self._op_jmpnz,
+            Instrucciones.CALL: self._op_call,
+            Instrucciones.RET: self._op_ret,
+            Instrucciones.HALT: self._op_halt,
+            Instrucciones.EQ: self._op_eq,
+            Instrucciones.NEQ: self._op_neq,
+            Instrucciones.GT: self._op_gt,
+            Instrucciones.LT: self._op_lt,
+            Instrucciones.GTE: self._op_gte,
+            Instrucciones.LTE: self._op_lte,
+            Instrucciones.RETVAL: self._op_retval,
+            Instrucciones.STORE_ARR: self._op_store_arr,
+            Instrucciones.LOAD_ARR: self._op_load_arr,
+            Instrucciones.ARR_SIZE: self._op_arr_size,
+            Instrucciones.DUP: self._op_dup,
+            Instrucciones.SWAP: self._op_swap,
+            Instrucciones.AND: self._op_and,
+            Instrucciones.OR: self._op_or,
+            Instrucciones.NOT: self._op_not,
+            Instrucciones.INC: self._op_inc,
+            Instrucciones.EQ_JMPZ: self._op_eq_jmpz,
+            Instrucciones.NEQ_JMPZ: self._op_neq_jmpz,
+            Instrucciones.GT_JMPZ: self._op_gt_jmpz,
+            Instrucciones.LT_JMPZ: self._op_lt_jmpz,
+            Instrucciones.GTE_JMPZ: self._op_gte_jmpz,
+            Instrucciones.LTE_JMPZ: self._op_lte_jmpz,
+            Instrucciones.NEW_ARR: self._op_new_arr,
+            Instrucciones.LOAD_LOCAL: self._op_load_local,
+            Instrucciones.STORE_LOCAL: self._op_store_local,
+            Instrucciones.READ_LOCAL: self._op_read_local,
+        }
+        # Un manejador por cada valor posible de un código de operación
+        return [tabla.get(codigo, self._op_nada) for codigo in range(256)]
+        
+    def cargar_codigo(self, programa, variables=None):
+        """Carga el byte-code en la máquina virtual. Acepta un ProgramaCompacto
+        o una lista de instrucciones enlazada junto con su tabla de variables"""
+        if not isinstance(programa, ProgramaCompacto):
+            programa = ProgramaCompacto.desde_instrucciones(programa, variables)
+        
+        # Lanza ErrorVerificacion si el byte-code puede vaciar la pila o
+        # llegar a una instrucción con profundidades distintas
+        self.profundidad_maxima = self.verificador.verificar(programa)
         
-    def cargar_codigo(self, codigo):
-        """Carga el byte-code en la máquina virtual"""
-        self.codigo = codigo
+        self.programa = programa
+        # Los manejadores se resuelven una sola vez por instrucción. Se usan listas
+        # porque indexar un array crea un objeto entero nuevo en cada lectura
+        self.despacho = [self.manejadores[codigo_inst] for codigo_inst in programa.operaciones]
+        self.operandos = programa.operandos.tolist()
+        # En modo JIT los saltos hacia atrás cuentan las iteraciones de su ciclo
+        self.despacho_jit = [
+            self._op_jmp_atras if codigo_inst == Instrucciones.JMP and operando <= puntero else manejador
+            for puntero, (codigo_inst, operando, manejador)
+            in enumerate(zip(programa.operaciones, self.operandos, self.despacho))
+        ]
+        self.jit.reiniciar()
+        self.constantes = programa.constantes
+        self.nombres_variables = programa.variables
+        self.memoria = [0] * len(self.nombres_variables)
         self.arreglos = {} #Limpiar arreglos
-        self._mapear_etiquetas()
         
-    def _mapear_etiquetas(self):
-        """Mapea las etiquetas a sus posiciones en el código"""
-        for i, instruccion in enumerate(self.codigo):
-            if isinstance(instruccion[0], str) and instruccion[0].endswith(':'):
-                self.etiquetas[instruccion[0][:-1]] = i
+        # Dirección de entrada -> (parámetros, locales) de cada función
+        self.funciones = {}
+        for funcion in programa.funciones:
+            direccion = programa.etiquetas.get(funcion['etiqueta'])
+            if direccion is not None:
+                self.funciones[direccion] = (funcion['parametros'], funcion['locales'])
     
     def configurar_entradas(self, entradas):
         """Configura entradas predefinidas para pruebas"""
         self.entradas = entradas
         self.indice_entrada = 0
         
+    def configurar_salida(self, salida):
+        """Cambia el destino de la salida (ver salidas.py)"""
+        self.salida = salida
+        
     def obtener_salida(self):
-        """Retorna la salida generada durante la ejecución"""
-        return self.salida
+        """Retorna la salida conservada por el destino configurado"""
+        return self.salida.lineas()
         
     def limpiar_salida(self):
         """Limpia la salida acumulada"""
-        self.salida = []
+        self.salida.limpiar()
     
-    def ejecutar(self):
-        """Ejecuta el byte-code cargado"""
+    def ejecutar(self, modo=None, perfilador=None):
+        """Ejecuta el byte-code cargado. El modo (MODOS_EJECUCION) reemplaza
+        para esta ejecución el de la máquina. Con un Perfilador (ver
+        perfilador.py) se usa un ciclo instrumentado del intérprete"""
+        modo = modo if modo is not None else self.modo
+        if modo not in MODOS_EJECUCION:
+            raise ValueError(f"Modo de ejecución desconocido: {modo}")
+        
         self.puntero = 0
         self.pila = []
-        self.memoria = {}
-        self.salida = []
+        # Todas las variables inician con el valor por defecto 0
+        self.memoria = [0] * len(self.nombres_variables)
+        self.marcos = []
+        self.locales = []
+        self.nombres_locales = []
+        self.salida.limpiar()
         
-        # Asegurar que puntero sea entero
-        self.puntero = int(self.puntero)
+        # El perfilado siempre mide los manejadores del intérprete
+        despacho = self.despacho_jit if modo == MODO_JIT and perfilador is None else self.despacho
+        operandos = self.operandos
+        total = len(despacho)
+        puntero = 0
         
-        while self.puntero < len(self.codigo):
-            instruccion = self.codigo[self.puntero]
-            
-            if isinstance(instruccion[0], str) and instruccion[0].endswith(':'):
-                self.puntero += 1
-                continue
-                
-            opcode = instruccion[0]
-            
-            try:
-                if opcode == 0:  # PUSH
-                    self.pila.append(instruccion[1])
-                elif opcode == 1:  # POP
-                    if self.pila:
-                        self.pila.pop()
-                elif opcode == 2:  # ADD
-                    if len(self.pila) >= 2:
-                        b = self.pila.pop()
-                        a = self.pila.pop()
-                        if isinstance(a, str) or isinstance(b, str):
-                            self.pila.append(str(a) + str(b))
-                        else:    
-                            self.pila.append(a + b)        
-                elif opcode == 3:  # SUB
-                    if len(self.pila) >= 2:
-                        b = self.pila.pop()
-                        a = self.pila.pop()
-                        self.pila.append(a - b)
-                elif opcode == 4:  # MUL
-                    if len(self.pila) >= 2:
-                        b = self.pila.pop()
-                        a = self.pila.pop()
-                        self.pila.append(a * b)
-                elif opcode == 5:  # DIV
-                    if len(self.pila) >= 2:
-                        b = self.pila.pop()
-                        a = self.pila.pop()
-                        if b != 0:
-                            self.pila.append(a / b)
-                        else:
-                            self.salida.append("ERROR: División por cero")
-                elif opcode == 6:  # STORE
-                    if self.pila:
-                        valor = self.pila.pop()
-                        self.memoria[instruccion[1]] = valor
-                elif opcode == 7:  # LOAD
-                    if instruccion[1] in self.memoria:
-                        self.pila.append(self.memoria[instruccion[1]])
-                    else:
-                        self.pila.append(0)  # Valor por defecto
-                elif opcode == 8:  # PRINT
-                    if self.pila:
-                        valor = self.pila.pop()
-                        self.salida.append(str(valor))
-                        self.ultimo_mensaje_impreso = str(valor)
-                        print(f"SALIDA: {valor}")
-                    else:
-                        self.salida.append("ERROR: Pila vacía al intentar imprimir")
-                elif opcode == 9:  # READ
-                    variable = instruccion[1]
-                    mensaje = self.ultimo_mensaje_impreso if self.ultimo_mensaje_impreso else f"Ingrese {variable}:"
-                    entrada = self.manejador_entrada.obtener_entrada(mensaje)
-                    self.ultimo_mensaje_impreso = "" 
-                    try:
-                        # Intentar convertir a número
-                        if entrada.isdigit():
-                            valor = int(entrada)
-                        elif '.' in entrada and entrada.replace('.', '').isdigit():
-                            valor = float(entrada)
-                        else:
-                            valor = entrada
-                            
-                        self.memoria[variable] = valor
-                        self.salida.append(f"[ENTRADA] {variable} = {valor}")
-                    except ValueError:
-                        self.memoria[variable] = entrada
-                        self.salida.append(f"[ENTRADA] {variable} = '{entrada}'")
-                elif opcode == 10:  # JMP
-                    if instruccion[1] in self.etiquetas:
-                        self.puntero = self.etiquetas[instruccion[1]]
-                        continue
-                elif opcode == 11:  # JMPZ
-                    if self.pila and instruccion[1] in self.etiquetas:
-                        valor = self.pila.pop()
-                        if valor == 0:
-                            self.puntero = self.etiquetas[instruccion[1]]
-                            continue
-                elif opcode == 12:  # JMPNZ
-                    if self.pila and instruccion[1] in self.etiquetas:
-                        if self.pila.pop() != 0:
-                            self.puntero = self.etiquetas[instruccion[1]]
-                            continue
-                elif opcode == 13:  # CALL
-                    # Guardar posición de retorno (la siguiente instrucción)
-                    self.pila.append(self.puntero + 1)
-                    # Saltar a función
-                    if instruccion[1] in self.etiquetas:
-                        self.puntero = self.etiquetas[instruccion[1]]
-                        continue
-                elif opcode == 14:  # RET
-                    # Retornar a posición guardada (sin sumar +1)
-                    if self.pila:
-                        direccion_retorno = self.pila.pop()
-                        self.puntero = int(direccion_retorno)  # ← QUITAR el +1
-                        continue
-                elif opcode == 15:  # HALT
-                    break
-                elif opcode == 16:  # EQ
-                    if len(self.pila) >= 2:
-                        b = self.pila.pop()
-                        a = self.pila.pop()
-                        self.pila.append(1 if a == b else 0)
-                elif opcode == 17:  # NEQ
-                    if len(self.pila) >= 2:
-                        b = self.pila.pop()
-                        a = self.pila.pop()
-                        self.pila.append(1 if a != b else 0)
-                elif opcode == 18:  # GT
-                    if len(self.pila) >= 2:
-                        b = self.pila.pop()
-                        a = self.pila.pop()
-                        self.pila.append(1 if a > b else 0)
-                elif opcode == 19:  # LT
-                    if len(self.pila) >= 2:
-                        b = self.pila.pop()
-                        a = self.pila.pop()
-                        self.pila.append(1 if a < b else 0)
-                elif opcode == 20:  # GTE
-                    if len(self.pila) >= 2:
-                        b = self.pila.pop()
-                        a = self.pila.pop()
-                        self.pila.append(1 if a >= b else 0)
-                elif opcode == 21:  # LTE
-                    if len(self.pila) >= 2:
-                        b = self.pila.pop()
-                        a = self.pila.pop()
-                        self.pila.append(1 if a <= b else 0)
-                elif opcode == 22:  # RETVAL
-                    # El valor de retorno está en el tope de la pila
-                    valor_retorno = self.pila.pop() if self.pila else None
-                    
-                    # Retornar a posición guardada
-                    if self.pila:
-                        direccion_retorno = self.pila.pop()
-                        self.puntero = int(direccion_retorno)
-                        
-                        # Poner el valor de retorno en la pila para que lo use el llamador
-                        if valor_retorno is not None:
-                            self.pila.append(valor_retorno)
-                    continue
-                elif opcode == 23:  # STORE_ARR
-                    if len(self.pila) >= 2:
-                        valor = self.pila.pop()
-                        indice = self.pila.pop()
-                        nombre_arreglo = instruccion[1]
-                        
-                        # Inicializar arreglo si no existe
-                        if nombre_arreglo not in self.arreglos:
-                            self.arreglos[nombre_arreglo] = {}
-                        
-                        # Almacenar valor
-                        self.arreglos[nombre_arreglo][indice] = valor
-                elif opcode == 24:  # LOAD_ARR
-                    if self.pila:
-                        indice = self.pila.pop()
-                        nombre_arreglo = instruccion[1]
-                        
-                        # Cargar valor del arreglo
-                        if (nombre_arreglo in self.arreglos and 
-                            indice in self.arreglos[nombre_arreglo]):
-                            self.pila.append(self.arreglos[nombre_arreglo][indice])
-                        else:
-                            # Valor por defecto si no existe
-                            self.pila.append(0)
-                elif opcode == 25:  # ARR_SIZE
-                    nombre_arreglo = instruccion[1]
-                    if nombre_arreglo in self.arreglos:
-                        # Para arreglos simples, usar máximo índice + 1
-                        indices = list(self.arreglos[nombre_arreglo].keys())
-                        if indices:
-                            self.pila.append(max(indices) + 1)
-                        else:
-                            self.pila.append(0)
-                    else:
-                        self.pila.append(0)
-                elif opcode == 26:  # DUP
-                    if self.pila:
-                        self.pila.append(self.pila[-1])
-                elif opcode == 27:  # SWAP
-                    if len(self.pila) >= 2:
-                        a = self.pila.pop()
-                        b = self.pila.pop()
-                        self.pila.append(a)
-                        self.pila.append(b)
-                elif opcode == 28:  # AND
-                    if len(self.pila) >= 2:
-                        b = self.pila.pop()
-                        a = self.pila.pop()
-                        # Convertir a booleanos para la operación AND
-                        resultado = 1 if (a and b) else 0
-                        self.pila.append(resultado)
-                elif opcode == 29:  # OR
-                    if len(self.pila) >= 2:
-                        b = self.pila.pop()
-                        a = self.pila.pop()
-                        # Convertir a booleanos para la operación OR
-                        resultado = 1 if (a or b) else 0
-                        self.pila.append(resultado)
-                elif opcode == 30:  # NOT
-                    if self.pila:
-                        valor = self.pila.pop()
-                        # Convertir a booleano para la operación NOT
-                        resultado = 1 if not valor else 0
-                        self.pila.append(resultado)
-            except Exception as e:
-                self.salida.append(f"ERROR en ejecución: {str(e)}")
-                import traceback
-                self.salida.append(traceback.format_exc())
-                break
-                
-            self.puntero += 1
+        try:
+            if perfilador is not None:
+                perfilador.iniciar(self.programa)
+                operaciones = self.programa.operaciones
+                conteo_operaciones = perfilador.conteo_operaciones
+                tiempo_operaciones = perfilador.tiempo_operaciones
+                conteo_instrucciones = perfilador.conteo_instrucciones
+                reloj = perfilador.reloj
+                # (dirección, inicio) de las llamadas en curso
+                llamadas = []
+                inicio_ejecucion = reloj()
+                try:
+                    while puntero < total:
+                        codigo_inst = operaciones[puntero]
+                        inicio = reloj()
+                        siguiente = despacho[puntero](operandos[puntero], puntero)
+                        fin = reloj()
+                        conteo_operaciones[codigo_inst] += 1
+                        tiempo_operaciones[codigo_inst] += fin - inicio
+                        conteo_instrucciones[puntero] += 1
+                        if codigo_inst == Instrucciones.CALL:
+                            llamadas.append((operandos[puntero], inicio))
+                        elif codigo_inst in (Instrucciones.RET, Instrucciones.RETVAL):
+                            direccion, inicio_llamada = llamadas.pop()
+                            perfilador.registrar_llamada(direccion, fin - inicio_llamada)
+                        puntero = siguiente
+                finally:
+                    perfilador.tiempo_total += reloj() - inicio_ejecucion
+            elif modo == MODO_CIERRES:
+                # Los cierres capturan la pila y la memoria recién creadas
+                cierres = compilar_cierres(self)
+                while puntero < total:
+                    puntero = cierres[puntero]()
+            else:
+                while puntero < total:
+                    puntero = despacho[puntero](operandos[puntero], puntero)
+        except ErrorEjecucion as e:
+            self.salida.escribir(self._mensaje_error(e, puntero))
+        except Exception as e:
+            self.salida.escribir(self._mensaje_error(e, puntero))
+            import traceback
+            self.salida.escribir(traceback.format_exc())
+        finally:
+            self.puntero = puntero
+            self.salida.vaciar()
+    
+    def _mensaje_error(self, error, puntero):
+        """Mensaje del error con la línea de la instrucción que falló. Las
+        trazas compiladas indican la posición en el atributo puntero"""
+        linea = self.programa.linea(getattr(error, 'puntero', puntero))
+        return mensaje_error_ejecucion(str(error), linea)
+    
+    # Manejadores de instrucciones: reciben el operando y el puntero actual
+    # y devuelven la posición de la siguiente instrucción a ejecutar. No
+    # revisan la pila: cargar_codigo solo acepta byte-code verificado
+    
+    def _op_nada(self, operando, puntero):
+        return puntero + 1
+    
+    def _op_push(self, operando, puntero):
+        self.pila.append(self.constantes[operando])
+        return puntero + 1
+    
+    def _op_pop(self, operando, puntero):
+        self.pila.pop()
+        return puntero + 1
+    
+    def _op_add(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        a = pila.pop()
+        if isinstance(a, str) or isinstance(b, str):
+            pila.append(str(a) + str(b))
+        else:    
+            pila.append(a + b)
+        return puntero + 1
+    
+    def _op_sub(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        pila[-1] = pila[-1] - b
+        return puntero + 1
+    
+    def _op_mul(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        pila[-1] = pila[-1] * b
+        return puntero + 1
+    
+    def _op_div(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        if b == 0:
+            raise ErrorEjecucion("División por cero")
+        pila[-1] = pila[-1] / b
+        return puntero + 1
+    
+    def _op_store(self, operando, puntero):
+        self.memoria[operando] = self.pila.pop()
+        return puntero + 1
+    
+    def _op_load(self, operando, puntero):
+        self.pila.append(self.memoria[operando])
+        return puntero + 1
+    
+    def _op_print(self, operando, puntero):
+        texto = str(self.pila.pop())
+        self.salida.escribir(texto)
+        self.ultimo_mensaje_impreso = texto
+        return puntero + 1
+    
+    def _op_read(self, operando, puntero):
+        self.memoria[operando] = self._leer_valor(self.nombres_variables[operando])
+        return puntero + 1
+    
+    def _op_read_local(self, operando, puntero):
+        self.locales[operando] = self._leer_valor(self.nombres_locales[operando])
+        return puntero + 1
+    
+    def _leer_valor(self, variable):
+        mensaje = self.ultimo_mensaje_impreso if self.ultimo_mensaje_impreso else f"Ingrese {variable}:"
+        # El mensaje pendiente debe verse antes de esperar la entrada
+        self.salida.vaciar()
+        entrada = self.manejador_entrada.obtener_entrada(mensaje)
+        self.ultimo_mensaje_impreso = "" 
+        valor, texto = convertir_entrada(entrada)
+        self.salida.escribir(f"[ENTRADA] {variable} = {texto}")
+        return valor
+    
+    def _op_load_local(self, operando, puntero):
+        self.pila.append(self.locales[operando])
+        return puntero + 1
+    
+    def _op_store_local(self, operando, puntero):
+        self.locales[operando] = self.pila.pop()
+        return puntero + 1
+    
+    def _op_jmp(self, operando, puntero):
+        return operando
+    
+    def _op_jmp_atras(self, operando, puntero):
+        return self.jit.saltar_atras(operando, puntero)
+    
+    def _op_jmpz(self, operando, puntero):
+        if self.pila.pop() == 0:
+            return operando
+        return puntero + 1
+    
+    def _op_jmpnz(self, operando, puntero):
+        if self.pila.pop() != 0:
+            return operando
+        return puntero + 1
+    
+    def _op_call(self, operando, puntero):
+        parametros, nombres_locales = self.funciones[operando]
+        if len(self.marcos) >= LIMITE_LLAMADAS:
+            raise ErrorEjecucion("Desbordamiento de la pila de llamadas")
+        
+        # Los argumentos pasan de la pila a las primeras variables locales
+        pila = self.pila
+        base = len(pila) - parametros
+        locales = pila[base:]
+        del pila[base:]
+        locales.extend([0] * (len(nombres_locales) - parametros))
+        
+        self.marcos.append((puntero + 1, base, self.locales, self.nombres_locales))
+        self.locales = locales
+        self.nombres_locales = nombres_locales
+        return operando
+    
+    def _retornar(self, valor):
+        """Descarta el marco actual y deja el valor de retorno sobre la pila
+        del llamador, sin importar lo que la función dejó apilado"""
+        direccion_retorno, base, self.locales, self.nombres_locales = self.marcos.pop()
+        del self.pila[base:]
+        self.pila.append(valor)
+        return direccion_retorno
+    
+    def _op_ret(self, operando, puntero):
+        # Una función sin valor de retorno produce 0
+        return self._retornar(0)
+    
+    def _op_halt(self, operando, puntero):
+        return len(self.despacho)
+    
+    def _op_eq(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        pila[-1] = 1 if pila[-1] == b else 0
+        return puntero + 1
+    
+    def _op_neq(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        pila[-1] = 1 if pila[-1] != b else 0
+        return puntero + 1
+    
+    def _op_gt(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        pila[-1] = 1 if pila[-1] > b else 0
+        return puntero + 1
+    
+    def _op_lt(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        pila[-1] = 1 if pila[-1] < b else 0
+        return puntero + 1
+    
+    def _op_gte(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        pila[-1] = 1 if pila[-1] >= b else 0
+        return puntero + 1
+    
+    def _op_lte(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        pila[-1] = 1 if pila[-1] <= b else 0
+        return puntero + 1
+    
+    def _op_retval(self, operando, puntero):
+        # El valor de retorno está en el tope de la pila
+        return self._retornar(self.pila.pop())
+    
+    def _op_new_arr(self, operando, puntero):
+        pila = self.pila
+        valor_por_defecto = pila.pop()
+        tamanio = pila.pop()
+        # Los arreglos numéricos usan almacenamiento contiguo sin objetos por elemento
+        tipo = TIPOS_ARREGLO.get(type(valor_por_defecto))
+        if tipo is not None:
+            arreglo = array(tipo, [valor_por_defecto]) * tamanio
+        else:
+            arreglo = [valor_por_defecto] * tamanio
+        self.arreglos[self.constantes[operando]] = arreglo
+        return puntero + 1
+    
+    def _obtener_arreglo(self, operando):
+        arreglo = self.arreglos.get(self.constantes[operando])
+        if arreglo is None:
+            raise ErrorEjecucion(f"Arreglo no inicializado: {self.constantes[operando]}")
+        return arreglo
+    
+    def _validar_indice(self, operando, arreglo, indice):
+        return validar_indice(self.constantes[operando], arreglo, indice)
+    
+    def _op_store_arr(self, operando, puntero):
+        valor = self.pila.pop()
+        indice = self.pila.pop()
+        arreglo = self._obtener_arreglo(operando)
+        if type(indice) is not int or not 0 <= indice < len(arreglo):
+            indice = self._validar_indice(operando, arreglo, indice)
+        
+        if type(arreglo) is array and type(valor) is not TIPOS_ARREGLO_INVERSO[arreglo.typecode]:
+            # El valor no cabe en el arreglo tipado: se pasa a una lista
+            arreglo = list(arreglo)
+            self.arreglos[self.constantes[operando]] = arreglo
+        try:
+            arreglo[indice] = valor
+        except OverflowError:
+            arreglo = list(arreglo)
+            self.arreglos[self.constantes[operando]] = arreglo
+            arreglo[indice] = valor
+        return puntero + 1
+    
+    def _op_load_arr(self, operando, puntero):
+        pila = self.pila
+        indice = pila[-1]
+        arreglo = self._obtener_arreglo(operando)
+        if type(indice) is not int or not 0 <= indice < len(arreglo):
+            indice = self._validar_indice(operando, arreglo, indice)
+        pila[-1] = arreglo[indice]
+        return puntero + 1
+    
+    def _op_arr_size(self, operando, puntero):
+        self.pila.append(len(self._obtener_arreglo(operando)))
+        return puntero + 1
+    
+    def _op_dup(self, operando, puntero):
+        self.pila.append(self.pila[-1])
+        return puntero + 1
+    
+    def _op_swap(self, operando, puntero):
+        pila = self.pila
+        pila[-1], pila[-2] = pila[-2], pila[-1]
+        return puntero + 1
+    
+    def _op_and(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        # Convertir a booleanos para la operación AND
+        pila[-1] = 1 if (pila[-1] and b) else 0
+        return puntero + 1
+    
+    def _op_or(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        # Convertir a booleanos para la operación OR
+        pila[-1] = 1 if (pila[-1] or b) else 0
+        return puntero + 1
+    
+    def _op_not(self, operando, puntero):
+        # Convertir a booleano para la operación NOT
+        self.pila[-1] = 1 if not self.pila[-1] else 0
+        return puntero + 1
+    
+    def _op_inc(self, operando, puntero):
+        # Equivale a LOAD v; PUSH c; ADD; STORE v
+        ranura = operando & Instrucciones.MASCARA_RANURA
+        incremento = self.constantes[operando >> Instrucciones.BITS_RANURA]
+        valor = self.memoria[ranura]
+        if isinstance(valor, str):
+            self.memoria[ranura] = valor + str(incremento)
+        else:
+            self.memoria[ranura] = valor + incremento
+        return puntero + 1
+    
+    # Comparación fusionada con JMPZ: salta cuando la comparación es falsa
+    def _op_eq_jmpz(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        return puntero + 1 if pila.pop() == b else operando
+    
+    def _op_neq_jmpz(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        return puntero + 1 if pila.pop() != b else operando
+    
+    def _op_gt_jmpz(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        return puntero + 1 if pila.pop() > b else operando
+    
+    def _op_lt_jmpz(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        return puntero + 1 if pila.pop() < b else operando
+    
+    def _op_gte_jmpz(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        return puntero + 1 if pila.pop() >= b else operando
+    
+    def _op_lte_jmpz(self, operando, puntero):
+        pila = self.pila
+        b = pila.pop()
+        return puntero + 1 if pila.pop() <= b else operando
     
     def obtener_estado(self):
         """Retorna el estado actual de la máquina"""
         return {
             'pila': self.pila.copy(),
-            'memoria': self.memoria.copy(),
+            'memoria': dict(zip(self.nombres_variables, self.memoria)),
+            'locales': dict(zip(self.nombres_locales, self.locales)),
+            'marcos': len(self.marcos),
             'puntero': self.puntero,
-            'salida': self.salida.copy()
+            'linea': self.programa.linea(self.puntero),
+            'salida': self.salida.lineas()
         }
         
     def ejecutar_paso_a_paso(self):
         """Ejecuta una sola instrucción para depuración"""
-        if self.puntero >= len(self.codigo):
+        if self.puntero >= len(self.despacho):
             return False
             
-        instruccion = self.codigo[self.puntero]
-        
-        if isinstance(instruccion[0], str) and instruccion[0].endswith(':'):
-            self.puntero += 1
-            return True
-            
-        # Ejecutar una instrucción
-        opcode = instruccion[0]
-        self._ejecutar_instruccion(instruccion)
-        
-        if opcode not in [10, 11, 12, 13, 14]:  # Saltos y llamadas
-            self.puntero += 1
+        manejador = self.despacho[self.puntero]
+        self.puntero = manejador(self.operandos[self.puntero], self.puntero)
             
         return True
-
-    def _ejecutar_instruccion(self, instruccion):
-        """Ejecuta una sola instrucción (extraída de ejecutar())"""
-        opcode = instruccion[0]
-    
-        if opcode == 0:  # PUSH
-            self.pila.append(instruccion[1])
-        elif opcode == 13:  # CALL
-            self.pila.append(self.puntero + 1)
-            if instruccion[1] in self.etiquetas:
-                self.puntero = self.etiquetas[instruccion[1]]
-        elif opcode == 14:  # RET
-            if self.pila:
-                direccion_retorno = self.pila.pop()
-                self.puntero = int(direccion_retorno)
                 
     def configurar_entrada_interactiva(self, callback):
         """Configura entrada interactiva desde GUI"""
         self.manejador_entrada.configurar_entrada_interactiva(callback)
         
     def configurar_entradas(self, entradas):
-        """Configura entradas predefinidas para pruebas"""
-        self.manejador_entrada.agregar_entradas(entradas)
\ No newline at end of file
+        """Configura entradas predefinidas para pruebas. Una lista se copia a
+        la cola; cualquier otro iterable (un generador, un archivo abierto)
+        se consume a medida que el programa lee"""
+        if isinstance(entradas, (list, tuple)):
+            self.manejador_entrada.agregar_entradas(entradas)
+        else:
+            self.manejador_entrada.agregar_fuente(entradas)
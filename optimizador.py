@@ -0,0 +1,309 @@
+"""
+Optimizador de mirilla (peephole) sobre el byte-code enlazado
+"""
+
+from bytecod import Instrucciones, ProgramaCompacto
+
+
+ENCADENAR_SALTOS = 'encadenar_saltos'
+SALTOS_MUERTOS = 'saltos_muertos'
+CODIGO_INALCANZABLE = 'codigo_inalcanzable'
+PUSH_POP = 'push_pop'
+INCREMENTOS = 'incrementos'
+COMPARAR_Y_SALTAR = 'comparar_y_saltar'
+STORE_LOAD = 'store_load'
+
+# Optimizaciones disponibles, en el orden en que se aplican
+OPTIMIZACIONES = (
+    ENCADENAR_SALTOS,
+    SALTOS_MUERTOS,
+    CODIGO_INALCANZABLE,
+    PUSH_POP,
+    INCREMENTOS,
+    COMPARAR_Y_SALTAR,
+    STORE_LOAD,
+)
+
+DESCRIPCIONES = {
+    ENCADENAR_SALTOS: "saltos encadenados",
+    SALTOS_MUERTOS: "saltos a la siguiente instrucción eliminados",
+    CODIGO_INALCANZABLE: "instrucciones inalcanzables eliminadas",
+    PUSH_POP: "pares apilar/POP eliminados",
+    INCREMENTOS: "incrementos fusionados en INC",
+    COMPARAR_Y_SALTAR: "comparaciones fusionadas con JMPZ",
+    STORE_LOAD: "STORE/LOAD reemplazados por DUP/STORE",
+}
+
+# Saltos cuyo destino se puede reescribir sin cambiar la semántica
+SALTOS_LOCALES = (frozenset((Instrucciones.JMP, Instrucciones.JMPZ, Instrucciones.JMPNZ))
+                  | frozenset(Instrucciones.COMPARAR_Y_SALTAR.values()))
+
+# Instrucciones que terminan un bloque sin continuar en la siguiente
+SIN_CONTINUACION = frozenset((Instrucciones.JMP, Instrucciones.RET,
+                              Instrucciones.RETVAL, Instrucciones.HALT))
+
+# Instrucciones que solo apilan un valor, sin otros efectos
+APILAN_SIN_EFECTOS = frozenset((Instrucciones.PUSH, Instrucciones.LOAD,
+                                Instrucciones.LOAD_LOCAL, Instrucciones.DUP))
+
+# Guardar -> cargar de la misma variable, para el reenvío STORE/LOAD
+PARES_STORE_LOAD = {
+    Instrucciones.STORE: Instrucciones.LOAD,
+    Instrucciones.STORE_LOCAL: Instrucciones.LOAD_LOCAL,
+}
+
+# Límite de pasadas completas; cada pasada solo puede reducir el programa
+MAXIMO_PASADAS = 16
+
+
+class OptimizadorMirilla:
+    """Aplica reescrituras locales al byte-code enlazado hasta que ya no
+    haya cambios, llevando la cuenta de cada tipo de reescritura"""
+
+    def __init__(self, optimizaciones=None):
+        if optimizaciones is None:
+            optimizaciones = OPTIMIZACIONES
+
+        desconocidas = set(optimizaciones) - set(OPTIMIZACIONES)
+        if desconocidas:
+            raise ValueError(f"Optimización desconocida: {', '.join(sorted(desconocidas))}")
+
+        self.optimizaciones = [nombre for nombre in OPTIMIZACIONES if nombre in optimizaciones]
+        self.reescrituras = dict.fromkeys(OPTIMIZACIONES, 0)
+        self.instrucciones_antes = 0
+        self.instrucciones_despues = 0
+
+    def firma(self):
+        """Identifica la configuración, para no mezclar programas en la caché"""
+        return ",".join(self.optimizaciones)
+
+    def optimizar_programa(self, programa):
+        """Retorna un nuevo ProgramaCompacto optimizado"""
+        # Los tramos de la tabla de líneas viajan como etiquetas con llave
+        # (orden, línea) para que cada pasada ajuste su posición
+        etiquetas = dict(programa.etiquetas)
+        for orden, (posicion, linea) in enumerate(programa.tramos_lineas()):
+            etiquetas[(orden, linea)] = posicion
+
+        codigo, etiquetas = self.optimizar(programa.instrucciones(), etiquetas)
+
+        tramos = sorted((llave, posicion) for llave, posicion in etiquetas.items()
+                        if isinstance(llave, tuple))
+        etiquetas = {llave: posicion for llave, posicion in etiquetas.items()
+                     if not isinstance(llave, tuple)}
+        return ProgramaCompacto.desde_instrucciones(
+            codigo, programa.variables, etiquetas, programa.simbolos,
+            self._funciones_llamadas(codigo, etiquetas, programa.funciones),
+            [(posicion, linea) for (orden, linea), posicion in tramos]
+        )
+
+    def _funciones_llamadas(self, codigo, etiquetas, funciones):
+        """Descarta las funciones que ya no se llaman. La etiqueta de una
+        función eliminada por inalcanzable pasa a la siguiente instrucción,
+        que puede ser la entrada de la función definida después"""
+        llamadas = {instruccion[1] for instruccion in codigo if instruccion[0] == Instrucciones.CALL}
+        por_direccion = {}
+        for funcion in funciones:
+            direccion = etiquetas.get(funcion['etiqueta'])
+            if direccion in llamadas:
+                por_direccion[direccion] = funcion
+        return [funcion for funcion in funciones
+                if por_direccion.get(etiquetas.get(funcion['etiqueta'])) is funcion]
+
+    def optimizar(self, codigo, etiquetas):
+        """Optimiza una lista de instrucciones enlazada.
+        Retorna el código y las etiquetas con las posiciones actualizadas"""
+        self.reescrituras = dict.fromkeys(OPTIMIZACIONES, 0)
+        self.instrucciones_antes = len(codigo)
+
+        codigo = list(codigo)
+        etiquetas = dict(etiquetas)
+        pasadas = {
+            ENCADENAR_SALTOS: self._encadenar_saltos,
+            SALTOS_MUERTOS: self._eliminar_saltos_muertos,
+            CODIGO_INALCANZABLE: self._eliminar_inalcanzable,
+            PUSH_POP: self._eliminar_push_pop,
+            INCREMENTOS: self._fusionar_incrementos,
+            COMPARAR_Y_SALTAR: self._fusionar_comparar_y_saltar,
+            STORE_LOAD: self._reenviar_store_load,
+        }
+
+        for _ in range(MAXIMO_PASADAS):
+            hubo_cambios = False
+            for nombre in self.optimizaciones:
+                codigo, etiquetas, cambios = pasadas[nombre](codigo, etiquetas)
+                self.reescrituras[nombre] += cambios
+                hubo_cambios = hubo_cambios or cambios > 0
+            if not hubo_cambios:
+                break
+
+        self.instrucciones_despues = len(codigo)
+        return codigo, etiquetas
+
+    def resumen(self):
+        """Descripción de las reescrituras aplicadas en la última optimización"""
+        lineas = [f"{self.instrucciones_antes} -> {self.instrucciones_despues} instrucciones"]
+        for nombre in self.optimizaciones:
+            if self.reescrituras[nombre]:
+                lineas.append(f"{self.reescrituras[nombre]} {DESCRIPCIONES[nombre]}")
+        return lineas
+
+    def _encadenar_saltos(self, codigo, etiquetas):
+        """Un salto a un JMP pasa a saltar directamente al destino final"""
+        cambios = 0
+        for posicion, instruccion in enumerate(codigo):
+            if instruccion[0] not in SALTOS_LOCALES:
+                continue
+
+            destino = instruccion[1]
+            visitados = {posicion}
+            while (destino < len(codigo) and destino not in visitados
+                   and codigo[destino][0] == Instrucciones.JMP):
+                visitados.add(destino)
+                destino = codigo[destino][1]
+
+            if destino != instruccion[1]:
+                codigo[posicion] = (instruccion[0], destino)
+                cambios += 1
+        return codigo, etiquetas, cambios
+
+    def _eliminar_saltos_muertos(self, codigo, etiquetas):
+        """Un JMP a la instrucción siguiente se elimina; un salto condicional
+        a la siguiente solo descarta la condición"""
+        eliminadas = set()
+        cambios = 0
+        for posicion, instruccion in enumerate(codigo):
+            if instruccion[0] == Instrucciones.JMP and instruccion[1] == posicion + 1:
+                eliminadas.add(posicion)
+                cambios += 1
+            elif (instruccion[0] in (Instrucciones.JMPZ, Instrucciones.JMPNZ)
+                    and instruccion[1] == posicion + 1):
+                codigo[posicion] = (Instrucciones.POP,)
+                cambios += 1
+        codigo, etiquetas = _compactar(codigo, etiquetas, eliminadas)
+        return codigo, etiquetas, cambios
+
+    def _eliminar_inalcanzable(self, codigo, etiquetas):
+        """Elimina las instrucciones a las que no llega ningún camino desde el inicio"""
+        alcanzables = set()
+        pendientes = [0]
+        while pendientes:
+            posicion = pendientes.pop()
+            if posicion in alcanzables or posicion >= len(codigo):
+                continue
+            alcanzables.add(posicion)
+
+            codigo_inst = codigo[posicion][0]
+            if codigo_inst in Instrucciones.SALTOS:
+                pendientes.append(codigo[posicion][1])
+            # CALL continúa en la siguiente instrucción cuando la función retorna
+            if codigo_inst not in SIN_CONTINUACION:
+                pendientes.append(posicion + 1)
+
+        eliminadas = set(range(len(codigo))) - alcanzables
+        codigo, etiquetas = _compactar(codigo, etiquetas, eliminadas)
+        return codigo, etiquetas, len(eliminadas)
+
+    def _eliminar_push_pop(self, codigo, etiquetas):
+        """Un valor apilado sin efectos y descartado de inmediato no se apila"""
+        lideres = _lideres(codigo)
+        eliminadas = set()
+        posicion = 0
+        while posicion + 1 < len(codigo):
+            if (codigo[posicion][0] in APILAN_SIN_EFECTOS
+                    and codigo[posicion + 1][0] == Instrucciones.POP
+                    and posicion + 1 not in lideres):
+                eliminadas.update((posicion, posicion + 1))
+                posicion += 2
+            else:
+                posicion += 1
+        codigo, etiquetas = _compactar(codigo, etiquetas, eliminadas)
+        return codigo, etiquetas, len(eliminadas) // 2
+
+    def _fusionar_incrementos(self, codigo, etiquetas):
+        """LOAD v; PUSH c; ADD; STORE v con c numérico pasa a ser INC v, c"""
+        lideres = _lideres(codigo)
+        eliminadas = set()
+        posicion = 0
+        while posicion + 3 < len(codigo):
+            cargar, apilar, sumar, guardar = codigo[posicion:posicion + 4]
+            if (cargar[0] == Instrucciones.LOAD and apilar[0] == Instrucciones.PUSH
+                    and sumar[0] == Instrucciones.ADD and guardar[0] == Instrucciones.STORE
+                    and cargar[1] == guardar[1] and _es_numero(apilar[1])
+                    and not lideres.intersection(range(posicion + 1, posicion + 4))):
+                codigo[posicion] = (Instrucciones.INC, (cargar[1], apilar[1]))
+                eliminadas.update(range(posicion + 1, posicion + 4))
+                posicion += 4
+            else:
+                posicion += 1
+        codigo, etiquetas = _compactar(codigo, etiquetas, eliminadas)
+        return codigo, etiquetas, len(eliminadas) // 3
+
+    def _fusionar_comparar_y_saltar(self, codigo, etiquetas):
+        """Una comparación seguida de JMPZ pasa a ser una sola instrucción"""
+        lideres = _lideres(codigo)
+        eliminadas = set()
+        for posicion in range(len(codigo) - 1):
+            comparar, saltar = codigo[posicion], codigo[posicion + 1]
+            fusionada = Instrucciones.COMPARAR_Y_SALTAR.get(comparar[0])
+            if (fusionada is not None and saltar[0] == Instrucciones.JMPZ
+                    and posicion + 1 not in lideres and posicion not in eliminadas):
+                codigo[posicion] = (fusionada, saltar[1])
+                eliminadas.add(posicion + 1)
+        codigo, etiquetas = _compactar(codigo, etiquetas, eliminadas)
+        return codigo, etiquetas, len(eliminadas)
+
+    def _reenviar_store_load(self, codigo, etiquetas):
+        """STORE v; LOAD v duplica el valor antes de guardarlo en lugar de
+        volver a leerlo de memoria"""
+        lideres = _lideres(codigo)
+        cambios = 0
+        for posicion in range(len(codigo) - 1):
+            guardar, cargar = codigo[posicion], codigo[posicion + 1]
+            if (PARES_STORE_LOAD.get(guardar[0]) == cargar[0]
+                    and guardar[1] == cargar[1] and posicion + 1 not in lideres):
+                codigo[posicion] = (Instrucciones.DUP,)
+                codigo[posicion + 1] = guardar
+                cambios += 1
+        return codigo, etiquetas, cambios
+
+
+def _es_numero(valor):
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
+def _lideres(codigo):
+    """Posiciones donde puede comenzar la ejecución además de la anterior:
+    destinos de salto y puntos de retorno de las llamadas"""
+    lideres = {0}
+    for posicion, instruccion in enumerate(codigo):
+        if instruccion[0] in Instrucciones.SALTOS:
+            lideres.add(instruccion[1])
+        if instruccion[0] == Instrucciones.CALL:
+            lideres.add(posicion + 1)
+    return lideres
+
+
+def _compactar(codigo, etiquetas, eliminadas):
+    """Quita las posiciones eliminadas y ajusta los destinos de salto y las
+    etiquetas. Una posición eliminada pasa a la siguiente que se conserva"""
+    if not eliminadas:
+        return codigo, etiquetas
+
+    nuevas_posiciones = []
+    conservadas = 0
+    for posicion in range(len(codigo) + 1):
+        nuevas_posiciones.append(conservadas)
+        if posicion not in eliminadas:
+            conservadas += 1
+
+    compactado = []
+    for posicion, instruccion in enumerate(codigo):
+        if posicion in eliminadas:
+            continue
+        if instruccion[0] in Instrucciones.SALTOS:
+            instruccion = (instruccion[0], nuevas_posiciones[instruccion[1]])
+        compactado.append(instruccion)
+
+    etiquetas = {etiqueta: nuevas_posiciones[posicion] for etiqueta, posicion in etiquetas.items()}
+    return compactado, etiquetas
@@ -0,0 +1,151 @@
+"""
+Perfilador de la máquina virtual: conteos y tiempos por código de operación,
+por instrucción, por línea del código fuente y por función
+"""
+
+import json
+import time
+
+from bytecod import Instrucciones
+
+
+# Filas que muestra el reporte de texto para las instrucciones y las líneas
+# más ejecutadas
+INSTRUCCIONES_EN_REPORTE = 20
+LINEAS_EN_REPORTE = 20
+
+
+class Perfilador:
+    """Acumula las mediciones de una o varias ejecuciones del mismo programa.
+    La máquina virtual solo lo usa en su ciclo instrumentado, por lo que no
+    agrega costo a las ejecuciones sin perfilado"""
+
+    def __init__(self):
+        self.programa = None
+        self.conteo_operaciones = [0] * 256
+        self.tiempo_operaciones = [0.0] * 256
+        self.conteo_instrucciones = []
+        # Dirección de entrada -> [llamadas, tiempo inclusivo]
+        self.funciones = {}
+        self.tiempo_total = 0.0
+        self.reloj = time.perf_counter
+
+    def iniciar(self, programa):
+        """Prepara los contadores; se conservan si el programa es el mismo"""
+        if programa is not self.programa:
+            self.programa = programa
+            self.conteo_operaciones = [0] * 256
+            self.tiempo_operaciones = [0.0] * 256
+            self.conteo_instrucciones = [0] * len(programa)
+            self.funciones = {}
+            self.tiempo_total = 0.0
+
+    def registrar_llamada(self, direccion, tiempo):
+        datos = self.funciones.get(direccion)
+        if datos is None:
+            datos = self.funciones[direccion] = [0, 0.0]
+        datos[0] += 1
+        datos[1] += tiempo
+
+    def _nombres_funciones(self):
+        nombres = {}
+        for funcion in self.programa.funciones:
+            direccion = self.programa.etiquetas.get(funcion['etiqueta'])
+            if direccion is not None:
+                nombres[direccion] = funcion['nombre']
+        return nombres
+
+    def a_diccionario(self):
+        """Resultados en estructuras simples, listos para exportar a JSON"""
+        operaciones = {}
+        for codigo_inst, conteo in enumerate(self.conteo_operaciones):
+            if conteo:
+                operaciones[Instrucciones.obtener_nombre(codigo_inst)] = {
+                    'ejecuciones': conteo,
+                    'tiempo': self.tiempo_operaciones[codigo_inst],
+                }
+
+        instrucciones = []
+        # Línea -> instrucciones ejecutadas que provienen de ella
+        por_linea = {}
+        if self.programa is not None:
+            for posicion, conteo in enumerate(self.conteo_instrucciones):
+                if conteo:
+                    linea = self.programa.linea(posicion)
+                    instrucciones.append({
+                        'posicion': posicion,
+                        'linea': linea,
+                        'instruccion': Instrucciones.obtener_nombre(self.programa.operaciones[posicion]),
+                        'ejecuciones': conteo,
+                    })
+                    if linea is not None:
+                        por_linea[linea] = por_linea.get(linea, 0) + conteo
+        lineas = [{'linea': linea, 'ejecuciones': conteo}
+                  for linea, conteo in sorted(por_linea.items())]
+
+        nombres = self._nombres_funciones() if self.programa is not None else {}
+        funciones = {}
+        for direccion, (llamadas, tiempo) in self.funciones.items():
+            funciones[nombres.get(direccion, str(direccion))] = {
+                'llamadas': llamadas,
+                'tiempo_inclusivo': tiempo,
+            }
+
+        return {
+            'tiempo_total': self.tiempo_total,
+            'instrucciones_ejecutadas': sum(self.conteo_operaciones),
+            'operaciones': operaciones,
+            'instrucciones': instrucciones,
+            'lineas': lineas,
+            'funciones': funciones,
+        }
+
+    def reporte_json(self):
+        return json.dumps(self.a_diccionario(), ensure_ascii=False, indent=2)
+
+    def exportar_json(self, ruta):
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            archivo.write(self.reporte_json())
+
+    def reporte_texto(self):
+        datos = self.a_diccionario()
+        total = datos['tiempo_total'] or 1e-12
+        lineas = [
+            f"Instrucciones ejecutadas: {datos['instrucciones_ejecutadas']} "
+            f"en {datos['tiempo_total'] * 1000:.3f} ms",
+            "",
+            f"{'operación':<12} {'ejecuciones':>12} {'tiempo (ms)':>12} {'% tiempo':>9}",
+        ]
+        operaciones = sorted(datos['operaciones'].items(), key=lambda par: -par[1]['tiempo'])
+        for nombre, valores in operaciones:
+            lineas.append(
+                f"{nombre:<12} {valores['ejecuciones']:>12} {valores['tiempo'] * 1000:>12.3f} "
+                f"{valores['tiempo'] / total * 100:>8.1f}%"
+            )
+
+        if datos['funciones']:
+            lineas.append("")
+            lineas.append(f"{'función':<20} {'llamadas':>10} {'tiempo inclusivo (ms)':>22}")
+            funciones = sorted(datos['funciones'].items(), key=lambda par: -par[1]['tiempo_inclusivo'])
+            for nombre, valores in funciones:
+                lineas.append(
+                    f"{nombre:<20} {valores['llamadas']:>10} {valores['tiempo_inclusivo'] * 1000:>22.3f}"
+                )
+
+        if datos['lineas']:
+            lineas.append("")
+            lineas.append(f"{'línea':>8} {'instrucciones ejecutadas':>25}")
+            por_linea = sorted(datos['lineas'], key=lambda fila: -fila['ejecuciones'])
+            for fila in por_linea[:LINEAS_EN_REPORTE]:
+                lineas.append(f"{fila['linea']:>8} {fila['ejecuciones']:>25}")
+
+        lineas.append("")
+        lineas.append(f"{'posición':>8} {'línea':>6} {'instrucción':<12} {'ejecuciones':>12}")
+        instrucciones = sorted(datos['instrucciones'], key=lambda fila: -fila['ejecuciones'])
+        for fila in instrucciones[:INSTRUCCIONES_EN_REPORTE]:
+            linea = fila['linea'] if fila['linea'] is not None else "-"
+            lineas.append(
+                f"{fila['posicion']:>8} {linea:>6} {fila['instruccion']:<12} {fila['ejecuciones']:>12}"
+            )
+
+        return "\n".join(lineas)
@@ -0,0 +1,265 @@
+"""
+Medición de rendimiento del compilador
+"""
+
+import os
+import sys
+import time
+
+from lexico import Lexico, ERR_NOERROR
+from sintaxis import Sintaxis, ERR_NO_SINTAX_ERROR
+from bytecod import ByteCodeGenerator
+from machin import MaquinaVirtual, MODOS_EJECUCION, MODO_INTERPRETE
+from optimizador import OptimizadorMirilla
+from salidas import SalidaNula, SalidaCircular
+from perfilador import Perfilador
+from transpilador import TranspiladorPython, EjecutorPython
+
+
+DIRECTORIO_PROBLEMAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Problemas de Evaluacion")
+
+# Entradas predefinidas para los problemas que leen datos
+ENTRADAS_PROBLEMAS = {
+    "Problema2.avl": ["Rafa"],
+    "Problema3.avl": ["7", "2"],
+    "Problema6.avl": ["123", "Ana"],
+    "Problema7.avl": ["a", "1", "b", "2", "c", "3", "d", "4", "e", "5"],
+    "Problema8.avl": ["5", "si", "7", "si", "1.5", "no"],
+    "Problema9.avl": ["20.5", "100", "si", "41", "no"],
+}
+
+# Programas sintéticos con ciclos largos para medir el costo por instrucción
+PROGRAMAS_SINTETICOS = {
+    "ciclo_para": (
+        "entero suma = 0\n"
+        "entero i\n"
+        "para i = 1 hasta 100000\n"
+        "    suma = suma + i\n"
+        "fin_para\n"
+        "imprimir(suma)\n"
+    ),
+    "ciclo_mientras": (
+        "entero contador = 0\n"
+        "flotante total = 0.0\n"
+        "mientras contador < 50000\n"
+        "    total = total + contador / 2\n"
+        "    contador = contador + 1\n"
+        "fin_mientras\n"
+        "imprimir(total)\n"
+    ),
+    # Desborda la pila de llamadas: todos los modos deben reportar la misma línea
+    "recursion_honda": (
+        "entero profundidad = 0\n"
+        "funcion baja(entero n)\n"
+        "    profundidad = profundidad + 1\n"
+        "    si n > 0 entonces\n"
+        "        baja(n - 1)\n"
+        "    fin_si\n"
+        "    imprimir(n)\n"
+        "fin_funcion\n"
+        "baja(20000)\n"
+        "imprimir(profundidad)\n"
+    ),
+}
+
+# Fuentes dominadas por comentarios, cadenas y espacios, donde el léxico
+# avanza por regiones completas y no carácter por carácter
+PROGRAMAS_LEXICO = {
+    "comentarios": (
+        "{" + "comentario de bloque muy largo " * 20000 + "}\n"
+        + "# comentario de línea " * 5000 + "\n"
+        + "entero a = 1\n"
+    ) * 5,
+    "cadenas": (
+        'cadena texto = "' + "x" * 100000 + '"\n'
+        + ('imprimir("' + "cadena mediana " * 20 + '")\n') * 2000
+    ),
+    "espacios": ("entero" + " " * 200 + "b" + " " * 200 + "=" + " " * 200 + "2\n") * 2000,
+}
+
+
+def analizar(codigo_fuente):
+    """Ejecuta el análisis léxico y sintáctico, retorna el analizador sintáctico"""
+    lex = Lexico(codigo_fuente)
+    error_lex, token = lex.genera_lexico(False)
+    if error_lex != ERR_NOERROR:
+        raise ValueError(f"Error léxico: {lex.mensaje_error(error_lex)}")
+
+    sintax = Sintaxis(lex)
+    error_sintax = sintax.genera_sintaxis()
+    if error_sintax != ERR_NO_SINTAX_ERROR:
+        raise ValueError(f"Error sintáctico: {sintax.mensaje_error(error_sintax)}")
+    return sintax
+
+
+def compilar(codigo_fuente, optimizador=None):
+    """Ejecuta las fases de análisis y generación, retorna el programa compacto"""
+    sintax = analizar(codigo_fuente)
+    generador = ByteCodeGenerator()
+    generador.generar_bytecode(sintax.get_arbol_sintactico(), sintax.get_tabla_simbolos())
+    programa = generador.obtener_programa()
+    if optimizador is not None:
+        programa = optimizador.optimizar_programa(programa)
+    return programa
+
+
+def transpilar(codigo_fuente):
+    """Retorna el objeto de código del programa transpilado a Python"""
+    sintax = analizar(codigo_fuente)
+    return TranspiladorPython().compilar(sintax.get_arbol_sintactico(), sintax.get_tabla_simbolos())
+
+
+def medir_lexico(codigo_fuente, repeticiones):
+    """Retorna el mejor tiempo (en segundos) del análisis léxico y la
+    cantidad de tokens producidos"""
+    mejor = None
+    for _ in range(repeticiones):
+        lex = Lexico(codigo_fuente)
+        inicio = time.perf_counter()
+        lex.analizar()
+        transcurrido = time.perf_counter() - inicio
+        if mejor is None or transcurrido < mejor:
+            mejor = transcurrido
+    return mejor, len(lex.get())
+
+
+def medir_ejecucion(programa, entradas, repeticiones, modo=MODO_INTERPRETE):
+    """Retorna el mejor tiempo (en segundos) de ejecutar el byte-code"""
+    return _mejor_tiempo(lambda: MaquinaVirtual(SalidaNula(), modo), programa, entradas, repeticiones)
+
+
+def medir_transpilado(codigo, entradas, repeticiones):
+    """Retorna el mejor tiempo (en segundos) de ejecutar el programa transpilado"""
+    return _mejor_tiempo(lambda: EjecutorPython(SalidaNula()), codigo, entradas, repeticiones)
+
+
+def _mejor_tiempo(crear_maquina, programa, entradas, repeticiones):
+    mejor = None
+    for _ in range(repeticiones):
+        maquina = crear_maquina()
+        maquina.configurar_entradas(list(entradas))
+        maquina.cargar_codigo(programa)
+
+        inicio = time.perf_counter()
+        maquina.ejecutar()
+        transcurrido = time.perf_counter() - inicio
+
+        if mejor is None or transcurrido < mejor:
+            mejor = transcurrido
+    return mejor
+
+
+def obtener_programas():
+    """Retorna los pares (nombre, código fuente, entradas) a medir"""
+    programas = []
+    for nombre in sorted(os.listdir(DIRECTORIO_PROBLEMAS)):
+        if nombre.endswith(".avl"):
+            with open(os.path.join(DIRECTORIO_PROBLEMAS, nombre), "r", encoding="utf-8") as archivo:
+                codigo_fuente = archivo.read() + "\n"
+            programas.append((nombre, codigo_fuente, ENTRADAS_PROBLEMAS.get(nombre, [])))
+
+    for nombre, codigo_fuente in PROGRAMAS_SINTETICOS.items():
+        programas.append((nombre, codigo_fuente, []))
+    return programas
+
+
+def perfilar(ruta, ruta_json=None, entradas=()):
+    """Ejecuta un archivo .avl con el perfilador y muestra el reporte"""
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        codigo_fuente = archivo.read() + "\n"
+    programa = compilar(codigo_fuente, OptimizadorMirilla())
+
+    perfilador = Perfilador()
+    maquina = MaquinaVirtual(SalidaNula())
+    maquina.configurar_entradas(list(entradas) or ENTRADAS_PROBLEMAS.get(os.path.basename(ruta), []))
+    maquina.cargar_codigo(programa)
+    maquina.ejecutar(perfilador=perfilador)
+
+    print(perfilador.reporte_texto())
+    if ruta_json:
+        perfilador.exportar_json(ruta_json)
+
+
+def salidas_por_modo(codigo_fuente, entradas, optimizador=None):
+    """Ejecuta el programa en cada modo de la máquina virtual y transpilado a
+    Python. Retorna un diccionario modo -> líneas de salida"""
+    programa = compilar(codigo_fuente, optimizador)
+    maquinas = [(modo, MaquinaVirtual(SalidaCircular(), modo), programa) for modo in MODOS_EJECUCION]
+    maquinas.append(("python", EjecutorPython(SalidaCircular()), transpilar(codigo_fuente)))
+
+    salidas = {}
+    for modo, maquina, codigo in maquinas:
+        maquina.configurar_entradas(list(entradas))
+        maquina.cargar_codigo(codigo)
+        maquina.ejecutar()
+        salidas[modo] = maquina.obtener_salida()
+    return salidas
+
+
+def comparar_modos():
+    """Compara la salida de cada programa en todos los modos con la del
+    intérprete. Retorna la cantidad de programas con diferencias"""
+    optimizador = OptimizadorMirilla()
+    diferencias = 0
+    for nombre, codigo_fuente, entradas in obtener_programas():
+        salidas = salidas_por_modo(codigo_fuente, entradas, optimizador)
+        esperada = salidas.pop(MODO_INTERPRETE)
+        distintos = [modo for modo, salida in salidas.items() if salida != esperada]
+        if distintos:
+            diferencias += 1
+            print(f"{nombre:<16} DIFERENTE en {', '.join(distintos)}")
+            for modo in distintos:
+                print(f"    {MODO_INTERPRETE}: {esperada}")
+                print(f"    {modo}: {salidas[modo]}")
+        else:
+            print(f"{nombre:<16} ok")
+    return diferencias
+
+
+def comparar_lexico(repeticiones):
+    """Mide el analizador léxico sobre cada programa y sobre todos juntos
+    repetidos, donde el costo por carácter domina"""
+    programas = [(nombre, codigo_fuente) for nombre, codigo_fuente, _ in obtener_programas()]
+    todos = "".join(codigo_fuente for _, codigo_fuente in programas)
+    programas.append(("todos x50", todos * 50))
+    programas.extend(PROGRAMAS_LEXICO.items())
+
+    print(f"{'programa':<16} {'caracteres':>10} {'tokens':>8} {'tiempo (ms)':>12} {'tokens/s':>12}")
+    for nombre, codigo_fuente in programas:
+        tiempo, tokens = medir_lexico(codigo_fuente, repeticiones)
+        print(f"{nombre:<16} {len(codigo_fuente):>10} {tokens:>8} {tiempo * 1000:>12.3f} "
+              f"{tokens / tiempo:>12.0f}")
+
+
+def main(argumentos):
+    # rendimiento.py --perfil programa.avl [reporte.json]
+    if argumentos and argumentos[0] == "--perfil":
+        perfilar(*argumentos[1:3])
+        return
+
+    # rendimiento.py --comparar: termina con error si algún modo difiere
+    if argumentos and argumentos[0] == "--comparar":
+        sys.exit(1 if comparar_modos() else 0)
+
+    # rendimiento.py --lexico [repeticiones]
+    if argumentos and argumentos[0] == "--lexico":
+        comparar_lexico(int(argumentos[1]) if len(argumentos) > 1 else 20)
+        return
+
+    repeticiones = int(argumentos[0]) if argumentos else 20
+    optimizador = OptimizadorMirilla()
+
+    encabezados = "".join(f" {modo + ' (ms)':>15}" for modo in MODOS_EJECUCION)
+    print(f"{'programa':<16} {'instrucciones':>13}{encabezados} {'python (ms)':>15}")
+    for nombre, codigo_fuente, entradas in obtener_programas():
+        programa = compilar(codigo_fuente, optimizador)
+        tiempos = "".join(
+            f" {medir_ejecucion(programa, entradas, repeticiones, modo) * 1000:>15.3f}"
+            for modo in MODOS_EJECUCION
+        )
+        tiempo_python = medir_transpilado(transpilar(codigo_fuente), entradas, repeticiones)
+        print(f"{nombre:<16} {len(programa):>13}{tiempos} {tiempo_python * 1000:>15.3f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
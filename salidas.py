@@ -0,0 +1,98 @@
+"""
+Destinos de la salida de los programas en ejecución
+"""
+
+import sys
+from abc import ABC, abstractmethod
+from collections import deque
+
+
+# Líneas que conserva por omisión la salida en memoria
+LIMITE_SALIDA = 10000
+
+# Líneas que acumula la salida a flujo antes de escribirlas
+TAMANIO_LOTE = 256
+
+
+class Salida(ABC):
+    """Interfaz común: la máquina virtual escribe líneas y pide vaciar el
+    búfer antes de leer una entrada y al terminar la ejecución"""
+
+    @abstractmethod
+    def escribir(self, linea):
+        pass
+
+    def vaciar(self):
+        pass
+
+    def lineas(self):
+        """Líneas conservadas para consultarlas después de la ejecución"""
+        return []
+
+    def limpiar(self):
+        pass
+
+
+class SalidaCircular(Salida):
+    """Conserva en memoria solo las últimas líneas escritas"""
+
+    def __init__(self, limite=LIMITE_SALIDA):
+        self.limite = limite
+        self.buffer = deque(maxlen=limite)
+        self.descartadas = 0
+
+    def escribir(self, linea):
+        if len(self.buffer) == self.limite:
+            self.descartadas += 1
+        self.buffer.append(linea)
+
+    def lineas(self):
+        return list(self.buffer)
+
+    def limpiar(self):
+        self.buffer.clear()
+        self.descartadas = 0
+
+
+class SalidaFlujo(Salida):
+    """Escribe en un flujo de texto agrupando las líneas en lotes"""
+
+    def __init__(self, flujo=None, prefijo="", tamanio_lote=TAMANIO_LOTE):
+        self.flujo = flujo
+        self.prefijo = prefijo
+        self.tamanio_lote = tamanio_lote
+        self.pendientes = []
+
+    def escribir(self, linea):
+        self.pendientes.append(f"{self.prefijo}{linea}\n")
+        if len(self.pendientes) >= self.tamanio_lote:
+            self.vaciar()
+
+    def vaciar(self):
+        if not self.pendientes:
+            return
+        # sys.stdout se resuelve al escribir para respetar redirecciones
+        flujo = self.flujo if self.flujo is not None else sys.stdout
+        flujo.write("".join(self.pendientes))
+        flujo.flush()
+        self.pendientes = []
+
+    def limpiar(self):
+        self.pendientes = []
+
+
+class SalidaFuncion(Salida):
+    """Entrega cada línea a una función, por ejemplo para mostrarla en la interfaz"""
+
+    def __init__(self, funcion):
+        self.funcion = funcion
+
+    def escribir(self, linea):
+        self.funcion(linea)
+
+
+class SalidaNula(Salida):
+    """Descarta toda la salida, para mediciones de rendimiento"""
+
+    def escribir(self, linea):
+        pass
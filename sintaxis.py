@@ -2,7 +2,7 @@
 Módulo de Análisis Sintáctico
 """
 
-from lexico import Lexico, Tipos
+from lexico import Lexico, FlujoTokens, Tipos
 
 
 class Errores:
@@ -49,7 +49,7 @@ class TablaSimbolos:
         self.simbolos = []
         self.ambito_actual = "global"
         
-    def insertar(self, nombre, tipo, linea, tipo_retorno=None, tamanio=None, ambito=None):
+    def insertar(self, nombre, tipo, linea, tipo_retorno=None, tamanio=None, ambito=None, implicito=False):
         ambito = ambito or self.ambito_actual
         
         for simbolo in self.simbolos:
@@ -62,7 +62,9 @@ class TablaSimbolos:
             'linea': linea,
             'ambito': ambito,
             'tipo_retorno': tipo_retorno,
-            'tamanio': tamanio
+            'tamanio': tamanio,
+            # Declarado por uso (leer) y no con una declaración explícita
+            'implicito': implicito
         }
         
         self.simbolos.append(nuevo_simbolo)
@@ -395,10 +397,15 @@ class SistemaTipos:
 
 class Sintaxis:
     
-    def __init__(self, lexico):
+    def __init__(self, lexico, flujo=False):
+        """Con flujo=True los tokens se piden al analizador léxico a medida
+        que se necesitan (ver FlujoTokens) en lugar de leer los de analizar()"""
         self.lexico = lexico
-        self.lista_tokens = lexico.get()
+        self.tokens = FlujoTokens(lexico) if flujo else lexico
+        self.lista_tokens = [] if flujo else lexico.get()
         self.indice_token = 0
+        # Índice en lista_tokens del token actual, para ubicarlo en el código
+        self.indice_actual = 0
         self.token_actual = ("", Tipos.LIN_SINTIPO)
         
         self.tabla_simbolos = TablaSimbolos()
@@ -421,7 +428,7 @@ class Sintaxis:
         try:
             error = self._procesar_programa_principal()
             
-            if error == Errores.SINTAXIS_CLASE:
+            if error == Errores.SINTAXIS_CLASE and self.tokens is self.lexico:
                 self.indice_token = 0
                 self.token_actual = ("", Tipos.LIN_SINTIPO)
                 self._siguiente_token()
@@ -491,7 +498,8 @@ class Sintaxis:
     
     
     def _procesar_declaracion_variable(self):
-        linea_actual = self.lexico.get_lineas()
+        posicion = self._posicion_actual()
+        linea_actual = posicion[0]
         tipo_dato = self.token_actual[1]
         self._siguiente_token()
         
@@ -510,7 +518,7 @@ class Sintaxis:
                     linea_actual
                 )
             
-            declaracion = self._agregar_instruccion_arbol('declaracion',
+            declaracion = self._agregar_instruccion_arbol('declaracion', posicion,
                 variable=nombre_variable,
                 tipo_dato=tipo_dato
             )
@@ -534,6 +542,7 @@ class Sintaxis:
             return Errores.SINTAXIS_IDENTIFICADOR
     
     def _procesar_instruccion_imprimir(self):
+        posicion = self._posicion_actual()
         self._siguiente_token()
         
         if self.token_actual[0] == "(":
@@ -542,7 +551,7 @@ class Sintaxis:
             # Procesar la expresión completa (puede ser simple o compleja con accesos a arreglos)
             expresion = self._procesar_expresion()
             
-            self._agregar_instruccion_arbol('imprimir', expresion=expresion)
+            self._agregar_instruccion_arbol('imprimir', posicion, expresion=expresion)
             
             if self.token_actual[0] == ")":
                 self._siguiente_token()
@@ -558,7 +567,8 @@ class Sintaxis:
             return Errores.SINTAXIS_PARENTESIS_ABRIR
     
     def _procesar_instruccion_leer(self):
-        linea_actual = self.lexico.get_lineas()
+        posicion = self._posicion_actual()
+        linea_actual = posicion[0]
         self._siguiente_token()
         
         if self.token_actual[0] == "(":
@@ -566,8 +576,7 @@ class Sintaxis:
             
             # Verificar si es un acceso a arreglo
             if (self.token_actual[1] == Tipos.LIN_IDENTIFICADOR and 
-                self.indice_token < len(self.lista_tokens) - 1 and
-                self.lista_tokens[self.indice_token][0] == '['):
+                self._valor_siguiente() == '['):
                 
                 # Es un acceso a arreglo: leer(arreglo[indice])
                 nombre_arreglo = self.token_actual[0]
@@ -577,7 +586,7 @@ class Sintaxis:
                 acceso_arreglo = self._procesar_acceso_arreglo_para_leer(nombre_arreglo)
                 
                 if acceso_arreglo:
-                    self._agregar_instruccion_arbol('leer_arreglo',
+                    self._agregar_instruccion_arbol('leer_arreglo', posicion,
                         arreglo=nombre_arreglo,
                         indice=acceso_arreglo['indice']
                     )
@@ -590,11 +599,11 @@ class Sintaxis:
                 
                 if not self.tabla_simbolos.existe(nombre_variable):
                     self.tabla_simbolos.insertar(
-                        nombre_variable, Tipos.LEX_ENTERO, linea_actual
+                        nombre_variable, Tipos.LEX_ENTERO, linea_actual, implicito=True
                     )
                 
                 self._siguiente_token()
-                self._agregar_instruccion_arbol('leer', variable=nombre_variable)
+                self._agregar_instruccion_arbol('leer', posicion, variable=nombre_variable)
             else:
                 return Errores.SINTAXIS_IDENTIFICADOR
             
@@ -627,7 +636,7 @@ class Sintaxis:
                     self.manejador_errores.agregar_error_semantico(
                         Errores.SEMANTICA_IDENTIFICADOR_NO_DECLARADO,
                         f"Arreglo '{nombre_arreglo}' no declarado",
-                        self.lexico.get_lineas()
+                        self._posicion_actual()[0]
                     )
                     return None
                 
@@ -640,27 +649,28 @@ class Sintaxis:
     
     def _procesar_identificador(self):
         nombre = self.token_actual[0]
+        posicion = self._posicion_actual()
         
         if not self.tabla_simbolos.existe(nombre):
             self.manejador_errores.agregar_error_semantico(
                 Errores.SEMANTICA_IDENTIFICADOR_NO_DECLARADO,
                 f"Identificador '{nombre}' no declarado",
-                self.lexico.get_lineas()
+                posicion[0]
             )
         
         self._siguiente_token()
         
         if self.token_actual[0] == "=":
-            return self._procesar_asignacion(nombre)
+            return self._procesar_asignacion(nombre, posicion)
         elif self.token_actual[0] == "[":
-            return self._procesar_acceso_arreglo(nombre)
+            return self._procesar_acceso_arreglo(nombre, posicion)
         elif self.token_actual[0] == "(":
-            return self._procesar_llamada_funcion(nombre)
+            return self._procesar_llamada_funcion(nombre, posicion)
         else:
             return Errores.SINTAXIS_NINGUNO
     
-    def _procesar_asignacion(self, nombre_variable):
-        linea_actual = self.lexico.get_lineas()
+    def _procesar_asignacion(self, nombre_variable, posicion):
+        linea_actual = posicion[0]
         self._siguiente_token()
         
         simbolo = self.tabla_simbolos.buscar(nombre_variable)
@@ -676,7 +686,7 @@ class Sintaxis:
                 nombre_variable, tipo_variable, expresion, linea_actual
             )
         
-        self._agregar_instruccion_arbol('asignacion',
+        self._agregar_instruccion_arbol('asignacion', posicion,
             variable=nombre_variable,
             expresion=expresion
         )
@@ -685,7 +695,8 @@ class Sintaxis:
     
     def _procesar_retornar(self):
         """Procesa instrucción retornar"""
-        linea_actual = self.lexico.get_lineas()
+        posicion = self._posicion_actual()
+        linea_actual = posicion[0]
         self._siguiente_token()  # Consumir 'retornar'
         
         expresion = None
@@ -700,7 +711,7 @@ class Sintaxis:
                 linea_actual
             )
         
-        self._agregar_instruccion_arbol('retornar', expresion=expresion)
+        self._agregar_instruccion_arbol('retornar', posicion, expresion=expresion)
         
         if self.token_actual[1] == Tipos.LIN_EOLN:
             self._siguiente_token()
@@ -846,8 +857,7 @@ class Sintaxis:
             nombre = self.token_actual[0]
             
             # Verificar si es un acceso a arreglo
-            if (self.indice_token < len(self.lista_tokens) and 
-                self.lista_tokens[self.indice_token][0] == '['):
+            if self._valor_siguiente() == '[':
                 
                 # Es un acceso a arreglo
                 self._siguiente_token()  # Consumir el nombre
@@ -913,7 +923,8 @@ class Sintaxis:
 
     def _procesar_instruccion_retornar(self):
         """Procesa instrucción retornar"""
-        linea_actual = self.lexico.get_lineas()
+        posicion = self._posicion_actual()
+        linea_actual = posicion[0]
         self._siguiente_token()  # Consumir 'retornar'
         
         expresion = None
@@ -928,7 +939,7 @@ class Sintaxis:
                 linea_actual
             )
         
-        self._agregar_instruccion_arbol('retornar', expresion=expresion)
+        self._agregar_instruccion_arbol('retornar', posicion, expresion=expresion)
         
         if self.token_actual[1] == Tipos.LIN_EOLN:
             self._siguiente_token()
@@ -937,22 +948,33 @@ class Sintaxis:
             return Errores.SINTAXIS_EOLN
     
     def _siguiente_token(self):
-        if self.indice_token < len(self.lista_tokens):
-            self.token_actual = self.lista_tokens[self.indice_token]
+        token = self.tokens.token(self.indice_token)
+        if token is not None:
+            self.token_actual = token
+            self.indice_actual = self.indice_token
             
             if self.token_actual[1] == Tipos.LIN_EOLN:
                 indice_aux = self.indice_token + 1
-                while (indice_aux < len(self.lista_tokens) and 
-                       self.lista_tokens[indice_aux][1] == Tipos.LIN_EOLN):
+                while self.tokens.tipo(indice_aux) == Tipos.LIN_EOLN:
                     indice_aux += 1
                 self.indice_token = indice_aux
             else:
                 self.indice_token += 1
+            self.tokens.liberar(self.indice_actual)
         else:
             self.token_actual = ("", Tipos.LIN_EOF)
     
-    def _agregar_instruccion_arbol(self, tipo, **atributos):
-        instruccion = {'tipo': tipo, **atributos}
+    def _valor_siguiente(self):
+        """Valor del token que sigue al actual, sin avanzar"""
+        token = self.tokens.token(self.indice_token)
+        return token[0] if token is not None else None
+    
+    def _posicion_actual(self):
+        """Línea y columna del token actual en el código fuente"""
+        return self.tokens.posicion(self.indice_actual)
+    
+    def _agregar_instruccion_arbol(self, tipo, posicion, **atributos):
+        instruccion = {'tipo': tipo, 'linea': posicion[0], 'columna': posicion[1], **atributos}
         self.arbol_sintactico['instrucciones'].append(instruccion)
         return instruccion
     
@@ -1020,7 +1042,8 @@ class Sintaxis:
     
     def _procesar_declaracion_arreglo(self):
         """Procesa declaración de arreglos: arreglo entero numeros[10]"""
-        linea_actual = self.lexico.get_lineas()
+        posicion = self._posicion_actual()
+        linea_actual = posicion[0]
         self._siguiente_token()  # Consumir 'arreglo'
         
         # Tipo de elementos del arreglo
@@ -1070,7 +1093,7 @@ class Sintaxis:
             )
         
         # Agregar al árbol sintáctico
-        self._agregar_instruccion_arbol('declaracion_arreglo',
+        self._agregar_instruccion_arbol('declaracion_arreglo', posicion,
             nombre=nombre_arreglo,
             tipo_elemento=tipo_elemento,
             tamanio=tamanio
@@ -1091,9 +1114,9 @@ class Sintaxis:
         }
         return conversiones.get(tipo_elemento, Tipos.ERROR)
 
-    def _procesar_acceso_arreglo(self, nombre):
+    def _procesar_acceso_arreglo(self, nombre, posicion):
         """Procesa acceso a arreglo: numeros[5] o numeros[i]"""
-        linea_actual = self.lexico.get_lineas()
+        linea_actual = posicion[0]
         self._siguiente_token()  # Consumir '['
         
         indice = self._procesar_expresion()
@@ -1122,7 +1145,7 @@ class Sintaxis:
                 self._siguiente_token()
                 valor = self._procesar_expresion()
                 
-                self._agregar_instruccion_arbol('asignacion_arreglo',
+                self._agregar_instruccion_arbol('asignacion_arreglo', posicion,
                     nombre=nombre,
                     indice=indice,
                     valor=valor
@@ -1168,7 +1191,8 @@ class Sintaxis:
         return parametros
 
     def _procesar_estructura_para(self):
-        linea_actual = self.lexico.get_lineas()
+        posicion = self._posicion_actual()
+        linea_actual = posicion[0]
         self._siguiente_token()  # Consumir 'para'
         
         if self.token_actual[1] == Tipos.LIN_IDENTIFICADOR:
@@ -1192,6 +1216,8 @@ class Sintaxis:
         # Crear nodo PARA con cuerpo vacío
         nodo_para = {
             'tipo': 'para',
+            'linea': posicion[0],
+            'columna': posicion[1],
             'variable': variable,
             'inicio': inicio,
             'condicion': {
@@ -1254,7 +1280,8 @@ class Sintaxis:
         
     def _procesar_estructura_si(self):
         """Procesa estructura SI - SI ENTONCES - SINO - FIN_SI"""
-        linea_actual = self.lexico.get_lineas()
+        posicion = self._posicion_actual()
+        linea_actual = posicion[0]
         self._siguiente_token()  # Consumir 'si'
         
         # Procesar condición
@@ -1267,6 +1294,8 @@ class Sintaxis:
         # Crear nodo SI con cuerpo vacío
         nodo_si = {
             'tipo': 'si',
+            'linea': posicion[0],
+            'columna': posicion[1],
             'condicion': condicion,
             'cuerpo': [],
             'sino': []
@@ -1361,7 +1390,8 @@ class Sintaxis:
         
     def _procesar_estructura_mientras(self):
         """Procesa estructura MIENTRAS - FIN_MIENTRAS"""
-        linea_actual = self.lexico.get_lineas()
+        posicion = self._posicion_actual()
+        linea_actual = posicion[0]
         self._siguiente_token()  # Consumir 'mientras'
         
         # Procesar condición
@@ -1370,6 +1400,8 @@ class Sintaxis:
         # Crear nodo MIENTRAS con cuerpo vacío
         nodo_mientras = {
             'tipo': 'mientras',
+            'linea': posicion[0],
+            'columna': posicion[1],
             'condicion': condicion,
             'cuerpo': []
         }
@@ -1427,7 +1459,8 @@ class Sintaxis:
         return Errores.SINTAXIS_NINGUNO
     
     def _procesar_definicion_funcion(self):
-        linea_actual = self.lexico.get_lineas()
+        posicion = self._posicion_actual()
+        linea_actual = posicion[0]
         self._siguiente_token()  # Consumir 'funcion'
         
         if self.token_actual[1] == Tipos.LIN_IDENTIFICADOR:
@@ -1476,7 +1509,7 @@ class Sintaxis:
                     param['nombre'], param['tipo'], linea_actual
                 )
             
-            nodo_funcion = self._agregar_instruccion_arbol('definicion_funcion',
+            nodo_funcion = self._agregar_instruccion_arbol('definicion_funcion', posicion,
                 nombre=nombre_funcion,
                 parametros=parametros,
                 tipo_retorno=tipo_retorno,
@@ -1560,8 +1593,8 @@ class Sintaxis:
         else:
             return Errores.SINTAXIS_IDENTIFICADOR
     
-    def _procesar_llamada_funcion(self, nombre_funcion):
-        linea_actual = self.lexico.get_lineas()
+    def _procesar_llamada_funcion(self, nombre_funcion, posicion):
+        linea_actual = posicion[0]
         
         if not self.tabla_simbolos.existe(nombre_funcion, 'global'):
             self.manejador_errores.agregar_error_semantico(
@@ -1579,16 +1612,18 @@ class Sintaxis:
         if self.token_actual[0] == ")":
             self._siguiente_token()
             
-            return self._agregar_instruccion_arbol('llamada_funcion',
+            self._agregar_instruccion_arbol('llamada_funcion', posicion,
                 nombre=nombre_funcion,
                 argumentos=argumentos
             )
+            return Errores.SINTAXIS_NINGUNO
         else:
             return Errores.SINTAXIS_PARENTESIS_CERRAR
         
     def _procesar_llamada_funcion_simple(self):
         """Procesa llamada a función sin parámetros usando 'llamar'"""
-        linea_actual = self.lexico.get_lineas()
+        posicion = self._posicion_actual()
+        linea_actual = posicion[0]
         self._siguiente_token()  # Consumir 'llamar'
         
         if self.token_actual[1] == Tipos.LIN_IDENTIFICADOR:
@@ -1605,7 +1640,7 @@ class Sintaxis:
             self._siguiente_token()  # Consumir nombre función
             
             # Agregar al árbol sintáctico
-            self._agregar_instruccion_arbol('llamada_funcion',
+            self._agregar_instruccion_arbol('llamada_funcion', posicion,
                 nombre=nombre_funcion,
                 argumentos=[]
             )
@@ -0,0 +1,502 @@
+"""
+Transpilador del árbol sintáctico a código Python. Es un backend opcional
+para programas con mucho cálculo; la máquina virtual sigue siendo la
+implementación de referencia del lenguaje
+"""
+
+import sys
+
+from bytecod import locales_funcion, valor_por_defecto, convertir_valor_literal
+from machin import (ErrorEjecucion, ManejadorEntrada, convertir_entrada,
+                    validar_indice, mensaje_error_ejecucion, LIMITE_LLAMADAS)
+from salidas import SalidaCircular
+
+
+SANGRIA = "    "
+
+# Operadores de comparación del lenguaje -> operador de Python
+COMPARACIONES = {
+    '==': '==',
+    '<>': '!=',
+    '>': '>',
+    '<': '<',
+    '>=': '>=',
+    '<=': '<=',
+}
+
+# Operadores que se traducen directamente; '+' concatena si hay una cadena
+ARITMETICOS = {
+    '-': '-',
+    '*': '*',
+    '/': '/',
+}
+
+
+class _Detener(Exception):
+    """Equivale a HALT después de imprimir un error de generación"""
+    pass
+
+
+# Funciones auxiliares disponibles para el código generado. Reproducen la
+# semántica de las instrucciones de la máquina virtual
+
+def _sumar(a, b):
+    if isinstance(a, str) or isinstance(b, str):
+        return str(a) + str(b)
+    return a + b
+
+
+def _y(a, b):
+    # Ambos operandos ya se evaluaron, como en la pila
+    return 1 if (a and b) else 0
+
+
+def _o(a, b):
+    return 1 if (a or b) else 0
+
+
+def _descartar(*valores):
+    """Evalúa los argumentos de más de una llamada y no pasa ninguno"""
+    return ()
+
+
+def _elemento(arreglo, nombre, indice):
+    if arreglo is None:
+        raise ErrorEjecucion(f"Arreglo no inicializado: {nombre}")
+    if type(indice) is not int or not 0 <= indice < len(arreglo):
+        indice = validar_indice(nombre, arreglo, indice)
+    return arreglo[indice]
+
+
+def _asignar_elemento(arreglo, nombre, indice, valor):
+    if arreglo is None:
+        raise ErrorEjecucion(f"Arreglo no inicializado: {nombre}")
+    if type(indice) is not int or not 0 <= indice < len(arreglo):
+        indice = validar_indice(nombre, arreglo, indice)
+    arreglo[indice] = valor
+
+
+ENTORNO = {
+    '_sumar': _sumar,
+    '_y': _y,
+    '_o': _o,
+    '_descartar': _descartar,
+    '_elemento': _elemento,
+    '_asignar_elemento': _asignar_elemento,
+}
+
+
+def _variable(nombre):
+    # Prefijos distintos evitan choques con palabras reservadas de Python y
+    # entre una variable y un arreglo con el mismo nombre
+    return f"v_{nombre}"
+
+
+def _arreglo(nombre):
+    return f"a_{nombre}"
+
+
+def _funcion(nombre):
+    return f"f_{nombre}"
+
+
+class TranspiladorPython:
+    """Genera un módulo de Python a partir del árbol sintáctico. Las
+    variables globales que ninguna función usa se vuelven locales de
+    _principal, que Python accede más rápido"""
+
+    def __init__(self):
+        self.lineas = []
+        # Línea del programa fuente de cada línea generada (0 si no tiene)
+        self.origen = []
+        self.linea_origen = 0
+        self.nivel = 0
+        self.funciones = {}
+        self.locales_actuales = set()
+
+    def transpilar(self, arbol_sintactico, tabla_simbolos):
+        """Retorna el código fuente de Python del programa"""
+        self.lineas = []
+        self.origen = []
+        self.linea_origen = 0
+        self.nivel = 0
+        self.funciones = {}
+
+        definiciones = []
+        principales = []
+        for instruccion in arbol_sintactico.get('instrucciones', []):
+            if isinstance(instruccion, dict) and instruccion.get('tipo') == 'definicion_funcion':
+                definiciones.append(instruccion)
+                self.funciones[instruccion.get('nombre')] = instruccion.get('parametros', [])
+            else:
+                principales.append(instruccion)
+
+        # Variables de cada función y globales que comparten con el programa principal
+        locales_por_funcion = {}
+        compartidas = set()
+        arreglos = set()
+        for definicion in definiciones:
+            nombre = definicion.get('nombre')
+            locales = locales_funcion(tabla_simbolos, nombre, definicion.get('parametros', []))
+            locales_por_funcion[nombre] = locales
+            variables, arreglos_funcion = self._nombres(definicion.get('cuerpo', []))
+            compartidas |= variables - set(locales)
+            arreglos |= arreglos_funcion
+        variables_principal, arreglos_principal = self._nombres(principales)
+        arreglos |= arreglos_principal
+
+        self._linea("# Generado por el transpilador de Avellana")
+        for nombre in sorted(compartidas):
+            self._linea(f"{_variable(nombre)} = 0")
+        for nombre in sorted(arreglos):
+            self._linea(f"{_arreglo(nombre)} = None")
+
+        for definicion in definiciones:
+            nombre = definicion.get('nombre')
+            self._generar_funcion(definicion, locales_por_funcion[nombre])
+
+        # Todas las variables inician con el valor por defecto 0
+        self._linea("")
+        self._linea("def _principal():")
+        self.nivel += 1
+        self._declarar_globales(variables_principal & compartidas, arreglos)
+        self.locales_actuales = variables_principal - compartidas
+        for nombre in sorted(self.locales_actuales):
+            self._linea(f"{_variable(nombre)} = 0")
+        self._generar_bloque(principales)
+        self.nivel -= 1
+        self.locales_actuales = set()
+
+        self._linea("")
+        self._linea("_principal()")
+
+        # Tabla para que EjecutorPython reporte los errores con la línea del
+        # programa fuente; ocupa la segunda línea del módulo
+        self.origen.insert(1, 0)
+        self.lineas.insert(1, f"_LINEAS = {tuple(self.origen)!r}")
+        return "\n".join(self.lineas) + "\n"
+
+    def compilar(self, arbol_sintactico, tabla_simbolos):
+        """Retorna el objeto de código listo para EjecutorPython"""
+        fuente = self.transpilar(arbol_sintactico, tabla_simbolos)
+        return compile(fuente, "<avellana>", "exec")
+
+    def _linea(self, texto):
+        self.lineas.append(f"{SANGRIA * self.nivel}{texto}" if texto else "")
+        self.origen.append(self.linea_origen)
+
+    def _declarar_globales(self, variables, arreglos):
+        nombres = [_variable(nombre) for nombre in sorted(variables)]
+        nombres += [_arreglo(nombre) for nombre in sorted(arreglos)]
+        if nombres:
+            self._linea(f"global {', '.join(nombres)}")
+
+    def _nombres(self, instrucciones):
+        """Variables y arreglos que aparecen en una lista de instrucciones"""
+        variables = set()
+        arreglos = set()
+        pendientes = list(instrucciones)
+        while pendientes:
+            nodo = pendientes.pop()
+            if isinstance(nodo, list):
+                pendientes.extend(nodo)
+                continue
+            if not isinstance(nodo, dict):
+                continue
+
+            tipo = nodo.get('tipo')
+            if tipo in ('declaracion', 'asignacion', 'leer', 'para'):
+                variables.add(nodo.get('variable'))
+            elif tipo == 'variable':
+                variables.add(nodo.get('nombre'))
+            elif tipo in ('declaracion_arreglo', 'asignacion_arreglo', 'acceso_arreglo'):
+                arreglos.add(nodo.get('nombre'))
+            elif tipo == 'leer_arreglo':
+                # leer(arreglo[i]) pasa por una variable con el nombre del arreglo
+                variables.add(nodo.get('arreglo'))
+                arreglos.add(nodo.get('arreglo'))
+            elif tipo == 'definicion_funcion':
+                continue
+
+            for llave, valor in nodo.items():
+                if isinstance(valor, (dict, list)):
+                    pendientes.append(valor)
+        return variables, arreglos
+
+    def _generar_funcion(self, definicion, locales):
+        nombre = definicion.get('nombre')
+        parametros = definicion.get('parametros', [])
+        cuerpo = definicion.get('cuerpo', [])
+
+        nombres_parametros = [_variable(param['nombre']) for param in parametros]
+        self._linea("")
+        self._linea(f"def {_funcion(nombre)}({', '.join(nombres_parametros)}):")
+        self.nivel += 1
+
+        variables, arreglos = self._nombres(cuerpo)
+        self._declarar_globales(variables - set(locales), arreglos)
+        self.locales_actuales = set(locales)
+        for local in locales[len(parametros):]:
+            self._linea(f"{_variable(local)} = 0")
+
+        self._generar_bloque(cuerpo)
+        # Una función sin valor de retorno produce 0
+        self._linea("return 0")
+        self.nivel -= 1
+        self.locales_actuales = set()
+
+    def _generar_bloque(self, instrucciones):
+        inicio = len(self.lineas)
+        for instruccion in instrucciones:
+            self._generar_instruccion(instruccion)
+        if len(self.lineas) == inicio:
+            self._linea("pass")
+
+    def _generar_instruccion(self, nodo):
+        if not isinstance(nodo, dict):
+            return
+
+        linea_anterior = self.linea_origen
+        self.linea_origen = nodo.get('linea', linea_anterior)
+        try:
+            self._generar_nodo(nodo)
+        finally:
+            self.linea_origen = linea_anterior
+
+    def _generar_nodo(self, nodo):
+        tipo = nodo.get('tipo', 'desconocido')
+
+        if tipo == 'declaracion':
+            valor = nodo.get('valor')
+            if valor:
+                expresion = self._expresion(valor)
+            else:
+                expresion = repr(valor_por_defecto(nodo.get('tipo_dato')))
+            self._linea(f"{_variable(nodo.get('variable'))} = {expresion}")
+        elif tipo == 'asignacion':
+            self._linea(f"{_variable(nodo.get('variable'))} = {self._expresion(nodo.get('expresion'))}")
+        elif tipo == 'imprimir':
+            expresion = nodo.get('expresion')
+            self._linea(f"_imprimir({self._expresion(expresion) if expresion else repr('')})")
+        elif tipo == 'leer':
+            variable = nodo.get('variable')
+            self._linea(f"{_variable(variable)} = _leer({variable!r})")
+        elif tipo == 'declaracion_arreglo':
+            nombre = nodo.get('nombre')
+            defecto = repr(valor_por_defecto(nodo.get('tipo_elemento')))
+            self._linea(f"{_arreglo(nombre)} = [{defecto}] * {nodo.get('tamanio', 0)!r}")
+        elif tipo == 'asignacion_arreglo':
+            nombre = nodo.get('nombre')
+            self._linea(
+                f"_asignar_elemento({_arreglo(nombre)}, {nombre!r}, "
+                f"{self._expresion(nodo.get('indice'))}, {self._expresion(nodo.get('valor'))})"
+            )
+        elif tipo == 'leer_arreglo':
+            nombre = nodo.get('arreglo')
+            self._linea(f"{_variable(nombre)} = _leer({nombre!r})")
+            self._linea(
+                f"_asignar_elemento({_arreglo(nombre)}, {nombre!r}, "
+                f"{self._expresion(nodo.get('indice'))}, {_variable(nombre)})"
+            )
+        elif tipo == 'acceso_arreglo':
+            self._linea(self._expresion(nodo))
+        elif tipo == 'si':
+            self._linea(f"if {self._condicion(nodo.get('condicion'))}:")
+            self.nivel += 1
+            self._generar_bloque(nodo.get('cuerpo', []))
+            self.nivel -= 1
+            if nodo.get('sino'):
+                self._linea("else:")
+                self.nivel += 1
+                self._generar_bloque(nodo.get('sino'))
+                self.nivel -= 1
+        elif tipo == 'mientras':
+            self._linea(f"while {self._condicion(nodo.get('condicion'))}:")
+            self.nivel += 1
+            self._generar_bloque(nodo.get('cuerpo', []))
+            self.nivel -= 1
+        elif tipo == 'para':
+            variable = _variable(nodo.get('variable'))
+            if nodo.get('inicio'):
+                self._linea(f"{variable} = {self._expresion(nodo.get('inicio'))}")
+            self._linea(f"while {self._condicion(nodo.get('condicion'))}:")
+            self.nivel += 1
+            for instruccion in nodo.get('cuerpo', []):
+                self._generar_instruccion(instruccion)
+            if nodo.get('incremento'):
+                self._generar_instruccion(nodo.get('incremento'))
+            else:
+                self._linea(f"{variable} = _sumar({variable}, 1)")
+            self.nivel -= 1
+        elif tipo == 'llamada_funcion':
+            self._linea(self._llamada(nodo))
+        elif tipo == 'retornar':
+            expresion = nodo.get('expresion')
+            self._linea(f"return {self._expresion(expresion) if expresion is not None else '0'}")
+        else:
+            self._linea(self._error(f"Nodo desconocido: {tipo}"))
+
+    def _condicion(self, expresion):
+        """Los saltos de la máquina virtual comparan con 0: una comparación
+        se usa tal cual y cualquier otro valor se compara con 0"""
+        if (isinstance(expresion, dict) and expresion.get('tipo') == 'binaria'
+                and expresion.get('operador') in COMPARACIONES):
+            izquierda = self._expresion(expresion.get('izquierda'))
+            derecha = self._expresion(expresion.get('derecha'))
+            return f"{izquierda} {COMPARACIONES[expresion.get('operador')]} {derecha}"
+        return f"{self._expresion(expresion)} != 0"
+
+    def _expresion(self, expresion):
+        if not isinstance(expresion, dict):
+            return "0"
+
+        tipo = expresion.get('tipo', 'desconocido')
+
+        if tipo == 'literal':
+            return repr(convertir_valor_literal(expresion.get('valor'), expresion.get('tipo_dato')))
+        elif tipo == 'variable':
+            return _variable(expresion.get('nombre'))
+        elif tipo == 'binaria':
+            operador = expresion.get('operador')
+            izquierda = self._expresion(expresion.get('izquierda'))
+            derecha = self._expresion(expresion.get('derecha'))
+            if operador == '+':
+                return f"_sumar({izquierda}, {derecha})"
+            elif operador in ARITMETICOS:
+                return f"({izquierda} {ARITMETICOS[operador]} {derecha})"
+            elif operador in COMPARACIONES:
+                return f"(1 if {izquierda} {COMPARACIONES[operador]} {derecha} else 0)"
+            elif operador == '&&':
+                return f"_y({izquierda}, {derecha})"
+            elif operador == '||':
+                return f"_o({izquierda}, {derecha})"
+            return self._error(f"Operador desconocido: {operador}")
+        elif tipo == 'unaria':
+            if expresion.get('operador') == '!':
+                return f"(1 if not {self._expresion(expresion.get('expresion'))} else 0)"
+            return self._error(f"Operador unario desconocido: {expresion.get('operador')}")
+        elif tipo == 'acceso_arreglo':
+            nombre = expresion.get('nombre')
+            return f"_elemento({_arreglo(nombre)}, {nombre!r}, {self._expresion(expresion.get('indice'))})"
+        elif tipo == 'llamada_funcion':
+            return self._llamada(expresion)
+        else:
+            # Expresiones con error toman el valor por defecto
+            return "0"
+
+    def _llamada(self, nodo):
+        nombre = nodo.get('nombre')
+        if nombre not in self.funciones:
+            raise ValueError(f"Función no definida: {nombre}")
+        parametros = self.funciones[nombre]
+        argumentos = [self._expresion(argumento) for argumento in nodo.get('argumentos', [])]
+
+        # Igual que CALL: los argumentos de más se evalúan y descartan y los
+        # que faltan toman el valor por defecto de su tipo
+        valores = argumentos[:len(parametros)]
+        valores += [repr(valor_por_defecto(param['tipo'])) for param in parametros[len(argumentos):]]
+        if len(argumentos) > len(parametros):
+            valores.append(f"*_descartar({', '.join(argumentos[len(parametros):])})")
+        return f"{_funcion(nombre)}({', '.join(valores)})"
+
+    def _error(self, mensaje):
+        return f"_error({f'ERROR: {mensaje}'!r})"
+
+
+class EjecutorPython:
+    """Ejecuta un programa transpilado con las mismas entradas, el mismo
+    formato de lectura y el mismo destino de salida que MaquinaVirtual"""
+
+    def __init__(self, salida=None):
+        self.codigo = None
+        self.salida = salida if salida is not None else SalidaCircular()
+        self.manejador_entrada = ManejadorEntrada()
+        self.ultimo_mensaje_impreso = ""
+
+    def cargar_codigo(self, codigo):
+        """Acepta el objeto de código de TranspiladorPython.compilar o su fuente"""
+        if isinstance(codigo, str):
+            codigo = compile(codigo, "<avellana>", "exec")
+        self.codigo = codigo
+
+    def configurar_salida(self, salida):
+        self.salida = salida
+
+    def obtener_salida(self):
+        return self.salida.lineas()
+
+    def configurar_entrada_interactiva(self, callback):
+        self.manejador_entrada.configurar_entrada_interactiva(callback)
+
+    def configurar_entradas(self, entradas):
+        if isinstance(entradas, (list, tuple)):
+            self.manejador_entrada.agregar_entradas(entradas)
+        else:
+            self.manejador_entrada.agregar_fuente(entradas)
+
+    def ejecutar(self):
+        self.salida.limpiar()
+        entorno = dict(ENTORNO)
+        entorno['_imprimir'] = self._imprimir
+        entorno['_leer'] = self._leer
+        entorno['_error'] = self._error
+
+        # Cada llamada del programa es un marco de Python
+        limite_anterior = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limite_anterior, LIMITE_LLAMADAS + 100))
+        try:
+            exec(self.codigo, entorno)
+        except _Detener:
+            pass
+        except ErrorEjecucion as e:
+            self.salida.escribir(mensaje_error_ejecucion(str(e), self._linea_error(entorno, e)))
+        except ZeroDivisionError as e:
+            self.salida.escribir(mensaje_error_ejecucion("División por cero", self._linea_error(entorno, e)))
+        except RecursionError as e:
+            # Como CALL en la máquina virtual, se reporta la llamada que desbordó
+            self.salida.escribir(mensaje_error_ejecucion(
+                "Desbordamiento de la pila de llamadas", self._linea_error(entorno, e, llamada=True)
+            ))
+        except Exception as e:
+            self.salida.escribir(mensaje_error_ejecucion(str(e), self._linea_error(entorno, e)))
+            import traceback
+            self.salida.escribir(traceback.format_exc())
+        finally:
+            sys.setrecursionlimit(limite_anterior)
+            self.salida.vaciar()
+
+    def _linea_error(self, entorno, error, llamada=False):
+        """Línea del programa fuente del marco más interno del programa
+        transpilado donde se produjo el error. Con llamada=True, la del marco
+        que llamó al más interno, es decir, la de la última llamada"""
+        lineas = entorno.get('_LINEAS', ())
+        linea = anterior = None
+        traza = error.__traceback__
+        while traza is not None:
+            numero = traza.tb_lineno
+            if traza.tb_frame.f_code.co_filename == "<avellana>" and 0 < numero <= len(lineas):
+                anterior = linea
+                linea = lineas[numero - 1] or linea
+            traza = traza.tb_next
+        if llamada and anterior is not None:
+            return anterior
+        return linea
+
+    def _imprimir(self, valor):
+        texto = str(valor)
+        self.salida.escribir(texto)
+        self.ultimo_mensaje_impreso = texto
+
+    def _leer(self, variable):
+        # Mismo mensaje, conversión y eco que READ en la máquina virtual
+        mensaje = self.ultimo_mensaje_impreso if self.ultimo_mensaje_impreso else f"Ingrese {variable}:"
+        self.salida.vaciar()
+        entrada = self.manejador_entrada.obtener_entrada(mensaje)
+        self.ultimo_mensaje_impreso = ""
+        valor, texto = convertir_entrada(entrada)
+        self.salida.escribir(f"[ENTRADA] {variable} = {texto}")
+        return valor
+
+    def _error(self, mensaje):
+        self.salida.escribir(mensaje)
+        raise _Detener()
@@ -0,0 +1,332 @@
+"""
+Compilación de trazas: los ciclos que se repiten muchas veces se graban una
+vez y se compilan a una función de Python especializada
+"""
+
+from bytecod import Instrucciones
+
+
+I = Instrucciones
+
+# Saltos hacia atrás que deben ejecutarse antes de grabar la traza del ciclo
+UMBRAL_TRAZA = 50
+
+# Instrucciones máximas de una traza; los ciclos más largos se interpretan
+LONGITUD_MAXIMA_TRAZA = 500
+
+# Marca de un ciclo que no se puede compilar
+SIN_TRAZA = object()
+
+COMPARACIONES = {
+    I.EQ: '==',
+    I.NEQ: '!=',
+    I.GT: '>',
+    I.LT: '<',
+    I.GTE: '>=',
+    I.LTE: '<=',
+}
+
+COMPARACIONES_CON_SALTO = {
+    I.EQ_JMPZ: '==',
+    I.NEQ_JMPZ: '!=',
+    I.GT_JMPZ: '>',
+    I.LT_JMPZ: '<',
+    I.GTE_JMPZ: '>=',
+    I.LTE_JMPZ: '<=',
+}
+
+ARITMETICOS = {
+    I.SUB: '-',
+    I.MUL: '*',
+}
+
+# Instrucciones que la traza ejecuta llamando al manejador de la máquina
+# virtual, con la pila real al día
+CON_MANEJADOR = frozenset((
+    I.PRINT, I.READ, I.READ_LOCAL, I.STORE_ARR, I.NEW_ARR, I.ARR_SIZE,
+))
+
+# Las llamadas y retornos cambian de marco y terminan la grabación
+GRABABLES = frozenset((
+    I.PUSH, I.POP, I.LOAD, I.STORE, I.LOAD_LOCAL, I.STORE_LOCAL,
+    I.ADD, I.SUB, I.MUL, I.DIV, I.AND, I.OR, I.NOT, I.DUP, I.SWAP, I.INC,
+    I.JMP, I.JMPZ, I.JMPNZ, I.LOAD_ARR,
+)) | frozenset(COMPARACIONES) | frozenset(COMPARACIONES_CON_SALTO) | CON_MANEJADOR
+
+
+class CompiladorTrazas:
+    """Cuenta los saltos hacia atrás de cada ciclo y, cuando uno supera
+    UMBRAL_TRAZA, graba el camino de una iteración y lo compila. Las trazas
+    se conservan mientras no se cargue otro programa"""
+
+    def __init__(self, maquina):
+        self.maquina = maquina
+        self.contadores = {}
+        self.trazas = {}
+        self.compiladas = 0
+        self.abortadas = 0
+
+    def reiniciar(self):
+        self.contadores = {}
+        self.trazas = {}
+        self.compiladas = 0
+        self.abortadas = 0
+
+    def saltar_atras(self, cabecera, salto):
+        """Manejador del JMP hacia atrás en la posición salto. Retorna la
+        posición donde continúa el intérprete"""
+        traza = self.trazas.get(salto)
+        if traza is not None:
+            if traza is SIN_TRAZA:
+                return cabecera
+            maquina = self.maquina
+            return traza(maquina.pila, maquina.memoria, maquina.locales, maquina.arreglos)
+
+        contador = self.contadores.get(salto, 0) + 1
+        self.contadores[salto] = contador
+        if contador < UMBRAL_TRAZA:
+            return cabecera
+
+        grabada, puntero = self._grabar(cabecera, salto)
+        if grabada is None:
+            return puntero
+
+        traza = self._compilar(grabada)
+        self.trazas[salto] = traza
+        self.compiladas += 1
+        maquina = self.maquina
+        return traza(maquina.pila, maquina.memoria, maquina.locales, maquina.arreglos)
+
+    def _grabar(self, cabecera, salto):
+        """Ejecuta una iteración con los manejadores normales anotando cada
+        instrucción, el destino de los saltos y si ADD recibió una cadena.
+        Retorna la traza, o None y la posición donde quedó la ejecución"""
+        maquina = self.maquina
+        operaciones = maquina.programa.operaciones
+        despacho = maquina.despacho
+        operandos = maquina.operandos
+        pila = maquina.pila
+
+        grabada = []
+        puntero = cabecera
+        while len(grabada) < LONGITUD_MAXIMA_TRAZA:
+            codigo_inst = operaciones[puntero]
+            if codigo_inst not in GRABABLES:
+                break
+
+            dato = None
+            if codigo_inst == I.ADD:
+                dato = isinstance(pila[-1], str) or isinstance(pila[-2], str)
+            try:
+                siguiente = despacho[puntero](operandos[puntero], puntero)
+            except Exception as error:
+                # Se graba desde el JMP del ciclo: el error debe reportar
+                # la posición de la instrucción que falló
+                error.puntero = puntero
+                raise
+            if codigo_inst in Instrucciones.SALTOS:
+                dato = siguiente
+            grabada.append((puntero, codigo_inst, operandos[puntero], dato))
+
+            if puntero == salto:
+                return grabada, siguiente
+            if siguiente < cabecera or siguiente > salto:
+                # El ciclo terminó durante la grabación: se intentará de nuevo
+                self.contadores[salto] = 0
+                return None, siguiente
+            if siguiente <= puntero:
+                # Ciclo anidado: tendrá su propia traza
+                puntero = siguiente
+                break
+            puntero = siguiente
+
+        self.trazas[salto] = SIN_TRAZA
+        self.abortadas += 1
+        return None, puntero
+
+    def _compilar(self, grabada):
+        generador = _GeneradorTraza(self.maquina)
+        return generador.generar(grabada)
+
+
+class _GeneradorTraza:
+    """Traduce una traza a Python. Los valores de la pila viven en variables
+    locales; solo se escriben en la pila real al salir de la traza o antes
+    de llamar a un manejador"""
+
+    def __init__(self, maquina):
+        self.maquina = maquina
+        self.lineas = []
+        self.temporales = []
+        self.contador = 0
+        self.entorno = {}
+
+    def generar(self, grabada):
+        for puntero, codigo_inst, operando, dato in grabada:
+            self._instruccion(puntero, codigo_inst, operando, dato)
+        # Al volver a la cabecera la pila real debe tener la misma forma
+        self._volcar()
+
+        fuente = "def traza(pila, m, l, arreglos):\n    while True:\n"
+        fuente += "".join(f"        {linea}\n" for linea in self.lineas)
+        exec(compile(fuente, "<traza>", "exec"), self.entorno)
+        return self.entorno['traza']
+
+    def _nuevo(self):
+        nombre = f"t{self.contador}"
+        self.contador += 1
+        return nombre
+
+    def _constante(self, indice):
+        nombre = f"k{indice}"
+        self.entorno[nombre] = self.maquina.constantes[indice]
+        return nombre
+
+    def _apilar(self, expresion):
+        self.temporales.append(expresion)
+
+    def _desapilar(self):
+        if self.temporales:
+            return self.temporales.pop()
+        # Valor apilado antes de la traza o por un manejador
+        nombre = self._nuevo()
+        self.lineas.append(f"{nombre} = pila.pop()")
+        return nombre
+
+    def _volcar(self):
+        if self.temporales:
+            self.lineas.append(f"pila.extend(({', '.join(self.temporales)},))")
+            self.temporales = []
+
+    def _salida(self, condicion, destino, extra=()):
+        """Guarda: si se cumple la condición se escribe la pila y el
+        intérprete continúa en destino"""
+        valores = self.temporales + list(extra)
+        self.lineas.append(f"if {condicion}:")
+        if valores:
+            self.lineas.append(f"    pila.extend(({', '.join(valores)},))")
+        self.lineas.append(f"    return {destino}")
+
+    def _protegida(self, linea, puntero):
+        """Agrega una línea que puede fallar; el error reporta la posición
+        de su instrucción y no la del ciclo"""
+        self.lineas.append("try:")
+        self.lineas.append(f"    {linea}")
+        self.lineas.append("except Exception as error:")
+        self.lineas.append(f"    error.puntero = {puntero}")
+        self.lineas.append("    raise")
+
+    def _instruccion(self, puntero, codigo_inst, operando, dato):
+        lineas = self.lineas
+
+        if codigo_inst == I.PUSH:
+            self._apilar(self._constante(operando))
+        elif codigo_inst == I.POP:
+            self._desapilar()
+        elif codigo_inst in (I.LOAD, I.LOAD_LOCAL):
+            memoria = "m" if codigo_inst == I.LOAD else "l"
+            nombre = self._nuevo()
+            lineas.append(f"{nombre} = {memoria}[{operando}]")
+            self._apilar(nombre)
+        elif codigo_inst in (I.STORE, I.STORE_LOCAL):
+            memoria = "m" if codigo_inst == I.STORE else "l"
+            lineas.append(f"{memoria}[{operando}] = {self._desapilar()}")
+        elif codigo_inst == I.ADD:
+            b = self._desapilar()
+            a = self._desapilar()
+            nombre = self._nuevo()
+            # Guarda de tipo: la traza se especializa para el caso grabado
+            if dato:
+                self._salida(f"type({a}) is not str and type({b}) is not str", puntero, (a, b))
+                lineas.append(f"{nombre} = str({a}) + str({b})")
+            else:
+                self._salida(f"type({a}) is str or type({b}) is str", puntero, (a, b))
+                lineas.append(f"{nombre} = {a} + {b}")
+            self._apilar(nombre)
+        elif codigo_inst in ARITMETICOS:
+            b = self._desapilar()
+            a = self._desapilar()
+            nombre = self._nuevo()
+            self._protegida(f"{nombre} = {a} {ARITMETICOS[codigo_inst]} {b}", puntero)
+            self._apilar(nombre)
+        elif codigo_inst == I.DIV:
+            b = self._desapilar()
+            a = self._desapilar()
+            nombre = self._nuevo()
+            # El intérprete reporta la división por cero
+            self._salida(f"{b} == 0", puntero, (a, b))
+            lineas.append(f"{nombre} = {a} / {b}")
+            self._apilar(nombre)
+        elif codigo_inst in COMPARACIONES:
+            b = self._desapilar()
+            a = self._desapilar()
+            nombre = self._nuevo()
+            self._protegida(f"{nombre} = 1 if {a} {COMPARACIONES[codigo_inst]} {b} else 0", puntero)
+            self._apilar(nombre)
+        elif codigo_inst in (I.AND, I.OR):
+            b = self._desapilar()
+            a = self._desapilar()
+            nombre = self._nuevo()
+            operador = "and" if codigo_inst == I.AND else "or"
+            lineas.append(f"{nombre} = 1 if ({a} {operador} {b}) else 0")
+            self._apilar(nombre)
+        elif codigo_inst == I.NOT:
+            a = self._desapilar()
+            nombre = self._nuevo()
+            lineas.append(f"{nombre} = 1 if not {a} else 0")
+            self._apilar(nombre)
+        elif codigo_inst == I.DUP:
+            a = self._desapilar()
+            self._apilar(a)
+            self._apilar(a)
+        elif codigo_inst == I.SWAP:
+            b = self._desapilar()
+            a = self._desapilar()
+            self._apilar(b)
+            self._apilar(a)
+        elif codigo_inst == I.INC:
+            ranura = operando & I.MASCARA_RANURA
+            incremento = self._constante(operando >> I.BITS_RANURA)
+            nombre = self._nuevo()
+            lineas.append(f"{nombre} = m[{ranura}]")
+            self._salida(f"type({nombre}) is str", puntero)
+            lineas.append(f"m[{ranura}] = {nombre} + {incremento}")
+        elif codigo_inst == I.JMP:
+            pass
+        elif codigo_inst in (I.JMPZ, I.JMPNZ):
+            valor = self._desapilar()
+            # Se sigue el camino grabado y se sale si el valor lleva al otro
+            salta_si_cero = codigo_inst == I.JMPZ
+            if dato == puntero + 1:
+                condicion = f"{valor} == 0" if salta_si_cero else f"{valor} != 0"
+                self._salida(condicion, operando)
+            else:
+                condicion = f"{valor} != 0" if salta_si_cero else f"{valor} == 0"
+                self._salida(condicion, puntero + 1)
+        elif codigo_inst in COMPARACIONES_CON_SALTO:
+            b = self._desapilar()
+            a = self._desapilar()
+            comparacion = self._nuevo()
+            self._protegida(f"{comparacion} = {a} {COMPARACIONES_CON_SALTO[codigo_inst]} {b}", puntero)
+            if dato == puntero + 1:
+                self._salida(f"not {comparacion}", operando)
+            else:
+                self._salida(comparacion, puntero + 1)
+        elif codigo_inst == I.LOAD_ARR:
+            indice = self._desapilar()
+            arreglo = self._nuevo()
+            nombre = self._nuevo()
+            lineas.append(f"{arreglo} = arreglos.get({self._constante(operando)})")
+            # Arreglo inexistente o índice inválido: el intérprete reporta el error
+            self._salida(
+                f"{arreglo} is None or type({indice}) is not int "
+                f"or not 0 <= {indice} < len({arreglo})",
+                puntero, (indice,)
+            )
+            lineas.append(f"{nombre} = {arreglo}[{indice}]")
+            self._apilar(nombre)
+        elif codigo_inst in CON_MANEJADOR:
+            self._volcar()
+            manejador = f"h{codigo_inst}"
+            self.entorno[manejador] = self.maquina.manejadores[codigo_inst]
+            self._protegida(f"{manejador}({operando}, {puntero})", puntero)
@@ -0,0 +1,171 @@
+"""
+Verificador de byte-code: comprueba la profundidad de la pila antes de ejecutar
+"""
+
+from bytecod import Instrucciones
+
+
+class ErrorVerificacion(Exception):
+    pass
+
+
+I = Instrucciones
+
+# Código de operación -> (valores que consume, valores que produce). CALL
+# depende de la función llamada y se trata aparte
+EFECTOS_PILA = {
+    I.PUSH: (0, 1),
+    I.POP: (1, 0),
+    I.ADD: (2, 1),
+    I.SUB: (2, 1),
+    I.MUL: (2, 1),
+    I.DIV: (2, 1),
+    I.STORE: (1, 0),
+    I.LOAD: (0, 1),
+    I.PRINT: (1, 0),
+    I.READ: (0, 0),
+    I.JMP: (0, 0),
+    I.JMPZ: (1, 0),
+    I.JMPNZ: (1, 0),
+    I.RET: (0, 0),
+    I.HALT: (0, 0),
+    I.EQ: (2, 1),
+    I.NEQ: (2, 1),
+    I.GT: (2, 1),
+    I.LT: (2, 1),
+    I.GTE: (2, 1),
+    I.LTE: (2, 1),
+    I.RETVAL: (1, 0),
+    I.STORE_ARR: (2, 0),
+    I.LOAD_ARR: (1, 1),
+    I.ARR_SIZE: (0, 1),
+    I.DUP: (1, 2),
+    I.SWAP: (2, 2),
+    I.AND: (2, 1),
+    I.OR: (2, 1),
+    I.NOT: (1, 1),
+    I.INC: (0, 0),
+    I.EQ_JMPZ: (2, 0),
+    I.NEQ_JMPZ: (2, 0),
+    I.GT_JMPZ: (2, 0),
+    I.LT_JMPZ: (2, 0),
+    I.GTE_JMPZ: (2, 0),
+    I.LTE_JMPZ: (2, 0),
+    I.NEW_ARR: (2, 0),
+    I.LOAD_LOCAL: (0, 1),
+    I.STORE_LOCAL: (1, 0),
+    I.READ_LOCAL: (0, 0),
+}
+
+# Instrucciones después de las cuales no se continúa en la siguiente
+SIN_CONTINUACION = frozenset((I.JMP, I.RET, I.RETVAL, I.HALT))
+
+# El programa principal no tiene variables locales
+PRINCIPAL = None
+
+
+class VerificadorBytecode:
+    """Interpretación abstracta del byte-code: recorre todos los caminos
+    desde el inicio del programa y desde la entrada de cada función llevando
+    la profundidad de la pila. Un programa verificado nunca saca de la pila
+    un valor que no existe y cada posición se alcanza siempre con la misma
+    profundidad, relativa a la base del marco de su función"""
+
+    def __init__(self):
+        self.profundidades = []
+        self.profundidad_maxima = 0
+
+    def verificar(self, programa):
+        """Retorna la profundidad máxima de la pila o lanza ErrorVerificacion"""
+        operaciones = programa.operaciones
+        operandos = programa.operandos
+        total = len(operaciones)
+
+        # Dirección de entrada -> (parámetros, cantidad de locales)
+        funciones = {}
+        for funcion in programa.funciones:
+            direccion = programa.etiquetas.get(funcion['etiqueta'])
+            if direccion is None or not 0 <= direccion < total:
+                raise ErrorVerificacion(f"La función '{funcion['nombre']}' no tiene código")
+            funciones[direccion] = (funcion['parametros'], len(funcion['locales']))
+
+        self.profundidades = [None] * total
+        # Función a la que pertenece cada posición, para validar las locales
+        raices = [None] * total
+        self.profundidad_maxima = 0
+
+        pendientes = [(0, 0, PRINCIPAL)]
+        pendientes.extend((direccion, 0, direccion) for direccion in funciones)
+
+        while pendientes:
+            posicion, profundidad, raiz = pendientes.pop()
+            if posicion == total:
+                # Salir del final equivale a HALT
+                continue
+
+            if self.profundidades[posicion] is not None:
+                if self.profundidades[posicion] != profundidad:
+                    self._error(programa, posicion,
+                                f"la pila llega con profundidad {profundidad} y "
+                                f"{self.profundidades[posicion]} por caminos distintos")
+                if raices[posicion] != raiz:
+                    self._error(programa, posicion, "código compartido entre funciones")
+                continue
+            self.profundidades[posicion] = profundidad
+            raices[posicion] = raiz
+
+            codigo_inst = operaciones[posicion]
+            operando = operandos[posicion]
+            self._validar_operando(programa, posicion, codigo_inst, operando, raiz, funciones)
+
+            if codigo_inst == I.CALL:
+                consume, produce = funciones[operando][0], 1
+            else:
+                consume, produce = EFECTOS_PILA[codigo_inst]
+
+            if profundidad < consume:
+                self._error(programa, posicion,
+                            f"necesita {consume} valores en la pila y hay {profundidad}")
+            siguiente_profundidad = profundidad - consume + produce
+            self.profundidad_maxima = max(self.profundidad_maxima, profundidad, siguiente_profundidad)
+
+            if codigo_inst in Instrucciones.SALTOS and codigo_inst != I.CALL:
+                pendientes.append((operando, siguiente_profundidad, raiz))
+            if codigo_inst not in SIN_CONTINUACION:
+                pendientes.append((posicion + 1, siguiente_profundidad, raiz))
+
+        return self.profundidad_maxima
+
+    def _validar_operando(self, programa, posicion, codigo_inst, operando, raiz, funciones):
+        if codigo_inst not in EFECTOS_PILA and codigo_inst != I.CALL:
+            self._error(programa, posicion, "código de operación desconocido")
+
+        if codigo_inst in (I.RET, I.RETVAL) and raiz is PRINCIPAL:
+            self._error(programa, posicion, "retornar fuera de una función")
+
+        if codigo_inst == I.CALL:
+            if operando not in funciones:
+                self._error(programa, posicion, f"{operando} no es la entrada de una función")
+        elif codigo_inst in Instrucciones.SALTOS:
+            if not 0 <= operando <= len(programa.operaciones):
+                self._error(programa, posicion, f"destino de salto {operando} fuera del programa")
+        elif codigo_inst in Instrucciones.CON_CONSTANTE:
+            if not 0 <= operando < len(programa.constantes):
+                self._error(programa, posicion, f"constante {operando} inexistente")
+        elif codigo_inst in Instrucciones.CON_VARIABLE:
+            if not 0 <= operando < len(programa.variables):
+                self._error(programa, posicion, f"variable {operando} inexistente")
+        elif codigo_inst in Instrucciones.CON_LOCAL:
+            if raiz is PRINCIPAL:
+                self._error(programa, posicion, "variable local fuera de una función")
+            if not 0 <= operando < funciones[raiz][1]:
+                self._error(programa, posicion, f"variable local {operando} inexistente")
+        elif codigo_inst in Instrucciones.CON_RANURA_Y_CONSTANTE:
+            ranura = operando & Instrucciones.MASCARA_RANURA
+            constante = operando >> Instrucciones.BITS_RANURA
+            if not 0 <= ranura < len(programa.variables) or not 0 <= constante < len(programa.constantes):
+                self._error(programa, posicion, "operando empaquetado inválido")
+
+    def _error(self, programa, posicion, mensaje):
+        nombre = Instrucciones.obtener_nombre(programa.operaciones[posicion])
+        raise ErrorVerificacion(f"Byte-code inválido en la posición {posicion} ({nombre}): {mensaje}")